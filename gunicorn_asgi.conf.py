@@ -0,0 +1,11 @@
+# Configuración de Gunicorn en modo ASGI: gunicorn -c gunicorn_asgi.conf.py
+# Cada worker uvicorn atiende muchas requests a la vez mientras las vistas async
+# (pagos, webhook, login con Google, correos) esperan a servicios externos.
+wsgi_app = "tienda_ropa.asgi:application"
+bind = "unix:/var/www/Proyecto-Tienda_Sol/backend/tienda_ropa.sock"
+workers = 5
+worker_class = "uvicorn_worker.UvicornWorker"
+loglevel = "debug"
+errorlog = "/var/www/Proyecto-Tienda_Sol/backend/logs/gunicorn_error.log"
+accesslog = "/var/www/Proyecto-Tienda_Sol/backend/logs/gunicorn_access.log"
+timeout = 30
@@ -11,6 +11,7 @@ from django import forms
 
 from rest_framework import serializers
 from productos.models.producto import Producto, Atributo, ProductoAtributo
+from productos.services.producto_service import ProductoService
 
 # Inline para ProductoAtributo dentro de Producto
 class ProductoAtributoInline(admin.TabularInline):
@@ -23,7 +24,7 @@ class ProductoAtributoInline(admin.TabularInline):
 @admin.register(Producto)
 class ProductoAdmin(admin.ModelAdmin):
     inlines = [ProductoAtributoInline]
-    list_display = ['nombre', 'modelo_talle', 'marca', 'tipo', 'precio', 'stock_total', 'cantidad_vendida_total']
+    list_display = ['nombre', 'modelo_talle', 'marca', 'tipo', 'precio', 'stock_total', 'vendidos_total']
     search_fields = ['nombre', 'modelo_talle', 'marca__nombre']
     list_filter = ['tipo', 'marca', 'tendencia', 'categoria']
     fieldsets = (
@@ -65,7 +66,8 @@ class ReviewProductAdmin(admin.ModelAdmin):
     actions = ['approve_reviews', 'reject_reviews']
 
     def approve_reviews(self, request, queryset):
-        queryset.update(approved=True)
+        # queryset.update() no dispara señales: el servicio actualiza también los ratings del producto
+        ProductoService.aprobar_reviews(queryset)
         self.message_user(request, "Las reseñas seleccionadas han sido aprobadas.")
     approve_reviews.short_description = "Aprobar reseñas seleccionadas"
 
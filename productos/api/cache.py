@@ -0,0 +1,24 @@
+from rest_framework.response import Response
+from productos.services.cache_service import CacheService
+
+
+class CacheLecturaMixin:
+    """
+    Cachea list/retrieve de un ViewSet público bajo `cache_grupo`.
+    La invalidación la hacen las señales del modelo (productos/signals.py).
+    """
+    cache_grupo = None
+
+    def list(self, request, *args, **kwargs):
+        listar = super().list
+        data = CacheService.obtener(
+            self.cache_grupo, request.get_full_path(), lambda: listar(request, *args, **kwargs).data
+        )
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        obtener = super().retrieve
+        data = CacheService.obtener(
+            self.cache_grupo, request.get_full_path(), lambda: obtener(request, *args, **kwargs).data
+        )
+        return Response(data)
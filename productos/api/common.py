@@ -3,7 +3,7 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
-from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.decorators import api_view, permission_classes, throttle_classes, action
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
@@ -12,9 +12,8 @@ from django.core.mail import EmailMessage
 from django.db import transaction
 from django.shortcuts import get_object_or_404
 import json
-import mercadopago
-import paypalrestsdk
 import logging
+import math
 from reportlab.pdfgen import canvas
 from reportlab.lib import colors
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
@@ -25,16 +24,29 @@ from io import BytesIO
 import os
 from django.db.models import Count, Sum
 from django.utils import timezone
+from asgiref.sync import sync_to_async
+from productos.services.limite_service import LimiteService, ip_cliente
 from productos.permissions import SoloLecturaUsuario
 
 logger = logging.getLogger(__name__)
 
-# Configuración de PayPal
-paypalrestsdk.configure({
-    "mode": "live",
-    "client_id": os.getenv('PAYPAL_CLIENT_ID'),
-    "client_secret": os.getenv('PAYPAL_CLIENT_SECRET')
-})
 
-# Configuración de Mercado Pago
-sdk = mercadopago.SDK(os.getenv('KEY_MP'))
\ No newline at end of file
+def datos_request(request):
+    """Equivalente de request.data para las vistas async de Django (JSON o formulario)."""
+    if request.content_type == 'application/json':
+        try:
+            datos = json.loads(request.body or b'{}')
+        except json.JSONDecodeError:
+            return {}
+        return datos if isinstance(datos, dict) else {}
+    return request.POST
+
+
+async def verificar_limite(request, grupo):
+    """Limitador de tasa para las vistas async de Django: None si se permite, si no la respuesta 429."""
+    espera = await sync_to_async(LimiteService.consumir)(grupo, ip_cliente(request))
+    if not espera:
+        return None
+    respuesta = JsonResponse({"error": "Demasiadas solicitudes, intenta más tarde."}, status=429)
+    respuesta['Retry-After'] = str(math.ceil(espera))
+    return respuesta
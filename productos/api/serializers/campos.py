@@ -0,0 +1,45 @@
+from rest_framework import serializers
+
+
+def campos_solicitados(request):
+    """
+    Lee ?fields= y ?expand= de la request. Devuelve (fields, expand), donde
+    fields es None cuando el cliente no pidió un subconjunto.
+    """
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return None, set()
+
+    def _leer(nombre):
+        valor = request.query_params.get(nombre, '')
+        return {campo.strip() for campo in valor.split(',') if campo.strip()}
+
+    fields = _leer('fields')
+    return (fields or None), _leer('expand')
+
+
+class CamposDinamicosMixin:
+    """
+    Sparse fieldsets: con ?fields=a,b solo se devuelven esos campos. Los campos de
+    Meta.campos_expandibles se omiten salvo que se pidan en ?fields= o en ?expand=.
+    Sin ?fields= la respuesta no cambia.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self._es_raiz():
+            return fields
+
+        pedidos, expand = campos_solicitados(self.context.get('request'))
+        if pedidos is None:
+            return fields
+
+        permitidos = pedidos | (expand & set(getattr(self.Meta, 'campos_expandibles', [])))
+        for nombre in list(fields):
+            if nombre not in permitidos:
+                fields.pop(nombre)
+        return fields
+
+    def _es_raiz(self):
+        if self.parent is None:
+            return True
+        return isinstance(self.parent, serializers.ListSerializer) and self.parent.parent is None
@@ -2,10 +2,19 @@
 from rest_framework import serializers
 from productos.models.producto import Producto, Atributo,Marca,ProductoAtributo, ReviewProduct
 from productos.models.categoria import Categoria, Descuento
+from productos.services.busqueda_service import BusquedaService
 from productos.services.producto_service import ProductoService
 from django.conf import settings
 from urllib.parse import urljoin
-from django.db.models import Avg
+from .campos import CamposDinamicosMixin
+
+
+def mapa_descuentos(serializer):
+    # Se resuelve una sola vez por serialización y se comparte vía el contexto raíz
+    contexto = serializer.context
+    if 'descuentos' not in contexto:
+        contexto['descuentos'] = ProductoService.mapa_descuentos()
+    return contexto['descuentos']
 
 class CategoriaSerializer(serializers.ModelSerializer):
     class Meta:
@@ -42,10 +51,10 @@ class ProductoSimpleSerializer(serializers.ModelSerializer):
         fields = ['id', 'nombre','categoria', 'imagen', 'imagen_secundaria', 'imagen_terciaria', 'precio_final', 'descuento']
 
     def get_precio_final(self, obj):
-        return ProductoService.calcular_precio_final(obj)
+        return ProductoService.calcular_precio_final(obj, mapa_descuentos(self))
 
     def get_descuento(self, obj):
-        return ProductoService.obtener_descuento(obj)
+        return ProductoService.obtener_descuento(obj, mapa_descuentos(self))
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
@@ -71,10 +80,10 @@ class ReviewProductSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['product'] = ProductoSimpleSerializer(instance.product).data
+        representation['product'] = ProductoSimpleSerializer(instance.product, context=self.context).data
         return representation
 
-class ProductoSerializer(serializers.ModelSerializer):
+class ProductoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     precio_final = serializers.SerializerMethodField()
     descuento = serializers.SerializerMethodField()
     producto_atributos = serializers.SerializerMethodField()
@@ -95,19 +104,17 @@ class ProductoSerializer(serializers.ModelSerializer):
             'puntos_club_acumulables', 'qr_code', 'producto_atributos',
             'stock_total', 'cantidad_vendida_total','reviews', 'overall_rating'
         ]
+        campos_expandibles = ['producto_atributos', 'reviews', 'qr_code']
 
     def get_producto_atributos(self, obj):
-        return ProductoAtributoSerializer(obj.producto_atributos.all(), many=True).data
+        return ProductoAtributoSerializer(obj.producto_atributos.all(), many=True, context=self.context).data
         
     def get_overall_rating(self, obj):
-        reviews = obj.reviews.filter(approved=True)
-        if not reviews.exists():
+        if not obj.rating_count:
             return {"average_rating": 0, "total_reviews": 0}
-        average_rating = reviews.aggregate(Avg('rating'))['rating__avg']
-        total_reviews = reviews.count()
         return {
-            "average_rating": round(average_rating, 1),
-            "total_reviews": total_reviews
+            "average_rating": round(obj.rating_avg, 1),
+            "total_reviews": obj.rating_count
         }
 
 
@@ -117,27 +124,37 @@ class ProductoSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
     def get_precio_final(self, obj):
-        return ProductoService.calcular_precio_final(obj)
+        return ProductoService.calcular_precio_final(obj, mapa_descuentos(self))
 
     def get_descuento(self, obj):
-        return ProductoService.obtener_descuento(obj)
+        return ProductoService.obtener_descuento(obj, mapa_descuentos(self))
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        if instance.imagen:
-            representation['imagen'] = urljoin(settings.MEDIA_URL, str(instance.imagen))
-        if instance.imagen_secundaria:
-            representation['imagen_secundaria'] = urljoin(settings.MEDIA_URL, str(instance.imagen_secundaria))
-        if instance.imagen_terciaria:
-            representation['imagen_terciaria'] = urljoin(settings.MEDIA_URL, str(instance.imagen_terciaria))
-        if instance.qr_code:
-            representation['qr_code'] = urljoin(settings.MEDIA_URL, str(instance.qr_code))
-        else:
-            representation['qr_code'] = None
+        for campo in ['imagen', 'imagen_secundaria', 'imagen_terciaria']:
+            if campo in representation and getattr(instance, campo):
+                representation[campo] = urljoin(settings.MEDIA_URL, str(getattr(instance, campo)))
+        if 'qr_code' in representation:
+            representation['qr_code'] = urljoin(settings.MEDIA_URL, str(instance.qr_code)) if instance.qr_code else None
         return representation
 
   
 
+class ProductoBusquedaSerializer(ProductoSerializer):
+    relevancia = serializers.FloatField(read_only=True)
+    resaltado = serializers.SerializerMethodField()
+
+    class Meta(ProductoSerializer.Meta):
+        fields = ProductoSerializer.Meta.fields + ['relevancia', 'resaltado']
+
+    def get_resaltado(self, obj):
+        # Fragmentos HTML escapados con las coincidencias marcadas con <mark>; None fuera de Postgres
+        return {
+            'nombre': BusquedaService.resaltado_html(getattr(obj, 'nombre_resaltado', None)),
+            'descripcion': BusquedaService.resaltado_html(getattr(obj, 'descripcion_resaltada', None)),
+        }
+
+
 class ProductoAtributoSerializer(serializers.ModelSerializer):
     atributo = AtributoSerializer()
     producto = ProductoSimpleSerializer(read_only=True)
@@ -151,3 +168,37 @@ class ProductoAtributoSerializer(serializers.ModelSerializer):
             representation['imagen'] = urljoin(settings.MEDIA_URL, str(instance.imagen))
         return representation
 
+
+
+class CambioAtributoSerializer(serializers.Serializer):
+    atributo_id = serializers.IntegerField(min_value=1)
+    # `stock` fija el valor, `delta` lo suma/resta al actual; sin ninguno se fija en 0
+    stock = serializers.IntegerField(min_value=0, required=False)
+    delta = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        if 'stock' in attrs and 'delta' in attrs:
+            raise serializers.ValidationError("Use 'stock' o 'delta', no ambos.")
+        return attrs
+
+
+class GestionAtributosSerializer(serializers.Serializer):
+    atributos = CambioAtributoSerializer(many=True, required=False, default=list)
+    eliminar = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, default=list)
+
+    def validate(self, attrs):
+        ids = [cambio['atributo_id'] for cambio in attrs['atributos']]
+        if not ids and not attrs['eliminar']:
+            raise serializers.ValidationError({"atributos": "Debe proporcionar al menos un atributo para gestionar."})
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError({"atributos": "Hay atributos repetidos."})
+        if set(ids) & set(attrs['eliminar']):
+            raise serializers.ValidationError({"eliminar": "Un atributo no puede modificarse y eliminarse a la vez."})
+        # Una sola consulta para validar todos los ids
+        attrs['atributos_por_id'] = Atributo.objects.in_bulk(ids)
+        faltantes = [i for i in ids if i not in attrs['atributos_por_id']]
+        if faltantes:
+            raise serializers.ValidationError(
+                {"atributos": f"Atributos no encontrados: {', '.join(map(str, faltantes))}."}
+            )
+        return attrs
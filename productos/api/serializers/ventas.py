@@ -1,10 +1,14 @@
+from django.db import transaction
 from rest_framework import serializers
 from productos.models.venta import Venta, DetalleVenta, Carrito, CarritoProducto, EstadosVenta
 from productos.models.usuario import PerfilUsuario,HistorialPuntos
 from productos.models.configuracion import Envio, Barrio,Cupon,PuntosClub
-from productos.services.venta_service import VentaService
+from productos.services.venta_service import ReferenciaPagoInvalida, VentaService
+from productos.services.stock_service import StockInsuficiente
+from productos.services.carrito_service import OPERACIONES as OPERACIONES_CARRITO, AGREGAR, QUITAR
 from .usuarios import UserRegisterSerializer, PerfilUsuarioSerializer
 from .productos import ProductoSimpleSerializer,ProductoAtributoSerializer
+from .campos import CamposDinamicosMixin
 from productos.models.producto import Producto,ProductoAtributo
 import logging
 logger = logging.getLogger(__name__)
@@ -36,6 +40,25 @@ class CarritoProductoSerializer(serializers.ModelSerializer):
             })
         return data
 
+class OperacionCarritoSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=OPERACIONES_CARRITO)
+    producto_atributo_id = serializers.IntegerField(min_value=1)
+    cantidad = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, data):
+        if data['op'] != QUITAR and 'cantidad' not in data:
+            raise serializers.ValidationError({'cantidad': "Es obligatoria para 'agregar' y 'fijar'."})
+        if data['op'] == AGREGAR and data['cantidad'] <= 0:
+            raise serializers.ValidationError({'cantidad': "La cantidad debe ser mayor a 0."})
+        return data
+
+
+class OperacionesCarritoSerializer(serializers.Serializer):
+    operaciones = OperacionCarritoSerializer(many=True, allow_empty=False, max_length=200)
+    # Versión leída por el cliente; si se omite no se controla
+    version = serializers.IntegerField(min_value=0, required=False)
+
+
 class CarritoSerializer(serializers.ModelSerializer):
     productos = CarritoProductoSerializer(many=True, read_only=True)
 
@@ -46,11 +69,8 @@ class CarritoSerializer(serializers.ModelSerializer):
 
 class DetalleVentaSerializer(serializers.ModelSerializer):
     producto_atributo = ProductoAtributoSerializer(read_only=True)
-    producto_atributo_id = serializers.PrimaryKeyRelatedField(
-        queryset=ProductoAtributo.objects.all(),
-        source='producto_atributo',
-        write_only=True
-    )
+    # Se resuelve en bloque en VentaSerializer.validate_detalles (una consulta para toda la venta)
+    producto_atributo_id = serializers.IntegerField(min_value=1, write_only=True)
 
     class Meta:
         model = DetalleVenta
@@ -67,7 +87,7 @@ class EstadosVentaSerializer(serializers.ModelSerializer):
         model = EstadosVenta
         fields = ['id', 'estado']
 
-class VentaSerializer(serializers.ModelSerializer):
+class VentaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     detalles = DetalleVentaSerializer(many=True)
     tipo_envio = serializers.PrimaryKeyRelatedField(queryset=Envio.objects.all(), allow_null=True, required=False)
     barrio = serializers.PrimaryKeyRelatedField(queryset=Barrio.objects.all(), allow_null=True, required=False)
@@ -84,8 +104,9 @@ class VentaSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'comprador', 'comprador_sin_cuenta', 'vendedor', 'fecha_venta', 'precio_total', 'barrio',
             'tipo_envio', 'domicilio', 'fecha_entrega', 'horario_entrega', 'detalles', 'puntos_club_acumulados',
-            'usuario_nuevo', 'perfil_usuario', 'estado', 'estado_detail', 'comprobante_pdf',
+            'usuario_nuevo', 'perfil_usuario', 'estado', 'estado_detail', 'comprobante_pdf', 'referencia_pago',
         ]
+        campos_expandibles = ['detalles']
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
@@ -93,6 +114,19 @@ class VentaSerializer(serializers.ModelSerializer):
             data['precio_total'] = str(instance.precio_total)
         return data
 
+    def validate_detalles(self, detalles):
+        productos_atributos = VentaService.resolver_producto_atributos(
+            detalle['producto_atributo_id'] for detalle in detalles
+        )
+        faltantes = {d['producto_atributo_id'] for d in detalles} - productos_atributos.keys()
+        if faltantes:
+            raise serializers.ValidationError(
+                f"Producto/atributo inexistente: {', '.join(str(i) for i in sorted(faltantes))}."
+            )
+        for detalle in detalles:
+            detalle['producto_atributo'] = productos_atributos[detalle.pop('producto_atributo_id')]
+        return detalles
+
     def validate_estado(self, value):
         logger.info(f"Validando estado: {value}")
         return value
@@ -144,6 +178,12 @@ class VentaSerializer(serializers.ModelSerializer):
         return instance
 
     def create(self, validated_data):
+        # La cuenta nueva y su perfil van en la misma transacción que la venta: si la venta se
+        # rechaza (sin stock, referencia inválida) no queda un usuario que bloquee el reintento
+        with transaction.atomic():
+            return self.crear_venta(validated_data)
+
+    def crear_venta(self, validated_data):
         logger.info("Validated data en create: %s", validated_data)
         detalles_data = validated_data.pop('detalles')
         usuario_nuevo_data = validated_data.pop('usuario_nuevo', None)
@@ -183,43 +223,10 @@ class VentaSerializer(serializers.ModelSerializer):
         if 'barrio' in validated_data and validated_data['barrio'] is not None:
             validated_data['barrio'] = Barrio.objects.get(id=validated_data['barrio'])
 
-        venta = Venta.objects.create(**validated_data)
-
-        puntos_club_activo = PuntosClub.objects.first()
-        puntos_acumulados = 0
-
-        for detalle_data in detalles_data:
-            producto_atributo = detalle_data['producto_atributo']
-            cantidad = detalle_data['cantidad']
-
-            producto_atributo.stock -= cantidad
-            producto_atributo.cantidad_vendida = (producto_atributo.cantidad_vendida or 0) + cantidad
-            producto_atributo.save()
-
-            DetalleVenta.objects.create(
-                venta=venta,
-                producto_atributo=producto_atributo,
-                cantidad=cantidad,
-                precio_unitario=detalle_data['precio_unitario'],
-                subtotal=detalle_data['subtotal']
-            )
-
-            if puntos_club_activo and puntos_club_activo.activo and producto.puntos_club_acumulables:
-                puntos_acumulados += producto.puntos_club_acumulables * cantidad
-
-        if puntos_acumulados > 0 and venta.comprador:
-            venta.puntos_club_acumulados = puntos_acumulados
-            venta.save()
-            perfil = PerfilUsuario.objects.get(usuario=venta.comprador)
-            puntos_anteriores = perfil.puntos_acumulados or 0
-            nuevos_puntos = puntos_anteriores + puntos_acumulados
-            PerfilUsuario.objects.filter(id=perfil.id).update(puntos_acumulados=nuevos_puntos)
-            perfil.refresh_from_db()
-
-            HistorialPuntos.objects.create(
-                perfil=perfil,
-                puntos_obtenidos=puntos_acumulados,
-                descripcion=f"Puntos obtenidos por compra (Venta #{venta.id})"
-            )
-
-        return venta
\ No newline at end of file
+        # La venta, sus líneas, el stock y los puntos se confirman juntos
+        try:
+            return VentaService.registrar_venta(validated_data, detalles_data)
+        except StockInsuficiente as e:
+            raise serializers.ValidationError({'detalles': str(e)})
+        except ReferenciaPagoInvalida as e:
+            raise serializers.ValidationError({'referencia_pago': str(e)})
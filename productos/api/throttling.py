@@ -0,0 +1,36 @@
+from rest_framework.throttling import BaseThrottle
+from productos.services.limite_service import LimiteService, ip_cliente
+
+
+class LimiteTasa(BaseThrottle):
+    """
+    Throttle de DRF sobre el token bucket compartido de LimiteService (429 con Retry-After).
+    Cada grupo de rutas tiene su tasa en settings.LIMITES_TASA; se usa con `limite('grupo')`.
+    """
+    grupo = None
+
+    def clave(self, request, view):
+        return ip_cliente(request)
+
+    def allow_request(self, request, view):
+        clave = self.clave(request, view)
+        if clave is None:
+            # Solo LimitePorUsuario: sin usuario no hay cuenta que proteger (el límite por IP sigue aplicando)
+            return True
+        self.espera = LimiteService.consumir(self.grupo, clave)
+        return self.espera == 0
+
+    def wait(self):
+        return self.espera
+
+
+class LimitePorUsuario(LimiteTasa):
+    """Por cuenta atacada y no por IP: frena la fuerza bruta repartida entre muchas IPs."""
+
+    def clave(self, request, view):
+        usuario = request.data.get('username') or request.data.get('email')
+        return str(usuario).strip().lower() if usuario else None
+
+
+def limite(grupo, base=LimiteTasa):
+    return type(f"Limite_{grupo}", (base,), {'grupo': grupo})
@@ -11,11 +11,15 @@ from productos.api.serializers.configuracion import (
     ColorSerializer, TemaSerializer, ContenidosWebSerializer, FuenteSerializer,
     FuenteAplicarSerializer, DiseñosSerializer, PuntosClubSerializer,InformacionWebSerializer
 )
+from productos.api.cache import CacheLecturaMixin
+from productos.api.throttling import limite
+from productos.services.cache_service import CacheService
 
 
 class ReviewViewSet(viewsets.ModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
+    cursor_ordering = ('-created_at', '-id')
 
     def get_permissions(self):
         if self.action in ['create']:
@@ -101,20 +105,25 @@ class ReviewViewSet(viewsets.ModelViewSet):
 class EnvioViewSet(viewsets.ModelViewSet):
     queryset = Envio.objects.all()
     serializer_class = EnvioSerializer
+    pagination_class = None
     permission_classes = [AllowAny]
 
-class BarrioViewSet(viewsets.ModelViewSet):
+class BarrioViewSet(CacheLecturaMixin, viewsets.ModelViewSet):
     queryset = Barrio.objects.all()
     serializer_class = BarrioSerializer
+    pagination_class = None
+    cache_grupo = 'barrios'
     permission_classes = [AllowAny]
 
 class CuponViewSet(viewsets.ModelViewSet):
     queryset = Cupon.objects.all()
     serializer_class = CuponSerializer
+    pagination_class = None
     permission_classes = [IsAdminUser]
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([limite('cupon')])
 def validar_cupon(request):
     codigo_cupon = request.data.get('codigo')
     if not codigo_cupon:
@@ -132,9 +141,11 @@ def validar_cupon(request):
 
 
 
-class ComponentesConfiguracionesViewSet(viewsets.ModelViewSet):
+class ComponentesConfiguracionesViewSet(CacheLecturaMixin, viewsets.ModelViewSet):
     queryset = Componentes_Configuraciones.objects.all()
     serializer_class = Componentes_ConfiguracionesSerializer
+    pagination_class = None
+    cache_grupo = 'componentes'
 
     def get_permissions(self):
         if self.action in ['update', 'partial_update', 'destroy', 'create']:
@@ -146,18 +157,21 @@ class ComponentesConfiguracionesViewSet(viewsets.ModelViewSet):
 class ColorViewSet(viewsets.ModelViewSet):
     queryset = Color.objects.all()
     serializer_class = ColorSerializer
+    pagination_class = None
     permission_classes = [AllowAny]
 
 class TemaViewSet(viewsets.ModelViewSet):
     queryset = Tema.objects.all()
     serializer_class = TemaSerializer
+    pagination_class = None
     permission_classes = [IsAuthenticated, IsAdminUser]
 
     @action(detail=False, methods=['get'])
     def activo(self, request):
-        tema = Tema.objects.filter(activo=True).first()
-        serializer = self.get_serializer(tema)
-        return Response(serializer.data)
+        def _calcular():
+            tema = Tema.objects.filter(activo=True).first()
+            return self.get_serializer(tema).data
+        return Response(CacheService.obtener('temas', 'activo', _calcular))
 
     @action(detail=True, methods=['post'])
     def activar(self, request, pk=None):
@@ -191,9 +205,11 @@ class TemaViewSet(viewsets.ModelViewSet):
         tema.save()
         return Response(self.get_serializer(tema).data, status=status.HTTP_200_OK)
 
-class ContenidosWebViewSet(viewsets.ModelViewSet):
+class ContenidosWebViewSet(CacheLecturaMixin, viewsets.ModelViewSet):
     queryset = ContenidosWeb.objects.all()
     serializer_class = ContenidosWebSerializer
+    pagination_class = None
+    cache_grupo = 'contenidos'
 
     def get_permissions(self):
         if self.action in ['update', 'partial_update', 'destroy', 'create']:
@@ -202,9 +218,11 @@ class ContenidosWebViewSet(viewsets.ModelViewSet):
             self.permission_classes = [AllowAny]
         return super().get_permissions()
 
-class InformacionWebViewSet(ModelViewSet):
+class InformacionWebViewSet(CacheLecturaMixin, ModelViewSet):
     queryset = InformacionWeb.objects.all()
     serializer_class = InformacionWebSerializer
+    pagination_class = None
+    cache_grupo = 'informacion'
     def get_permissions(self):
         if self.action in ['update', 'partial_update', 'destroy','create']: 
             self.permission_classes = [IsAuthenticated, IsAdminUser]
@@ -215,23 +233,27 @@ class InformacionWebViewSet(ModelViewSet):
 class FuenteViewSet(viewsets.ModelViewSet):
     queryset = Fuente.objects.all()
     serializer_class = FuenteSerializer
+    pagination_class = None
     permission_classes = [AllowAny]
 
 class FuenteAplicarViewSet(viewsets.ModelViewSet):
     queryset = FuenteAplicar.objects.all()
     serializer_class = FuenteAplicarSerializer
+    pagination_class = None
     permission_classes = [AllowAny]
 
 class DiseñosViewSet(viewsets.ModelViewSet):
     queryset = Diseños.objects.all()
     serializer_class = DiseñosSerializer
+    pagination_class = None
     permission_classes = [IsAuthenticated, IsAdminUser]
 
     @action(detail=False, methods=['get'])
     def activo(self, request):
-        diseño = Diseños.objects.filter(activo=True).first()
-        serializer = self.get_serializer(diseño)
-        return Response(serializer.data)
+        def _calcular():
+            diseño = Diseños.objects.filter(activo=True).first()
+            return self.get_serializer(diseño).data
+        return Response(CacheService.obtener('disenos', 'activo', _calcular))
 
     @action(detail=True, methods=['post'])
     def activar(self, request, pk=None):
@@ -244,6 +266,7 @@ class DiseñosViewSet(viewsets.ModelViewSet):
 class PuntosClubViewSet(viewsets.ModelViewSet):
     queryset = PuntosClub.objects.all()
     serializer_class = PuntosClubSerializer
+    pagination_class = None
 
     def get_permissions(self):
         if self.action in ['update', 'partial_update', 'destroy', 'create']:
@@ -257,14 +280,11 @@ class PuntosClubViewSet(viewsets.ModelViewSet):
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_home_data(request):
-    colores = Color.objects.all().values()
-    tema_activo = Tema.objects.filter(activo=True).values().first()
-    diseño_activo = Diseños.objects.filter(activo=True).values().first()
-    fuente_activa = Fuente.objects.filter(activo=True).values().first()
-
-    return Response({
-        "colores": colores,
-        "diseño_activo": diseño_activo,
-        "tema_activo": tema_activo,
-        "fuente_activa": fuente_activa,
-    })
\ No newline at end of file
+    def _calcular():
+        return {
+            "colores": list(Color.objects.all().values()),
+            "diseño_activo": Diseños.objects.filter(activo=True).values().first(),
+            "tema_activo": Tema.objects.filter(activo=True).values().first(),
+            "fuente_activa": Fuente.objects.filter(activo=True).values().first(),
+        }
+    return Response(CacheService.obtener('home', 'home-data', _calcular))
\ No newline at end of file
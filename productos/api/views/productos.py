@@ -7,16 +7,23 @@ from rest_framework.exceptions import ValidationError
 from productos.api.common import *
 from productos.models.producto import Producto, Marca,Atributo,ReviewProduct
 from productos.models.categoria import Categoria, Descuento
-from productos.api.serializers.productos import ProductoSerializer, CategoriaSerializer, DescuentoSerializer,MarcaSerializer,AtributoSerializer,ReviewProductSerializer
-import qrcode
-from io import BytesIO
-from django.core.files.uploadedfile import InMemoryUploadedFile
-import sys
+from productos.api.serializers.productos import ProductoSerializer, CategoriaSerializer, DescuentoSerializer,MarcaSerializer,AtributoSerializer,ReviewProductSerializer, ProductoBusquedaSerializer, GestionAtributosSerializer
+from productos.api.serializers.campos import campos_solicitados
+from productos.services.catalogo_service import CatalogoService
+from productos.services.busqueda_service import BusquedaService
+from productos.services.faceta_service import FacetaService
+from productos.services.qr_service import QrService
+from productos.services.stock_service import StockService, StockInsuficiente
+from productos.services.importacion_service import ImportacionService
+from django.http import StreamingHttpResponse
+from productos.api.cache import CacheLecturaMixin
 
 
-class MarcaViewSet(viewsets.ModelViewSet):
+class MarcaViewSet(CacheLecturaMixin, viewsets.ModelViewSet):
     queryset = Marca.objects.all()
     serializer_class = MarcaSerializer
+    pagination_class = None
+    cache_grupo = 'marcas'
 
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
@@ -29,11 +36,25 @@ class ProductoViewSet(viewsets.ModelViewSet):
     queryset = Producto.objects.all()
     parser_classes = (MultiPartParser, FormParser, JSONParser)
     serializer_class = ProductoSerializer
+    # ?orden= -> orden del cursor; todos usan columnas indexadas
+    ORDENES = {
+        'recientes': '-id',
+        'mas_vendidos': ('-vendidos_total', '-id'),
+        'mayor_stock': ('-stock_total', '-id'),
+        'mejor_valorados': ('-rating_avg', '-id'),
+    }
+
+    @property
+    def cursor_ordering(self):
+        orden = self.request.query_params.get('orden')
+        if self.action == 'buscar' and orden not in self.ORDENES and BusquedaService.disponible():
+            return ('-relevancia', '-id')
+        return self.ORDENES.get(orden, '-id')
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'buscar', 'facetas']:
             self.permission_classes = [AllowAny]
-        elif self.action in ['create', 'destroy']:
+        elif self.action in ['create', 'destroy', 'importar', 'exportar', 'gestionar_atributos']:
             self.permission_classes = [IsAuthenticated, IsAdminUser]
         elif self.action in ['update', 'partial_update']:
             self.permission_classes = [IsAuthenticated]
@@ -41,90 +62,130 @@ class ProductoViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         queryset = Producto.objects.all()
-        categoria = self.request.query_params.get('categoria')
-        if categoria:
-            return queryset.filter(categoria__nombre=categoria)
+        if self.action in ['list', 'buscar', 'facetas']:
+            queryset = FacetaService.filtrar(queryset, self.filtros)
+        if self.action in ['list', 'retrieve', 'buscar', 'facetas']:
+            fields, expand = campos_solicitados(self.request)
+            campos = None if fields is None else fields | expand
+            return CatalogoService.planificar(queryset, campos=campos)
         return queryset
 
-    def generar_qr(self, producto):
-        try:
-            qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
-            qr.add_data(f"PRODUCTO_ID:{producto.id}")
-            qr.make(fit=True)
-            img = qr.make_image(fill='black', back_color='white')
-            buffer = BytesIO()
-            img.save(buffer, format="PNG")
-            buffer.seek(0)
-            file_name = f'qr_{producto.id}.png'
-            django_file = InMemoryUploadedFile(buffer, None, file_name, 'image/png', sys.getsizeof(buffer), None)
-            producto.qr_code.save(file_name, django_file, save=True)
-            producto.save()
-        except Exception as e:
-            logger.error(f"Error al generar QR para producto {producto.id}: {str(e)}")
-            raise ValidationError({"qr_code": "Error al generar el código QR."})
+    @property
+    def filtros(self):
+        if not hasattr(self, '_filtros'):
+            self._filtros = FacetaService.leer_filtros(self.request.query_params)
+        return self._filtros
+
+    @action(detail=False, methods=['get'], url_path='facetas')
+    def facetas(self, request):
+        """Listado filtrado (mismos filtros que /productos/) más los conteos de cada faceta en `facetas`."""
+        page = self.paginate_queryset(self.get_queryset())
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        response.data['facetas'] = FacetaService.facetas(self.filtros)
+        return response
+
+    @action(detail=False, methods=['get'], url_path='buscar')
+    def buscar(self, request):
+        """Búsqueda de texto (?q=) con ranking, resaltado y paginación por cursor; admite los mismos filtros que el listado."""
+        texto = (request.query_params.get('q') or '').strip()
+        if len(texto) < 2:
+            return Response({"error": "El parámetro 'q' debe tener al menos 2 caracteres."}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = BusquedaService.buscar(texto, self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        serializer = ProductoBusquedaSerializer(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        producto = serializer.save()
-
-        self.generar_qr(producto)
         atributos_data = request.data.get('atributos', [])
         if not atributos_data:
             raise ValidationError({"atributos": "Debe proporcionar al menos un atributo para el producto."})
+        atributos = GestionAtributosSerializer(data={'atributos': atributos_data})
+        atributos.is_valid(raise_exception=True)
 
-        for atributo_data in atributos_data:
-            atributo_id = atributo_data.get('atributo_id')
-            stock = atributo_data.get('stock', 0)
-            if not atributo_id:
-                raise ValidationError({"atributos": "Cada atributo debe tener un 'atributo_id' válido."})
-            try:
-                atributo = Atributo.objects.get(id=atributo_id)
-            except Atributo.DoesNotExist:
-                raise ValidationError({"atributos": f"Atributo con ID {atributo_id} no encontrado."})
-            ProductoAtributo.objects.update_or_create(
-                producto=producto,
-                atributo=atributo,
-                defaults={'stock': stock}
-            )
+        with transaction.atomic():
+            producto = serializer.save()
+            self.aplicar_atributos(producto, atributos.validated_data)
+            # El QR se genera y sube en el worker de tareas (procesar_tareas)
+            QrService.encolar(producto)
         serializer = self.get_serializer(producto)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    def aplicar_atributos(self, producto, datos):
+        try:
+            return StockService.gestionar_atributos(
+                producto.id, datos['atributos'], datos['eliminar'], datos['atributos_por_id']
+            )
+        except StockInsuficiente as e:
+            raise ValidationError({"atributos": str(e)})
+
+    @action(detail=False, methods=['post'], url_path='importar')
+    def importar(self, request):
+        """Importa un CSV/JSONL (campo `archivo`) por lotes; responde con los totales y los errores por línea."""
+        archivo = request.FILES.get('archivo')
+        if archivo is None:
+            return Response({"error": "Debe enviar el archivo en el campo 'archivo'."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            formato = ImportacionService.formato(archivo.name, request.query_params.get('formato'))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        resultado = ImportacionService.importar(ImportacionService.leer(archivo.file, formato))
+        return Response(resultado.como_dict(), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='exportar')
+    def exportar(self, request):
+        formato = request.query_params.get('formato', 'csv')
+        if formato not in ('csv', 'jsonl'):
+            return Response({"error": "Formato no soportado (usar csv o jsonl)."}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(
+            ImportacionService.exportar(formato),
+            content_type='text/csv; charset=utf-8' if formato == 'csv' else 'application/x-ndjson; charset=utf-8',
+        )
+        response['Content-Disposition'] = f'attachment; filename="productos.{formato}"'
+        return response
+
     @action(detail=True, methods=['post'], url_path='gestionar-atributos')
     def gestionar_atributos(self, request, pk=None):
+        """
+        {"atributos": [{"atributo_id": 1, "stock": 5}, {"atributo_id": 2, "delta": -1}], "eliminar": [3]}
+        Todo se aplica en una transacción; responde con el estado resultante de los atributos enviados.
+        """
         producto = self.get_object()
-        atributos_data = request.data.get('atributos', [])
-        if not atributos_data:
-            raise ValidationError({"atributos": "Debe proporcionar al menos un atributo para gestionar."})
-        for atributo_data in atributos_data:
-            atributo_id = atributo_data.get('atributo_id')
-            stock = atributo_data.get('stock', 0)
-            if not atributo_id:
-                raise ValidationError({"atributos": "Cada atributo debe tener un 'atributo_id' válido."})
-            try:
-                atributo = Atributo.objects.get(id=atributo_id)
-            except Atributo.DoesNotExist:
-                raise ValidationError({"atributos": f"Atributo con ID {atributo_id} no encontrado."})
-            ProductoAtributo.objects.update_or_create(
-                producto=producto,
-                atributo=atributo,
-                defaults={'stock': stock}
-            )
-        return Response({'message': 'Atributos actualizados'}, status=status.HTTP_200_OK)
+        datos = GestionAtributosSerializer(data=request.data)
+        datos.is_valid(raise_exception=True)
+        filas, eliminados = self.aplicar_atributos(producto, datos.validated_data)
+        return Response({
+            'message': 'Atributos actualizados',
+            'atributos': [
+                {
+                    'id': fila.id,
+                    'atributo': {'id': fila.atributo.id, 'nombre': fila.atributo.nombre, 'valor': fila.atributo.valor},
+                    'stock': fila.stock,
+                    'cantidad_vendida': fila.cantidad_vendida,
+                }
+                for fila in filas
+            ],
+            'eliminados': eliminados,
+        }, status=status.HTTP_200_OK)
 
-class CategoriaViewSet(viewsets.ModelViewSet):
+class CategoriaViewSet(CacheLecturaMixin, viewsets.ModelViewSet):
     queryset = Categoria.objects.all()
     serializer_class = CategoriaSerializer
     permission_classes = []
+    pagination_class = None
+    cache_grupo = 'categorias'
 
 class DescuentoViewSet(viewsets.ModelViewSet):
     queryset = Descuento.objects.all()
     serializer_class = DescuentoSerializer
     permission_classes = []
+    pagination_class = None
 
 class ReviewProductViewSet(viewsets.ModelViewSet):
     queryset = ReviewProduct.objects.all()
     serializer_class = ReviewProductSerializer
+    cursor_ordering = ('-created_at', '-id')
 
     def get_permissions(self):
         if self.action in ['create']:
@@ -139,7 +200,7 @@ class ReviewProductViewSet(viewsets.ModelViewSet):
         serializer.save(user=self.request.user)
 
     def get_queryset(self):
-        queryset = ReviewProduct.objects.all()
+        queryset = ReviewProduct.objects.select_related('user', 'product')
         product_id = self.request.query_params.get('product_id')
         if product_id:
             queryset = queryset.filter(product_id=product_id, approved=True)
@@ -161,14 +222,12 @@ class ReviewProductViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['GET'], url_path='overall-rating/(?P<product_id>\d+)')
     def overall_rating(self, request, product_id=None):
         try:
-            reviews = ReviewProduct.objects.filter(product_id=product_id, approved=True)
-            if not reviews.exists():
+            rating = Producto.objects.filter(id=product_id).values('rating_avg', 'rating_count').first()
+            if not rating or not rating['rating_count']:
                 return Response({"average_rating": 0, "total_reviews": 0}, status=status.HTTP_200_OK)
-            average_rating = reviews.aggregate(Avg('rating'))['rating__avg']
-            total_reviews = reviews.count()
             return Response({
-                "average_rating": round(average_rating, 1),
-                "total_reviews": total_reviews
+                "average_rating": round(rating['rating_avg'], 1),
+                "total_reviews": rating['rating_count']
             }, status=status.HTTP_200_OK)
         except Exception as e:
             print(f"Error en overall_rating: {str(e)}")
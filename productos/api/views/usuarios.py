@@ -3,7 +3,8 @@ from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.models import User
 from django.utils.decorators import method_decorator
-from django_ratelimit.decorators import ratelimit
+from django.views import View
+from productos.api.throttling import LimitePorUsuario, limite
 from productos.models.usuario import SuperUsuario, PerfilUsuario, HistorialPuntos, Roles, PasswordResetCode
 from productos.api.serializers.usuarios import (
     SuperUsuarioSerializer, PerfilUsuarioSerializer, HistorialPuntosSerializer, 
@@ -11,6 +12,11 @@ from productos.api.serializers.usuarios import (
 )
 from productos.api.serializers.productos import ProductoSerializer
 from productos.models.producto import Producto,ProductoAtributo
+from productos.services.catalogo_service import CatalogoService
+from productos.api.pagination import CursorPaginacion
+from productos.services.carrito_service import CarritoInvitadoService
+from productos.models.correo import CorreoSaliente
+from productos.services.correo_service import CorreoService
 import random
 import string
 import re
@@ -25,11 +31,13 @@ firebase_admin.initialize_app(cred)
 class RolesViewSet(viewsets.ModelViewSet):
     queryset = Roles.objects.all()
     serializer_class = RolesSerializer
+    pagination_class = None
     permission_classes = [IsAuthenticated, IsAdminUser]
 
 class SuperUsuarioViewSet(viewsets.ModelViewSet):
     queryset = SuperUsuario.objects.all()
     serializer_class = SuperUsuarioSerializer
+    pagination_class = None
 
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
@@ -169,7 +177,9 @@ class PerfilUsuarioViewSet(viewsets.ModelViewSet):
             # Obtenemos los ProductoAtributo favoritos
             favoritos = perfil.favoritos.all()
             # Agrupamos por Producto
-            productos_favoritos = Producto.objects.filter(producto_atributos__in=favoritos).distinct()
+            productos_favoritos = CatalogoService.planificar(
+                Producto.objects.filter(id__in=favoritos.values('producto_id'))
+            )
             serializer = ProductoSerializer(productos_favoritos, many=True, context={'request': request})
             return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -187,8 +197,8 @@ class HistorialPuntosViewSet(viewsets.ReadOnlyModelViewSet):
 
 class RegistroUsuarioView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [limite('registro')]
 
-    @method_decorator(ratelimit(key='ip', rate='2/m', block=True))
     def post(self, request):
         data = request.data
         username = data.get("username")
@@ -205,28 +215,55 @@ class RegistroUsuarioView(APIView):
         user = User.objects.create_user(username=username, email=email, password=password)
         return Response({"message": "Usuario registrado con éxito"}, status=status.HTTP_201_CREATED)
 
+def fusionar_carrito_invitado(request, usuario_id, datos=None):
+    """Al iniciar sesión: si el cliente manda su token de carrito invitado, se suma al carrito de la cuenta."""
+    datos = request.data if datos is None else datos
+    token = request.headers.get('X-Carrito-Token') or datos.get('carrito_token')
+    if not token:
+        return
+    try:
+        CarritoInvitadoService.fusionar(usuario_id, token)
+    except Exception as e:
+        # No se corta el login por el carrito
+        logger.exception("No se pudo fusionar el carrito invitado: %s", str(e))
+
+
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
+    # Los intentos bloqueados se cortan antes de autenticar: no llegan a la base
+    throttle_classes = [limite('login'), limite('login_usuario', LimitePorUsuario)]
 
-class GoogleLoginView(APIView):
-    permission_classes = [AllowAny]
+    def post(self, request, *args, **kwargs):
+        response = super().post(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK and 'user' in response.data:
+            fusionar_carrito_invitado(request, response.data['user']['id'])
+        return response
 
-    def post(self, request):
-        id_token = request.data.get("id_token")
+# Las vistas que esperan servicios externos (Firebase, SMTP) son async: bajo ASGI
+# (gunicorn_asgi.conf.py) esperan la red sin ocupar un worker. El ORM se usa con su API
+# async (aget, acreate...) y lo que es solo sync va por sync_to_async.
+
+@method_decorator(csrf_exempt, name='dispatch')
+class GoogleLoginView(View):
+
+    async def post(self, request):
+        datos = datos_request(request)
+        id_token = datos.get("id_token")
         if not id_token:
-            return Response({"error": "No se proporcionó id_token"}, status=status.HTTP_400_BAD_REQUEST)
+            return JsonResponse({"error": "No se proporcionó id_token"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            decoded_token = auth.verify_id_token(id_token)
+            decoded_token = await sync_to_async(auth.verify_id_token, thread_sensitive=False)(id_token)
             email = decoded_token["email"]
-            uid = decoded_token["uid"]
-            user, created = User.objects.get_or_create(
+            user, created = await User.objects.aget_or_create(
                 email=email,
                 defaults={"username": email.split("@")[0]}
             )
-            refresh = RefreshToken.for_user(user)
+            # Con token_blacklist, for_user guarda el token emitido
+            refresh = await sync_to_async(RefreshToken.for_user)(user)
             access = str(refresh.access_token)
-            return Response({
+            await sync_to_async(fusionar_carrito_invitado)(request, user.id, datos)
+            return JsonResponse({
                 "access": access,
                 "refresh": str(refresh),
                 "user": {
@@ -237,47 +274,46 @@ class GoogleLoginView(APIView):
                 }
             }, status=status.HTTP_200_OK)
         except auth.InvalidIdTokenError:
-            return Response({"error": "Token de Firebase inválido"}, status=status.HTTP_400_BAD_REQUEST)
+            return JsonResponse({"error": "Token de Firebase inválido"}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return JsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class PasswordResetRequestView(APIView):
-    permission_classes = [AllowAny]
+@method_decorator(csrf_exempt, name='dispatch')
+class PasswordResetRequestView(View):
 
-    @method_decorator(ratelimit(key='ip', rate='5/m', block=True))
-    def post(self, request):
-        email = request.data.get('email')
+    async def post(self, request):
+        limitado = await verificar_limite(request, 'password_reset')
+        if limitado:
+            return limitado
+        email = datos_request(request).get('email')
         if not email:
-            return Response({"error": "El correo es obligatorio"}, status=status.HTTP_400_BAD_REQUEST)
-        
+            return JsonResponse({"error": "El correo es obligatorio"}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
-            user = User.objects.get(email=email)
+            user = await User.objects.aget(email=email)
         except User.DoesNotExist:
-            return Response({"error": "El correo no está registrado"}, status=status.HTTP_400_BAD_REQUEST)
+            return JsonResponse({"error": "El correo no está registrado"}, status=status.HTTP_400_BAD_REQUEST)
 
         verification_code = ''.join(random.choices(string.digits, k=6))
-        PasswordResetCode.objects.filter(user=user).delete()
-        PasswordResetCode.objects.create(user=user, code=verification_code)
+        await PasswordResetCode.objects.filter(user=user).adelete()
+        await PasswordResetCode.objects.acreate(user=user, code=verification_code)
 
         logger.info(f"Código generado: {verification_code}, para el correo: {email}")
-        try:
-            send_mail(
-                'Código de Verificación para Recuperar Contraseña',
-                f'Tu código de verificación es: {verification_code}',
-                'alesamu.am@gmail.com',
-                [email],
-                fail_silently=False,
-            )
-        except Exception as e:
-            logger.error(f"Error al enviar el correo: {str(e)}")
-            return Response({"error": f"Error al enviar el correo: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        # Lo envía el worker de correos (manage.py enviar_correos); acá solo se inserta en la bandeja
+        await sync_to_async(CorreoService.encolar)(
+            'password_reset',
+            'Código de Verificación para Recuperar Contraseña',
+            f'Tu código de verificación es: {verification_code}',
+            [email],
+            remitente='alesamu.am@gmail.com',
+        )
 
-        return Response({"message": "Código de verificación enviado al correo"}, status=status.HTTP_200_OK)
+        return JsonResponse({"message": "Código de verificación enviado al correo"}, status=status.HTTP_200_OK)
 
 class VerifyCodeView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [limite('verificar_codigo')]
 
-    @method_decorator(ratelimit(key='ip', rate='5/m', block=True))
     def post(self, request):
         code = request.data.get('code')
         email = request.data.get('email')
@@ -306,8 +342,8 @@ class VerifyCodeView(APIView):
 
 class PasswordResetConfirmView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [limite('confirmar_password')]
 
-    @method_decorator(ratelimit(key='ip', rate='5/m', block=True))
     def post(self, request):
         email = request.data.get('email')
         password = request.data.get('password')
@@ -351,7 +387,9 @@ class RefreshTokenView(APIView):
 @permission_classes([IsAdminUser])
 def listar_usuarios(request):
     usuarios = User.objects.all().values('id', 'username', 'email', 'is_active')
-    return Response(usuarios, status=status.HTTP_200_OK)
+    paginator = CursorPaginacion()
+    pagina = paginator.paginate_queryset(usuarios, request)
+    return paginator.get_paginated_response(pagina)
 
 @api_view(['DELETE'])
 @permission_classes([IsAdminUser])
@@ -363,28 +401,39 @@ def eliminar_usuario(request, user_id):
     except User.DoesNotExist:
         return Response({"error": "Usuario no encontrado."}, status=status.HTTP_404_NOT_FOUND)
 
-@api_view(['POST'])
-@permission_classes([AllowAny])
+@csrf_exempt
 @require_POST
-def EnviarEmailFormContact(request):
+async def EnviarEmailFormContact(request):
+    # Público y sin cuenta: limitado por IP y con prioridad baja, para no gastar el cupo
+    # diario del proveedor que necesitan los correos de recuperación y las facturas
+    limitado = await verificar_limite(request, 'contacto')
+    if limitado:
+        return limitado
     try:
-        correoUsuario = request.data.get('email')
-        nombreUsuario = request.data.get('nombre')
-        mensaje = request.data.get('mensaje')
-
-        email = EmailMessage(
-            subject="Mensaje de contacto",
-            body=f"Email: {correoUsuario},\n\nNombre: {nombreUsuario} \n\nMensaje: {mensaje}",
-            to=[os.getenv('EMAIL_HOST')],
+        datos = datos_request(request)
+        correoUsuario = datos.get('email')
+        nombreUsuario = datos.get('nombre')
+        mensaje = datos.get('mensaje')
+
+        await sync_to_async(CorreoService.encolar)(
+            'contacto',
+            "Mensaje de contacto",
+            f"Email: {correoUsuario},\n\nNombre: {nombreUsuario} \n\nMensaje: {mensaje}",
+            [os.getenv('EMAIL_HOST')],
+            prioridad=CorreoSaliente.MARKETING,
         )
-        email.send()
 
         if not correoUsuario:
             logger.error("No se pudo obtener el correo")
         elif not nombreUsuario:
             logger.error("No se pudo obtener el nombre")
         
-        return Response({"mensaje": "Mensaje enviado con éxito."}, status=status.HTTP_200_OK)
+        return JsonResponse({"mensaje": "Mensaje enviado con éxito."}, status=status.HTTP_200_OK)
     except Exception as e:
         logger.error(f"Error al enviar el correo: {str(e)}")
-        return Response({"error": "No se pudo mandar el correo"}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return JsonResponse({"error": "No se pudo mandar el correo"}, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metricas_correos(request):
+    return JsonResponse(CorreoService.metricas())
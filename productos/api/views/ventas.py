@@ -3,13 +3,27 @@ from productos.models.venta import Venta, Carrito, CarritoProducto, EstadosVenta
 from productos.models.producto import Producto, Atributo, Marca,ProductoAtributo
 from productos.models.usuario import SuperUsuario
 from productos.api.serializers.ventas import (
-    VentaSerializer, CarritoSerializer, CarritoProductoSerializer, EstadosVentaSerializer
+    VentaSerializer, CarritoSerializer, CarritoProductoSerializer, EstadosVentaSerializer, OperacionesCarritoSerializer
 )
+from productos.api.serializers.campos import campos_solicitados
+from productos.models.tarea import Tarea
+from productos.services.factura_service import FacturaService
+from productos.services.venta_service import VentaService
+from productos.services.reserva_service import ReservaService
+from productos.services.pago_service import PagoService
+from productos.services.pasarela_service import PAISES_MERCADOPAGO, ErrorPasarela, pasarela_para_pais
+from productos.services.stock_service import StockInsuficiente, StockService
+from productos.services.carrito_service import (
+    CarritoService, CarritoInvitadoService, CarritoInvalido, VersionCarritoObsoleta, AGREGAR, QUITAR
+)
+from django.utils.http import parse_etags
 from django.core.files import File
+from rest_framework.exceptions import ValidationError
 
 class VentaViewSet(viewsets.ModelViewSet):
-    queryset = Venta.objects.all().prefetch_related('detalles')
+    queryset = Venta.objects.all().prefetch_related(VentaService.prefetch_detalles())
     serializer_class = VentaSerializer
+    cursor_ordering = ('-fecha_venta', '-id')
 
     def get_permissions(self):
         if self.request.user.is_staff:
@@ -20,9 +34,13 @@ class VentaViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         if self.request.user.is_staff:
-            return Venta.objects.all().prefetch_related('detalles')
+            queryset = Venta.objects.all()
         else:
-            return Venta.objects.filter(comprador=self.request.user).prefetch_related('detalles')
+            queryset = Venta.objects.filter(comprador=self.request.user)
+        fields, expand = campos_solicitados(self.request)
+        if fields is None or 'detalles' in fields | expand:
+            queryset = queryset.prefetch_related(VentaService.prefetch_detalles())
+        return queryset
 
     def partial_update(self, request, *args, **kwargs):
         logger.debug("Datos recibidos en partial_update:", request.data)
@@ -60,9 +78,10 @@ class VentaViewSet(viewsets.ModelViewSet):
     def mis_compras(self, request):
         try:
             usuario = request.user
-            ventas = Venta.objects.filter(comprador=usuario)
-            serializer = VentaSerializer(ventas, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            ventas = Venta.objects.filter(comprador=usuario).prefetch_related(VentaService.prefetch_detalles())
+            pagina = self.paginate_queryset(ventas)
+            serializer = VentaSerializer(pagina, many=True)
+            return self.get_paginated_response(serializer.data)
         except Exception as e:
             logger.error(f"Error en mis_compras: {str(e)}")
             return Response({"error": "Ocurrió un error al procesar la solicitud"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -71,9 +90,10 @@ class VentaViewSet(viewsets.ModelViewSet):
     def mis_ventas(self, request):
         try:
             usuario = request.user
-            ventas = Venta.objects.filter(vendedor__usuario=usuario)
-            serializer = VentaSerializer(ventas, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            ventas = Venta.objects.filter(vendedor__usuario=usuario).prefetch_related(VentaService.prefetch_detalles())
+            pagina = self.paginate_queryset(ventas)
+            serializer = VentaSerializer(pagina, many=True)
+            return self.get_paginated_response(serializer.data)
         except Exception as e:
             logger.error(f"Error en mis_ventas: {str(e)}")
             return Response({"error": "Ocurrió un error al procesar la solicitud"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -106,6 +126,7 @@ class VentaViewSet(viewsets.ModelViewSet):
 class EstadosVentaViewSet(viewsets.ModelViewSet):
     queryset = EstadosVenta.objects.all()
     serializer_class = EstadosVentaSerializer
+    pagination_class = None
 
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
@@ -114,29 +135,76 @@ class EstadosVentaViewSet(viewsets.ModelViewSet):
             self.permission_classes = [IsAdminUser]
         return super().get_permissions()
 
+def respuesta_proyeccion(request, proyectar, status_code=status.HTTP_200_OK):
+    # El frontend consulta el carrito seguido: con If-None-Match igual al ETag se responde 304 sin armar el cuerpo
+    si_no_coincide = parse_etags(request.headers.get('If-None-Match', '')) if request.method == 'GET' else None
+    datos, etag = proyectar(si_no_coincide)
+    response = Response(status=status.HTTP_304_NOT_MODIFIED) if datos is None else Response(datos, status=status_code)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 class CarritoViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
     queryset = Carrito.objects.all()
 
+    def respuesta_carrito(self, request, carrito, status_code=status.HTTP_200_OK):
+        return respuesta_proyeccion(
+            request, lambda si_no_coincide: CarritoService.proyeccion(carrito, si_no_coincide), status_code
+        )
+
     def list(self, request):
-        usuario = request.user
-        logger.info(f"Usuario autenticado: {usuario}, ID: {usuario.id}")
-        carrito, created = Carrito.objects.get_or_create(usuario=usuario)
-        if created:
-            logger.info(f"Carrito creado para el usuario: {carrito.id}")
-        else:
-            logger.info(f"Carrito encontrado: {carrito.id}")
-        serializer = CarritoSerializer(carrito)
-        logger.debug("Datos serializados:", serializer.data)
-        return Response(serializer.data)
+        return self.respuesta_carrito(request, CarritoService.obtener(request.user))
 
     @action(detail=False, methods=['post'], url_path='agregar_producto')
     def agregar_producto(self, request):
-        carrito, created = Carrito.objects.get_or_create(usuario=request.user)
         serializer = CarritoProductoSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save(carrito=carrito)
-        return Response(CarritoSerializer(carrito).data, status=status.HTTP_201_CREATED)
+        operacion = {
+            'op': AGREGAR,
+            'producto_atributo_id': serializer.validated_data['producto_atributo'].id,
+            'cantidad': serializer.validated_data.get('cantidad', 1),
+        }
+        try:
+            carrito = CarritoService.aplicar(CarritoService.obtener(request.user), [operacion])
+        except CarritoInvalido as e:
+            return Response({'cantidad': e.errores['0']}, status=status.HTTP_400_BAD_REQUEST)
+        return self.respuesta_carrito(request, carrito, status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['patch'], url_path='items')
+    def items(self, request):
+        """
+        {"version": 3, "operaciones": [{"op": "agregar"|"fijar"|"quitar", "producto_atributo_id": 1, "cantidad": 2}]}
+        Todas las operaciones se aplican juntas o ninguna; si `version` no coincide responde 409 con el carrito actual.
+        """
+        serializer = OperacionesCarritoSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        carrito = CarritoService.obtener(request.user)
+        try:
+            carrito = CarritoService.aplicar(
+                carrito, serializer.validated_data['operaciones'], serializer.validated_data.get('version')
+            )
+        except VersionCarritoObsoleta as e:
+            return self.respuesta_carrito(request, e.carrito, status.HTTP_409_CONFLICT)
+        except CarritoInvalido as e:
+            return Response({'operaciones': e.errores}, status=status.HTTP_400_BAD_REQUEST)
+        return self.respuesta_carrito(request, carrito)
+
+    @action(detail=False, methods=['post'], url_path='fusionar')
+    def fusionar(self, request):
+        """Suma el carrito invitado (token en X-Carrito-Token o `carrito_token`) al carrito del usuario."""
+        token = request.headers.get('X-Carrito-Token') or request.data.get('carrito_token')
+        if not token:
+            return Response({'detail': 'carrito_token es requerido'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            carrito = CarritoInvitadoService.fusionar(request.user.id, token)
+        except VersionCarritoObsoleta:
+            # Otra request está escribiendo el carrito invitado: no se fusionó nada, el cliente reintenta
+            return self.respuesta_carrito(request, CarritoService.obtener(request.user), status.HTTP_409_CONFLICT)
+        except CarritoInvalido as e:
+            return Response({'operaciones': e.errores}, status=status.HTTP_400_BAD_REQUEST)
+        return self.respuesta_carrito(request, carrito)
 
     @action(detail=False, methods=['delete'], url_path='eliminar_producto')
     def eliminar_producto(self, request):
@@ -144,12 +212,45 @@ class CarritoViewSet(viewsets.ViewSet):
         producto_atributo_id = request.data.get('producto_atributo_id')
         if not producto_atributo_id:
             return Response({'detail': 'producto_atributo_id es requerido'}, status=status.HTTP_400_BAD_REQUEST)
-        try:
-            producto = carrito.productos.get(producto_atributo_id=producto_atributo_id)
-            producto.delete()
-            return Response(CarritoSerializer(carrito).data)
-        except CarritoProducto.DoesNotExist:
+        if not carrito.productos.filter(producto_atributo_id=producto_atributo_id).exists():
             return Response({'detail': 'Producto no encontrado en el carrito'}, status=status.HTTP_404_NOT_FOUND)
+        carrito = CarritoService.aplicar(carrito, [{'op': QUITAR, 'producto_atributo_id': int(producto_atributo_id)}])
+        return self.respuesta_carrito(request, carrito)
+
+class CarritoInvitadoViewSet(viewsets.ViewSet):
+    """
+    Carrito de visitantes sin cuenta, identificado por el token que devuelve el primer PATCH
+    (`token` en el cuerpo) y que el cliente reenvía en X-Carrito-Token.
+    """
+    permission_classes = [AllowAny]
+
+    def token(self, request):
+        return request.headers.get('X-Carrito-Token', '')
+
+    def list(self, request):
+        token = self.token(request)
+        datos = CarritoInvitadoService.leer(token)
+        token = token if CarritoInvitadoService.token_valido(token) else None
+        return respuesta_proyeccion(request, lambda si_no_coincide: CarritoInvitadoService.proyeccion(token, datos, si_no_coincide))
+
+    @action(detail=False, methods=['patch'], url_path='items')
+    def items(self, request):
+        serializer = OperacionesCarritoSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            token, datos = CarritoInvitadoService.aplicar(
+                self.token(request), serializer.validated_data['operaciones'], serializer.validated_data.get('version')
+            )
+        except VersionCarritoObsoleta as e:
+            actual = {'version': e.carrito.version, 'items': e.carrito.items}
+            return respuesta_proyeccion(
+                request, lambda si_no_coincide: CarritoInvitadoService.proyeccion(e.carrito.token, actual, si_no_coincide),
+                status.HTTP_409_CONFLICT,
+            )
+        except CarritoInvalido as e:
+            return Response({'operaciones': e.errores}, status=status.HTTP_400_BAD_REQUEST)
+        return respuesta_proyeccion(request, lambda si_no_coincide: CarritoInvitadoService.proyeccion(token, datos, si_no_coincide))
+
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -160,8 +261,7 @@ def crear_venta(request):
     if 'productos' in data and 'detalles' not in data:
         data['detalles'] = [
             {
-                'producto_id': p['producto'],
-                'combinacion': p.get('combinacion', []),
+                'producto_atributo_id': p.get('producto_atributo_id', p.get('producto_atributo')),
                 'cantidad': p['cantidad'],
                 'precio_unitario': p['precio_unitario'],
                 'subtotal': float(p['precio_unitario']) * p['cantidad']
@@ -171,34 +271,14 @@ def crear_venta(request):
     serializer = VentaSerializer(data=data, context={'request': request})
     if serializer.is_valid():
         try:
-            with transaction.atomic():
-                detalles_data = serializer.validated_data['detalles']
-                productos_ids = [d['producto'].id for d in detalles_data]
-                productos = Producto.objects.select_for_update().filter(id__in=productos_ids)
-                productos_dict = {p.id: p for p in productos}
-
-                for detalle in detalles_data:
-                    producto = productos_dict.get(detalle['producto'].id)
-                    if not producto:
-                        logger.error("Producto con ID %s no encontrada.", detalle['producto'].id)
-                        return Response({'error': f'Producto con ID {detalle["producto"].id} no encontrada.'}, 
-                                        status=status.HTTP_400_BAD_REQUEST)
-                    combinacion_key = ",".join(f"{item['tipo']}:{item['valor']}" for item in detalle['combinacion']) \
-                        if detalle['combinacion'] else "default"
-                    if producto.tiene_variantes and combinacion_key not in producto.combinaciones:
-                        logger.error("Combinación %s no encontrada.", combinacion_key)
-                        return Response({'error': f'Combinación {combinacion_key} no encontrada.'}, 
-                                        status=status.HTTP_400_BAD_REQUEST)
-                    stock = producto.combinaciones.get(combinacion_key, {}).get('stock', 0)
-                    if stock < detalle['cantidad']:
-                        logger.error("Stock insuficiente para %s.", producto.nombre)
-                        return Response({'error': f'Stock insuficiente para {producto.nombre}.'}, 
-                                        status=status.HTTP_400_BAD_REQUEST)
-
-                venta = serializer.save()
-                logger.info("Venta creada con éxito: %s", venta.id)
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
-
+            # El stock se descuenta con UPDATEs condicionales dentro de serializer.save();
+            # si alguna línea no alcanza se revierte toda la venta
+            venta = serializer.save()
+            logger.info("Venta creada con éxito: %s", venta.id)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        except ValidationError as e:
+            logger.warning("Venta rechazada: %s", e.detail)
+            return Response(e.detail, status=status.HTTP_409_CONFLICT)
         except Exception as e:
             logger.exception("Error al crear la venta: %s", str(e))
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -208,227 +288,12 @@ def crear_venta(request):
 
 
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def enviar_pdf(request):
-    try:
-        usuario = request.user
-        if not usuario.is_authenticated:
-            return JsonResponse({"error": "Usuario no autenticado"}, status=401)
-
-        data = request.data
-        venta_id = data.get('venta_id')
-        datos_compra = data.get('datos_compra')
-        total_puntos = data.get('total_puntos', 0)
-
-        if not venta_id or not datos_compra:
-            return JsonResponse({"error": "Se requieren venta_id y datos_compra"}, status=400)
-
-        venta = Venta.objects.get(id=venta_id)
-        
-        if not usuario.is_staff and venta.comprador != usuario:
-            return JsonResponse({"error": "No tienes permiso para esta venta"}, status=403)
-
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=A4,
-            rightMargin=8*mm,
-            leftMargin=8*mm,
-            topMargin=8*mm,
-            bottomMargin=8*mm
-        )
-        styles = getSampleStyleSheet()
-        elements = []
-
-        page_width = doc.width 
-        y_position = 0
-
-        elements.append(Spacer(1, y_position))  
-        styles["Title"].fontSize = 12
-        styles["Title"].textColor = colors.black
-        styles["Title"].fontName = "Helvetica-Bold"
-        elements.append(Paragraph("Factura Fiscal", styles["Title"]))
-        
-        styles["Heading1"].fontSize = 20
-        styles["Heading1"].alignment = 2  
-        elements.append(Paragraph(
-            datos_compra.get('datosEmpresa', {}).get('nombre', '').get('contenido',''),
-            styles["Heading1"]
-        ))
-        
-        styles["Normal"].fontSize = 10
-        styles["Normal"].alignment = 2  
-        elements.append(Paragraph(
-            f"Dirección: {datos_compra.get('datosEmpresa', {}).get('direccion', 'N/A').get('contenido','')}, "
-            f"{datos_compra.get('datosEmpresa', {}).get('ciudad', 'N/A').get('contenido','')}, "
-            f"{datos_compra.get('datosEmpresa', {}).get('pais', 'N/A').get('contenido','')}",
-            styles["Normal"]
-        ))
-        elements.append(Paragraph(
-            f"Tel: {datos_compra.get('datosEmpresa', {}).get('telefono', 'N/A').get('contenido','')} | "
-            f"Email: {datos_compra.get('datosEmpresa', {}).get('email', 'N/A').get('contenido','')}",
-            styles["Normal"]
-        ))
-        elements.append(Spacer(1, 35))  
-
-        styles["Heading3"].fontSize = 12
-        styles["Heading3"].fontName = "Helvetica-Bold"
-        elements.append(Paragraph(f"Factura N°: {str(venta_id).zfill(8)}", styles["Heading3"]))
-        
-        styles["Normal"].fontSize = 12
-        styles["Normal"].alignment = 2  
-        elements.append(Paragraph(
-            f"Fecha de Emisión: {timezone.now().strftime('%d/%m/%Y')}",
-            styles["Normal"]
-        ))
-        elements.append(Spacer(1, 10))
-
-        styles["Heading4"].fontSize = 12
-        styles["Heading4"].fontName = "Helvetica-Bold"
-        elements.append(Paragraph("Cliente:", styles["Heading4"]))
-        elements.append(Spacer(1, 5))
-        
-        styles["Normal"].fontSize = 12
-        styles["Normal"].alignment = 0 
-        elements.append(Paragraph(f"Nombre: {datos_compra.get('nombre', 'Desconocido')}", styles["Normal"]))
-        elements.append(Paragraph(f"Teléfono: {datos_compra.get('telefono', 'No disponible')}", styles["Normal"]))
-        elements.append(Paragraph(f"Correo: {datos_compra.get('correo', 'No disponible')}", styles["Normal"]))
-        elements.append(Paragraph(f"Dirección: {datos_compra.get('domicilio', 'No disponible')}", styles["Normal"]))
-        elements.append(Paragraph(f"Ciudad: {datos_compra.get('cityComprador', 'N/A')}", styles["Normal"]))
-        elements.append(Paragraph(f"País/Estado: {datos_compra.get('paisComprador', 'N/A')}", styles["Normal"]))
-        elements.append(Paragraph(f"ID Fiscal: {datos_compra.get('idFiscal', usuario.id or 'No proporcionado')}", styles["Normal"]))
-        elements.append(Spacer(1, 35))
-
-        elements.append(Paragraph("Detalles de Entrega:", styles["Heading4"]))
-        elements.append(Spacer(1, 5))
-        elements.append(Paragraph(f"Método: {datos_compra.get('finalEnvio', 'No disponible')}", styles["Normal"]))
-        elements.append(Paragraph(
-            f"Fecha de Venta: {datos_compra.get('fecha_venta', '').split('T')[0] if datos_compra.get('fecha_venta') else 'No disponible'}",
-            styles["Normal"]
-        ))
-        elements.append(Paragraph(
-            f"Fecha de Entrega: {datos_compra.get('fecha_entrega', '').split('T')[0] if datos_compra.get('fecha_entrega') else 'No disponible'}",
-            styles["Normal"]
-        ))
-        elements.append(Paragraph(f"Horario: {datos_compra.get('horario_entrega', 'No disponible')}", styles["Normal"]))
-        elements.append(Spacer(1, 20))
-
-        elements.append(Table(
-            [['']],
-            colWidths=[page_width],
-            rowHeights=[1],
-            style=TableStyle([('LINEBELOW', (0, 0), (-1, -1), 1, colors.black)])
-        ))
-        elements.append(Spacer(1, 10))
-
-        styles["Heading2"].fontSize = 14
-        styles["Heading2"].fontName = "Helvetica-Bold"
-        elements.append(Paragraph("Detalles de la Compra", styles["Heading2"]))
-        elements.append(Spacer(1, 5))
-
-        productos_data = [["#", "Descripción", "Precio Unitario", "Cantidad", "Subtotal"]]
-        for index, item in enumerate(datos_compra.get('productos', []), 1):
-            precio_unitario = float(item.get('precio_unitario', 0))
-            cantidad = item.get('cantidad', 1)
-            subtotal_item = precio_unitario * cantidad
-            # Obtener atributos de la variante
-            try:
-                variante = Variante.objects.get(id=item.get('producto'))
-                atributos = [
-                    {'nombre': attr.nombre, 'valor': attr.valor}
-                    for attr in variante.atributos.all()
-                ]
-                atributos_str = ", ".join([f"{attr['nombre']}: {attr['valor']}" for attr in atributos]) if atributos else "N/A"
-                nombre_producto = f"{variante.producto.marca.nombre} {variante.producto.nombre}"
-            except Variante.DoesNotExist:
-                atributos_str = "N/A"
-                nombre_producto = item.get('nombre', 'Desconocido')
-
-            productos_data.append([
-                str(index),
-                f"{nombre_producto} ({atributos_str})",
-                f"${precio_unitario:.2f}",
-                str(cantidad),
-                f"${subtotal_item:.2f}"
-            ])
-
-        tabla = Table(productos_data, colWidths=[10*mm, 90*mm, 30*mm, 20*mm, 30*mm])
-        tabla.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.Color(50/255, 50/255, 50/255)),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
-        elements.append(tabla)
-
-        elements.append(Spacer(1, 10))
-        tasa_impuesto = float(datos_compra.get('impuesto', 0)) / 100
-        precio_final_sin_impuesto = float(datos_compra.get('precioFinalSinImpuesto', datos_compra.get('precioFinal', 0)))
-        precio_envio = float(datos_compra.get('precioEnvio', 0))
-        impuesto_valor = precio_final_sin_impuesto * tasa_impuesto
-        total_con_impuestos = float(datos_compra.get('precioFinal', precio_final_sin_impuesto + precio_envio))
-
-        styles["Normal"].fontSize = 12
-        styles["Normal"].alignment = 2  
-        elements.append(Paragraph(f"Subtotal: ${precio_final_sin_impuesto:.2f}", styles["Normal"]))
-        elements.append(Paragraph(f"Envío: ${precio_envio:.2f}", styles["Normal"]))
-        elements.append(Paragraph(f"Impuesto ({tasa_impuesto * 100:.1f}%): ${impuesto_valor:.2f}", styles["Normal"]))
-        styles["Heading2"].fontSize = 12
-        styles["Heading2"].alignment = 2
-        elements.append(Paragraph(f"Total: ${total_con_impuestos:.2f}", styles["Normal"]))
-        moneda = datos_compra.get('datosEmpresa', {}).get('moneda_local', '').get('contenido','')
-        elements.append(Paragraph(f"Moneda: {moneda}", styles["Normal"]))
-        elements.append(Spacer(1, 50))
-
-        styles["Normal"].alignment = 0  
-        elements.append(Paragraph(f"Puntos acumulados: {total_puntos}", styles["Normal"]))
-        elements.append(Spacer(1, 10))
-
-        styles["Normal"].fontSize = 8
-        styles["Normal"].textColor = colors.Color(100/255, 100/255, 100/255)
-        legal_text = (
-            "Este documento es un comprobante fiscal válido. Conservar para fines fiscales.<br/>"
-            f"Emitido conforme a las leyes fiscales aplicables en {datos_compra.get('datosEmpresa', {}).get('pais', 'N/A')}.<br/>"
-            "Para reclamos, contactar a info@empresa.com dentro de los 30 días posteriores a la emisión."
-        )
-        elements.append(Paragraph(legal_text, styles["Normal"]))
-
-        doc.build(elements)
-
-        pdf_name = f"Factura_{str(venta_id).zfill(8)}.pdf"
-        buffer.seek(0)
-        venta.comprobante_pdf.save(pdf_name, File(buffer), save=True)
-
-        email = EmailMessage(
-            subject=f"Factura #{venta_id}",
-            body=f"Hola {datos_compra.get('nombre', usuario.username)},\n\nAdjuntamos el comprobante de tu compra (Factura #{venta_id}).\n\nGracias por tu compra!",
-            from_email=os.getenv('EMAIL_HOST'),
-            to=[datos_compra.get('correo', usuario.email)],
-        )
-        email.attach(f"Factura_{str(venta_id).zfill(8)}.pdf", buffer.getvalue(), "application/pdf")
-        email.send()
-
-        pdf_url = request.build_absolute_uri(venta.comprobante_pdf.url)
-        
-        logger.info(f"PDF enviado con éxito para la venta #{venta_id} a {datos_compra.get('correo', usuario.email)}")
-        return JsonResponse({"pdf_url": pdf_url}, status=200)
-
-    except Venta.DoesNotExist:
-        logger.error(f"Venta con ID {venta_id} no encontrada")
-        return JsonResponse({"error": "Venta no encontrada"}, status=404)
-    except ValueError as ve:
-        logger.error(f"Error de conversión de valores: {str(ve)}")
-        return JsonResponse({"error": "Datos numéricos inválidos enviados desde el frontend"}, status=400)
-    except Exception as e:
-        logger.error(f"Error al enviar PDF: {str(e)}")
-        return JsonResponse({"error": "Ocurrió un error al procesar la solicitud"}, status=500)
+# crear_preferencia, webhook_mp y verificar_pago son async: bajo ASGI (gunicorn_asgi.conf.py)
+# la espera a Mercado Pago/PayPal no ocupa un worker. El ORM y la caché se usan con su API
+# async y los servicios transaccionales van por sync_to_async.
 
 @csrf_exempt
-def crear_preferencia(request):
+async def crear_preferencia(request):
     if request.method == "POST":
         try:
             data = json.loads(request.body)
@@ -436,305 +301,117 @@ def crear_preferencia(request):
             items = data.get("items", [])
             total = data.get("total", "")
             country = data.get("country", "AR")
-
-            if country in ["AR", "BR", "MX", "CO"]:
-                return crear_preferencia_mercadopago(email_usuario, items, total, country)
-            else:
-                return crear_preferencia_paypal(email_usuario, items, total, country)
-
+            # [{"producto_atributo_id", "cantidad"}]: si vienen, se reservan hasta que se confirme el pago
+            cantidades = StockService.agrupar(
+                (int(p["producto_atributo_id"]), int(p["cantidad"])) for p in data.get("productos") or []
+            )
+            if any(cantidad < 1 for cantidad in cantidades.values()):
+                raise ValueError("cantidad")
         except json.JSONDecodeError:
             return JsonResponse({"error": "Datos JSON inválidos"}, status=400)
+        except (KeyError, TypeError, ValueError):
+            return JsonResponse({"error": "productos debe ser una lista de {producto_atributo_id, cantidad}"}, status=400)
+
+        referencia = vence = None
+        try:
+            if cantidades:
+                referencia, vence = await sync_to_async(ReservaService.reservar)(cantidades)
+            response = await crear_preferencia_pasarela(email_usuario, items, total, country, referencia)
+        except StockInsuficiente as e:
+            return JsonResponse({"error": str(e), "producto_atributo_id": e.producto_atributo_id}, status=409)
         except Exception as e:
-            return JsonResponse({"error": str(e)}, status=500)
+            response = JsonResponse({"error": str(e)}, status=500)
+
+        if referencia:
+            if response.status_code >= 400:
+                await sync_to_async(ReservaService.liberar)(referencia)
+            else:
+                contenido = json.loads(response.content)
+                response = JsonResponse({**contenido, "referencia": referencia, "reserva_vence": vence.isoformat()})
+        return response
     return JsonResponse({"error": "Método no permitido"}, status=405)
 
-def crear_preferencia_mercadopago(email, items, total, country):
-    preference_data = {
-        "items": [
-            {
-                "title": "Productos en Tienda Sollu-store",
-                "quantity": 1,
-                "unit_price": float(total),
-                "currency_id": "ARS" if country == "AR" else "BRL" if country == "BR" else "MXN"
-            },
-            {
-                "title": "Productos en Tienda Sollu-store",
-                "quantity": 1,
-                "unit_price": 0,
-                "currency_id": "ARS" if country == "AR" else "BRL" if country == "BR" else "MXN"
-            }
-        ],
-        "payer": {"email": email},
-        "back_urls": {
-            "success": f'{os.getenv("URL_FRONTEND")}/pago-exitoso',
-            "failure": f'{os.getenv("URL_FRONTEND")}/pago-fallido',
-            "pending": f'{os.getenv("URL_FRONTEND")}/pago-pendiente'
-        },
-        "auto_return": "approved"
-    }
-    preference_response = sdk.preference().create(preference_data)
-    if "response" in preference_response and "init_point" in preference_response["response"]:
-        return JsonResponse({"init_point": preference_response["response"]["init_point"]})
-    else:
-        return JsonResponse({"error": "Error al generar la preferencia en Mercado Pago"}, status=500)
-
-def crear_preferencia_paypal(email, items, total, country):
+async def crear_preferencia_pasarela(email, items, total, country, referencia=None):
+    clave = "init_point" if country in PAISES_MERCADOPAGO else "payment_url"
     try:
-        payment = paypalrestsdk.Payment({
-            "intent": "sale",
-            "payer": {"payment_method": "paypal"},
-            "transactions": [{
-                "amount": {
-                    "total": str(total),
-                    "currency": "USD"
-                },
-                "description": ", ".join(items)
-            }],
-            "redirect_urls": {
-                "return_url": f'{os.getenv("URL_FRONTEND")}/pago-exitoso',
-                "cancel_url": f'{os.getenv("URL_FRONTEND")}/pago-fallido'
-            }
-        })
-        if payment.create():
-            for link in payment.links:
-                if link.method == "REDIRECT":
-                    return JsonResponse({"payment_url": link.href})
-        else:
-            return JsonResponse({"error": payment.error}, status=500)
-    except Exception as e:
-        return JsonResponse({"error": str(e)}, status=500)
+        url = await pasarela_para_pais(country).acrear_preferencia(email, items, total, country, referencia)
+    except ErrorPasarela as e:
+        logger.warning(f"No se pudo crear la preferencia de pago: {e}")
+        # CircuitoAbierto -> 503; timeouts y errores del proveedor -> 502/504
+        return JsonResponse({"error": str(e)}, status=e.status if e.status in (503, 504) else 502)
+    return JsonResponse({clave: url})
 
 @csrf_exempt
-def webhook_mp(request):
+async def webhook_mp(request):
+    # Solo se guarda la notificación; la consulta a Mercado Pago, el Pago y la venta los
+    # procesa el worker (manage.py procesar_tareas --tipo pago_mp)
     if request.method == "POST":
-        data = json.loads(request.body)
-        payment_id = data.get("data", {}).get("id", None)
-        if payment_id:
-            payment_info = sdk.payment().get(payment_id)
-            if "response" in payment_info:
-                payment_status = payment_info["response"]["status"]
-                status_detail = payment_info["response"]["status_detail"]
-                email_cliente = payment_info["response"]["payer"]["email"]
-                monto = payment_info["response"]["transaction_amount"]
-                logger.info(f"Pago recibido: ID {payment_id}, Status {payment_status}, Monto {monto}")
+        try:
+            data = json.loads(request.body or b"{}")
+        except json.JSONDecodeError:
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+        # MP notifica por cuerpo ({"type": "payment", "data": {"id": ..}}) o por query string (IPN)
+        tipo = data.get("type") or data.get("topic") or request.GET.get("type") or request.GET.get("topic")
+        payment_id = (data.get("data") or {}).get("id") or request.GET.get("data.id") or request.GET.get("id")
+        if payment_id and tipo in (None, "payment"):
+            tarea = await sync_to_async(PagoService.registrar_notificacion)(payment_id, data)
+            logger.info(f"Notificación de pago {payment_id} encolada (tarea #{tarea.id})")
         return JsonResponse({"status": "received"}, status=200)
     return JsonResponse({"error": "Método no permitido"}, status=405)
 
-def verificar_pago(request):
+async def verificar_pago(request):
+    # Se responde con el Pago local (ver PagoService.verificar); el frontend puede consultar seguido
     payment_id = request.GET.get('payment_id')
-    preference_id = request.GET.get('preference_id')
-    payment_info = sdk.payment().get(payment_id)
-    if payment_info["status"] == "approved":
-        return JsonResponse({"status": "success"})
-    else:
-        return JsonResponse({"status": "failure"})
+    if not payment_id or not payment_id.isdigit():
+        return JsonResponse({"error": "payment_id inválido"}, status=400)
+    pago = await PagoService.averificar(payment_id)
+    return JsonResponse({
+        "status": "success" if pago["status"] == "approved" else "failure",
+        "pago_status": pago["status"],
+    })
 
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def enviar_pdf(request):
-    try:
-        usuario = request.user
-        if not usuario.is_authenticated:
-            return JsonResponse({"error": "Usuario no autenticado"}, status=401)
+    usuario = request.user
+    data = request.data
+    venta_id = data.get('venta_id')
+    # La factura se arma con los datos guardados de la venta; de `datos_compra` solo se toma
+    # el correo, para ventas hechas sin cuenta
+    datos_compra = data.get('datos_compra') or {}
 
-        data = request.data
-        venta_id = data.get('venta_id')
-        datos_compra = data.get('datos_compra')
-        total_puntos = data.get('total_puntos', 0)
-
-        if not venta_id or not datos_compra:
-            return JsonResponse({"error": "Se requieren venta_id y datos_compra"}, status=400)
+    if not venta_id:
+        return JsonResponse({"error": "Se requiere venta_id"}, status=400)
 
+    try:
         venta = Venta.objects.get(id=venta_id)
-        
-        if not usuario.is_staff and venta.comprador != usuario:
-            return JsonResponse({"error": "No tienes permiso para esta venta"}, status=403)
-
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=A4,
-            rightMargin=8*mm,
-            leftMargin=8*mm,
-            topMargin=8*mm,
-            bottomMargin=8*mm
-        )
-        styles = getSampleStyleSheet()
-        elements = []
-
-        page_width = doc.width 
-        y_position = 0
-
-        elements.append(Spacer(1, y_position))  
-        styles["Title"].fontSize = 12
-        styles["Title"].textColor = colors.black
-        styles["Title"].fontName = "Helvetica-Bold"
-        elements.append(Paragraph("Factura Fiscal", styles["Title"]))
-        
-        styles["Heading1"].fontSize = 20
-        styles["Heading1"].alignment = 2  
-        elements.append(Paragraph(
-            datos_compra.get('datosEmpresa', {}).get('nombre', '').get('contenido',''),
-            styles["Heading1"]
-        ))
-        
-        styles["Normal"].fontSize = 10
-        styles["Normal"].alignment = 2  
-        elements.append(Paragraph(
-            f"Dirección: {datos_compra.get('datosEmpresa', {}).get('direccion', 'N/A').get('contenido','')}, "
-            f"{datos_compra.get('datosEmpresa', {}).get('ciudad', 'N/A').get('contenido','')}, "
-            f"{datos_compra.get('datosEmpresa', {}).get('pais', 'N/A').get('contenido','')}",
-            styles["Normal"]
-        ))
-        elements.append(Paragraph(
-            f"Tel: {datos_compra.get('datosEmpresa', {}).get('telefono', 'N/A').get('contenido','')} | "
-            f"Email: {datos_compra.get('datosEmpresa', {}).get('email', 'N/A').get('contenido','')}",
-            styles["Normal"]
-        ))
-        elements.append(Spacer(1, 35))  
-
-        styles["Heading3"].fontSize = 12
-        styles["Heading3"].fontName = "Helvetica-Bold"
-        elements.append(Paragraph(f"Factura N°: {str(venta_id).zfill(8)}", styles["Heading3"]))
-        
-        styles["Normal"].fontSize = 12
-        styles["Normal"].alignment = 2  
-        elements.append(Paragraph(
-            f"Fecha de Emisión: {timezone.now().strftime('%d/%m/%Y')}",
-            styles["Normal"]
-        ))
-        elements.append(Spacer(1, 10))
-
-        styles["Heading4"].fontSize = 12
-        styles["Heading4"].fontName = "Helvetica-Bold"
-        elements.append(Paragraph("Cliente:", styles["Heading4"]))
-        elements.append(Spacer(1, 5))
-        
-        styles["Normal"].fontSize = 12
-        styles["Normal"].alignment = 0 
-        elements.append(Paragraph(f"Nombre: {datos_compra.get('nombre', 'Desconocido')}", styles["Normal"]))
-        elements.append(Paragraph(f"Teléfono: {datos_compra.get('telefono', 'No disponible')}", styles["Normal"]))
-        elements.append(Paragraph(f"Correo: {datos_compra.get('correo', 'No disponible')}", styles["Normal"]))
-        elements.append(Paragraph(f"Dirección: {datos_compra.get('domicilio', 'No disponible')}", styles["Normal"]))
-        elements.append(Paragraph(f"Ciudad: {datos_compra.get('cityComprador', 'N/A')}", styles["Normal"]))
-        elements.append(Paragraph(f"País/Estado: {datos_compra.get('paisComprador', 'N/A')}", styles["Normal"]))
-        elements.append(Paragraph(f"ID Fiscal: {datos_compra.get('idFiscal', usuario.id or 'No proporcionado')}", styles["Normal"]))
-        elements.append(Spacer(1, 35))
-
-        elements.append(Paragraph("Detalles de Entrega:", styles["Heading4"]))
-        elements.append(Spacer(1, 5))
-        elements.append(Paragraph(f"Método: {datos_compra.get('finalEnvio', 'No disponible')}", styles["Normal"]))
-        elements.append(Paragraph(
-            f"Fecha de Venta: {datos_compra.get('fecha_venta', '').split('T')[0] if datos_compra.get('fecha_venta') else 'No disponible'}",
-            styles["Normal"]
-        ))
-        elements.append(Paragraph(
-            f"Fecha de Entrega: {datos_compra.get('fecha_entrega', '').split('T')[0] if datos_compra.get('fecha_entrega') else 'No disponible'}",
-            styles["Normal"]
-        ))
-        elements.append(Paragraph(f"Horario: {datos_compra.get('horario_entrega', 'No disponible')}", styles["Normal"]))
-        elements.append(Spacer(1, 20))
-
-        elements.append(Table(
-            [['']],
-            colWidths=[page_width],
-            rowHeights=[1],
-            style=TableStyle([('LINEBELOW', (0, 0), (-1, -1), 1, colors.black)])
-        ))
-        elements.append(Spacer(1, 10))
-
-        styles["Heading2"].fontSize = 14
-        styles["Heading2"].fontName = "Helvetica-Bold"
-        elements.append(Paragraph("Detalles de la Compra", styles["Heading2"]))
-        elements.append(Spacer(1, 5))
-
-        productos_data = [["#", "Descripción", "Precio Unitario", "Cantidad", "Subtotal"]]
-        for index, item in enumerate(datos_compra.get('productos', []), 1):
-            precio_unitario = float(item.get('precio_unitario', 0))
-            cantidad = item.get('cantidad', 1)
-            subtotal_item = precio_unitario * cantidad
-            atributos = item.get('atributos', [])
-            atributos_str = ", ".join([f"{attr['nombre']}: {attr['valor']}" for attr in atributos]) if atributos else "N/A"
-            productos_data.append([
-                str(index),
-                f"{item.get('nombre', 'Desconocido')} ({atributos_str})",
-                f"${precio_unitario:.2f}",
-                str(cantidad),
-                f"${subtotal_item:.2f}"
-            ])
-
-        tabla = Table(productos_data, colWidths=[10*mm, 90*mm, 30*mm, 20*mm, 30*mm])
-        tabla.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.Color(50/255, 50/255, 50/255)),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
-        elements.append(tabla)
-
-        elements.append(Spacer(1, 10))
-        tasa_impuesto = float(datos_compra.get('impuesto', 0)) / 100
-        precio_final_sin_impuesto = float(datos_compra.get('precioFinalSinImpuesto', datos_compra.get('precioFinal', 0)))
-        precio_envio = float(datos_compra.get('precioEnvio', 0))
-        impuesto_valor = precio_final_sin_impuesto * tasa_impuesto
-        total_con_impuestos = float(datos_compra.get('precioFinal', precio_final_sin_impuesto + precio_envio))
-
-        styles["Normal"].fontSize = 12
-        styles["Normal"].alignment = 2  
-        elements.append(Paragraph(f"Subtotal: ${precio_final_sin_impuesto:.2f}", styles["Normal"]))
-        elements.append(Paragraph(f"Envío: ${precio_envio:.2f}", styles["Normal"]))
-        elements.append(Paragraph(f"Impuesto ({tasa_impuesto * 100:.1f}%): ${impuesto_valor:.2f}", styles["Normal"]))
-        styles["Heading2"].fontSize = 12
-        styles["Heading2"].alignment = 2
-        elements.append(Paragraph(f"Total: ${total_con_impuestos:.2f}", styles["Normal"]))
-        moneda = datos_compra.get('datosEmpresa', {}).get('moneda_local', '').get('contenido','')
-        elements.append(Paragraph(f"Moneda: {moneda}", styles["Normal"]))
-        elements.append(Spacer(1, 50))
-
-        styles["Normal"].alignment = 0  
-        elements.append(Paragraph(f"Puntos acumulados: {total_puntos}", styles["Normal"]))
-        elements.append(Spacer(1, 10))
-
-        styles["Normal"].fontSize = 8
-        styles["Normal"].textColor = colors.Color(100/255, 100/255, 100/255)
-        legal_text = (
-            "Este documento es un comprobante fiscal válido. Conservar para fines fiscales.<br/>"
-            f"Emitido conforme a las leyes fiscales aplicables en {datos_compra.get('datosEmpresa', {}).get('pais', 'N/A')}.<br/>"
-            "Para reclamos, contactar a info@empresa.com dentro de los 30 días posteriores a la emisión."
-        )
-        elements.append(Paragraph(legal_text, styles["Normal"]))
-
-        doc.build(elements)
-
-        pdf_name = f"Factura_{str(venta_id).zfill(8)}.pdf"
-        buffer.seek(0)
-        venta.comprobante_pdf.save(pdf_name, File(buffer), save=True)
-
-        email = EmailMessage(
-            subject=f"Factura #{venta_id}",
-            body=f"Hola {datos_compra.get('nombre', usuario.username)},\n\nAdjuntamos el comprobante de tu compra (Factura #{venta_id}).\n\nGracias por tu compra!",
-            from_email=os.getenv('EMAIL_HOST'),
-            to=[datos_compra.get('correo', usuario.email)],
-        )
-        email.attach(f"Factura_{str(venta_id).zfill(8)}.pdf", buffer.getvalue(), "application/pdf")
-        email.send()
-
-        pdf_url = request.build_absolute_uri(venta.comprobante_pdf.url)
-        
-        logger.info(f"PDF enviado con éxito para la venta #{venta_id} a {datos_compra.get('correo', usuario.email)}")
-        return JsonResponse({"pdf_url": pdf_url}, status=200)
-
     except Venta.DoesNotExist:
         logger.error(f"Venta con ID {venta_id} no encontrada")
         return JsonResponse({"error": "Venta no encontrada"}, status=404)
-    except ValueError as ve:
-        logger.error(f"Error de conversión de valores: {str(ve)}")
-        return JsonResponse({"error": "Datos numéricos inválidos enviados desde el frontend"}, status=400)
-    except Exception as e:
-        logger.error(f"Error al enviar PDF: {str(e)}")
-        return JsonResponse({"error": "Ocurrió un error al procesar la solicitud"}, status=500)
\ No newline at end of file
+
+    if not usuario.is_staff and venta.comprador != usuario:
+        return JsonResponse({"error": "No tienes permiso para esta venta"}, status=403)
+
+    # El render y la subida a S3 los hace el worker (manage.py procesar_tareas); el mail, enviar_correos
+    tarea = FacturaService.encolar(venta, usuario, correo=datos_compra.get('correo'))
+    return JsonResponse({"tarea_id": tarea.id, "estado": tarea.estado}, status=202)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def estado_tarea(request, tarea_id):
+    tarea = get_object_or_404(Tarea, id=tarea_id)
+    if not request.user.is_staff and tarea.usuario_id != request.user.id:
+        return JsonResponse({"error": "No tienes permiso para esta tarea"}, status=403)
+    return JsonResponse({
+        "id": tarea.id,
+        "tipo": tarea.tipo,
+        "estado": tarea.estado,
+        "progreso": tarea.progreso,
+        "intentos": tarea.intentos,
+        "resultado": tarea.resultado,
+        "error": tarea.error,
+    })
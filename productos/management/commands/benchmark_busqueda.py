@@ -0,0 +1,105 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from productos.models.producto import Producto, ProductoAtributo, Marca, TipoProducto, Atributo
+from productos.services.busqueda_service import BusquedaService
+
+PRENDAS = ['remera', 'pantalón', 'buzo', 'campera', 'camisa', 'vestido', 'pollera', 'short', 'jean', 'chaleco']
+ESTILOS = ['oversize', 'slim', 'clásico', 'deportivo', 'básico', 'estampado', 'rayado', 'liso', 'vintage', 'urbano']
+COLORES = ['negro', 'blanco', 'rojo', 'azul', 'verde', 'gris', 'beige', 'rosa', 'amarillo', 'bordó']
+TALLES = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
+PALABRAS = ['algodón', 'lino', 'suave', 'cómodo', 'verano', 'invierno', 'liviano', 'abrigado', 'elastizado', 'premium']
+CONSULTAS = [
+    'remera negra', 'pantalón azul', 'campera abrigada', 'buzo oversize', 'vestido verano',
+    'jean slim', 'camisa lino', 'remra', 'pantalom', 'canpera', 'bzuo gris', 'Marca Bench 7',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera un catálogo sintético y mide /productos/buscar/ contra un filtro icontains. "
+        "Requiere Postgres; por defecto todo corre en una transacción que se revierte al final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=100_000, help="Tamaño del catálogo sintético")
+        parser.add_argument('--repeticiones', type=int, default=5, help="Veces que se ejecuta cada consulta")
+        parser.add_argument('--conservar', action='store_true', help="Confirmar los datos sintéticos en vez de revertirlos")
+
+    def handle(self, *args, **options):
+        if not BusquedaService.disponible():
+            raise CommandError("El benchmark de búsqueda necesita Postgres (tsvector y pg_trgm).")
+
+        random.seed(42)
+        with transaction.atomic():
+            inicio = time.perf_counter()
+            self.crear_catalogo(options['productos'])
+            self.stdout.write(f"Catálogo de {options['productos']} productos creado en {time.perf_counter() - inicio:.1f}s")
+
+            self.stdout.write(f"{'Consulta':<20} {'Resultados':>10} {'buscar p50':>11} {'p95':>8} {'icontains p50':>14} {'p95':>8}")
+            for consulta in CONSULTAS:
+                resultados, tiempos_busqueda = self.medir(
+                    lambda: BusquedaService.buscar(consulta).order_by('-relevancia', '-id').values_list('id', flat=True)[:24],
+                    options['repeticiones'],
+                )
+                _, tiempos_icontains = self.medir(
+                    lambda: Producto.objects.filter(
+                        Q(nombre__icontains=consulta) | Q(descripcion__icontains=consulta)
+                    ).order_by('-id').values_list('id', flat=True)[:24],
+                    options['repeticiones'],
+                )
+                self.stdout.write(
+                    f"{consulta:<20} {resultados:>10} {self.p(tiempos_busqueda, 50):>9.1f}ms {self.p(tiempos_busqueda, 95):>6.1f}ms "
+                    f"{self.p(tiempos_icontains, 50):>12.1f}ms {self.p(tiempos_icontains, 95):>6.1f}ms"
+                )
+
+            if not options['conservar']:
+                transaction.set_rollback(True)
+
+    def crear_catalogo(self, cantidad):
+        marcas = Marca.objects.bulk_create([Marca(nombre=f'Marca Bench {i}') for i in range(50)])
+        tipos = TipoProducto.objects.bulk_create([TipoProducto(nombre=f'{prenda} bench') for prenda in PRENDAS])
+        atributos = Atributo.objects.bulk_create([
+            Atributo(nombre='Talle Bench', valor=f'{talle} {color}') for talle in TALLES for color in COLORES
+        ])
+        primer_id = None
+        for desde in range(0, cantidad, 5000):
+            productos = Producto.objects.bulk_create([
+                Producto(
+                    nombre=f'{random.choice(PRENDAS)} {random.choice(ESTILOS)} {random.choice(COLORES)}',
+                    modelo_talle=f'BENCH-{i}',
+                    descripcion=' '.join(random.choices(PALABRAS, k=12)),
+                    precio=random.randint(1000, 90000),
+                    marca=random.choice(marcas),
+                    tipo=random.choice(tipos),
+                    categoria=None,
+                )
+                for i in range(desde, min(desde + 5000, cantidad))
+            ])
+            primer_id = primer_id or productos[0].id
+            ProductoAtributo.objects.bulk_create([
+                ProductoAtributo(producto=producto, atributo=atributo, stock=random.randint(0, 20))
+                for producto in productos for atributo in random.sample(atributos, 2)
+            ])
+        BusquedaService.actualizar_vectores(Producto.objects.filter(id__gte=primer_id).values('id'))
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Producto._meta.db_table}')
+
+    @staticmethod
+    def medir(consulta, repeticiones):
+        tiempos = []
+        resultados = 0
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            resultados = len(list(consulta()))
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        return resultados, tiempos
+
+    @staticmethod
+    def p(tiempos, percentil):
+        if len(tiempos) == 1:
+            return tiempos[0]
+        return statistics.quantiles(tiempos, n=100, method='inclusive')[percentil - 1]
@@ -0,0 +1,61 @@
+import time
+import tracemalloc
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from productos.models.producto import Producto
+from productos.models.venta import Venta, DetalleVenta
+from productos.services.factura_renderer import FacturaRenderer
+
+EMPRESA_EJEMPLO = {
+    'nombre': 'Sollu Store', 'direccion': 'Av. Siempre Viva 742', 'ciudad': 'Córdoba', 'pais': 'Argentina',
+    'telefono': '351 000 0000', 'email': 'info@empresa.com', 'moneda_local': 'ARS', 'impuesto': '21',
+}
+
+
+class Command(BaseCommand):
+    help = "Mide facturas/segundo y pico de memoria del renderer de facturas (no usa la base de datos)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lineas', type=int, nargs='+', default=[1, 50, 500], help="Líneas por pedido a medir")
+        parser.add_argument('--facturas', type=int, default=20, help="Facturas a generar por tamaño de pedido")
+
+    def venta_ejemplo(self, lineas):
+        venta = Venta(
+            id=1, comprador_sin_cuenta='Cliente de prueba', domicilio='Calle Falsa 123',
+            fecha_venta=timezone.now(), horario_entrega='9 a 18', puntos_club_acumulados=10,
+        )
+        producto = Producto(nombre='Remera básica')
+        detalles = [
+            DetalleVenta(
+                producto=producto, combinacion=[{'tipo': 'Talle', 'valor': 'M'}, {'tipo': 'Color', 'valor': 'Negro'}],
+                cantidad=2, precio_unitario=Decimal('1500.00'), subtotal=Decimal('3000.00'),
+            )
+            for _ in range(lineas)
+        ]
+        venta.precio_total = sum(detalle.subtotal for detalle in detalles)
+        return venta, detalles
+
+    def handle(self, *args, **options):
+        cantidad = options['facturas']
+        self.stdout.write(f"{'Líneas':>8} {'Facturas/s':>12} {'ms/factura':>12} {'KB por PDF':>12} {'Pico MB':>10}")
+        for lineas in options['lineas']:
+            venta, detalles = self.venta_ejemplo(lineas)
+            # Primera factura fuera de la medición: carga de fuentes y módulos de reportlab
+            FacturaRenderer.renderizar(venta, EMPRESA_EJEMPLO, detalles)
+
+            inicio = time.perf_counter()
+            for _ in range(cantidad):
+                FacturaRenderer.renderizar(venta, EMPRESA_EJEMPLO, detalles)
+            duracion = time.perf_counter() - inicio
+
+            # La memoria se mide aparte: tracemalloc hace mucho más lento el render
+            tracemalloc.start()
+            tamanio = len(FacturaRenderer.renderizar(venta, EMPRESA_EJEMPLO, detalles))
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            self.stdout.write(
+                f"{lineas:>8} {cantidad / duracion:>12.1f} {duracion / cantidad * 1000:>12.1f} "
+                f"{tamanio / 1024:>12.1f} {pico / 1024 / 1024:>10.2f}"
+            )
@@ -0,0 +1,37 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from productos.services.correo_service import CORREO_LOTE, CorreoService
+
+
+class Command(BaseCommand):
+    help = "Worker de la bandeja de salida: envía los correos pendientes por SMTP respetando el cupo del proveedor"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=CORREO_LOTE, help="Correos por conexión SMTP")
+        parser.add_argument('--intervalo', type=float, default=5.0, help="Segundos de espera cuando no hay nada que enviar")
+        parser.add_argument('--una-vez', action='store_true', help="Enviar lo pendiente y salir")
+        parser.add_argument('--reintentar-fallidos', action='store_true', help="Volver a encolar los correos fallidos antes de empezar")
+        parser.add_argument('--tipo', help="Con --reintentar-fallidos, solo los de este tipo")
+        parser.add_argument('--metricas', action='store_true', help="Mostrar las métricas de la bandeja (JSON) y salir")
+
+    def handle(self, *args, **options):
+        if options['metricas']:
+            self.stdout.write(json.dumps(CorreoService.metricas()))
+            return
+        if options['reintentar_fallidos']:
+            self.stdout.write(f"{CorreoService.reintentar_fallidos(options['tipo'])} correos fallidos reencolados")
+
+        self.stdout.write("Worker de correos iniciado")
+        while True:
+            close_old_connections()
+            resumen = CorreoService.enviar_lote(options['lote'])
+            procesados = resumen['enviados'] + resumen['fallidos']
+            if procesados:
+                self.stdout.write(f"{resumen['enviados']} correos enviados, {resumen['fallidos']} con error")
+
+            if options['una_vez'] and not procesados:
+                break
+            if not procesados:
+                time.sleep(options['intervalo'])
@@ -0,0 +1,20 @@
+import sys
+from django.core.management.base import BaseCommand
+from productos.services.importacion_service import ImportacionService
+
+
+class Command(BaseCommand):
+    help = "Exporta el catálogo (productos y stock por atributo) en CSV o JSONL, en el mismo formato que importa importar_productos"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formato', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--salida', help="Archivo de salida (por defecto stdout)")
+
+    def handle(self, *args, **options):
+        salida = open(options['salida'], 'w', encoding='utf-8', newline='') if options['salida'] else sys.stdout
+        try:
+            for parte in ImportacionService.exportar(options['formato']):
+                salida.write(parte)
+        finally:
+            if options['salida']:
+                salida.close()
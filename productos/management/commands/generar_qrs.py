@@ -0,0 +1,98 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import django
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from productos.services.qr_service import QrService, renderizar_qr
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera los QR de los productos que no lo tienen: render en un pool de procesos y "
+        "subida a S3 desde un pool de hilos alimentado por una cola acotada"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=os.cpu_count() or 2, help="Procesos que renderizan PNGs")
+        parser.add_argument('--hilos', type=int, default=8, help="Hilos que suben a S3")
+        parser.add_argument('--cola', type=int, default=100, help="PNGs renderizados en espera de subida como máximo")
+        parser.add_argument('--limite', type=int, help="Procesar como máximo esta cantidad de productos")
+
+    def handle(self, *args, **options):
+        ids = list(QrService.sin_qr().order_by('id').values_list('id', flat=True)[:options['limite']])
+        if not ids:
+            self.stdout.write("Todos los productos ya tienen QR.")
+            return
+        self.stdout.write(f"Generando {len(ids)} QR...")
+
+        cola = queue.Queue(maxsize=options['cola'])
+        self.subidos = 0
+        self.errores = 0
+        self.lock = threading.Lock()
+        hilos = [threading.Thread(target=self.subir, args=(cola,), daemon=True) for _ in range(options['hilos'])]
+        for hilo in hilos:
+            hilo.start()
+
+        inicio = time.perf_counter()
+        # Los procesos hijos no usan la base; se cierran las conexiones para no compartirlas al hacer fork
+        connections.close_all()
+        ventana = options['procesos'] * 4
+        with ProcessPoolExecutor(max_workers=options['procesos'], initializer=django.setup) as pool:
+            pendientes = set()
+            for producto_id in ids:
+                pendientes.add(pool.submit(renderizar_qr, producto_id))
+                if len(pendientes) >= ventana:
+                    hechos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+                    self.encolar(hechos, cola)
+            while pendientes:
+                hechos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+                self.encolar(hechos, cola)
+        renderizado = time.perf_counter() - inicio
+
+        for _ in hilos:
+            cola.put(None)
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.perf_counter() - inicio
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{self.subidos} QR subidos en {duracion:.1f}s ({self.subidos / duracion:.1f}/s; "
+            f"render {len(ids) / renderizado:.1f}/s), {self.errores} errores"
+        ))
+
+    def encolar(self, hechos, cola):
+        for futuro in hechos:
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                logger.error(f"Error al renderizar QR: {e}")
+                with self.lock:
+                    self.errores += 1
+                continue
+            # put() bloquea si la cola está llena: el render espera a que las subidas avancen
+            cola.put(resultado)
+
+    def subir(self, cola):
+        try:
+            while True:
+                item = cola.get()
+                if item is None:
+                    return
+                producto_id, png = item
+                try:
+                    QrService.guardar(producto_id, png)
+                except Exception as e:
+                    logger.error(f"Error al subir QR del producto {producto_id}: {e}")
+                    with self.lock:
+                        self.errores += 1
+                else:
+                    with self.lock:
+                        self.subidos += 1
+        finally:
+            connection.close()
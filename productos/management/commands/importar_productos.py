@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from productos.services.importacion_service import ImportacionService, TAMANIO_LOTE
+
+
+class Command(BaseCommand):
+    help = "Importa productos y stock por atributo desde un CSV o JSONL (upsert por nombre + modelo_talle)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="Ruta del archivo .csv o .jsonl")
+        parser.add_argument('--formato', choices=['csv', 'jsonl'], help="Por defecto se toma de la extensión")
+        parser.add_argument('--lote', type=int, default=TAMANIO_LOTE, help="Productos por lote/transacción")
+
+    def handle(self, *args, **options):
+        try:
+            formato = ImportacionService.formato(options['archivo'], options['formato'])
+            archivo = open(options['archivo'], 'rb')
+        except (ValueError, OSError) as e:
+            raise CommandError(str(e))
+
+        inicio = time.perf_counter()
+        with archivo:
+            resultado = ImportacionService.importar(ImportacionService.leer(archivo, formato), options['lote'])
+        duracion = time.perf_counter() - inicio
+
+        for error in resultado.errores:
+            self.stderr.write(f"Línea {error['linea']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado.productos} productos y {resultado.atributos} atributos importados en {duracion:.1f}s "
+            f"({resultado.productos / duracion if duracion else 0:.0f} productos/s), "
+            f"{resultado.filas_con_error} filas con error"
+        ))
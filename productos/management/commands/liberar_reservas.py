@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from productos.services.reserva_service import RESERVA_HISTORIAL_DIAS, ReservaService
+from productos.services.tareas_service import TareaService
+
+
+class Command(BaseCommand):
+    help = "Libera en bloque las reservas de stock vencidas, borra las cerradas antiguas y los candados vencidos (cron o --intervalo)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=RESERVA_HISTORIAL_DIAS, help="Días de historial a conservar")
+        parser.add_argument('--intervalo', type=float, help="Repetir cada tantos segundos en lugar de salir")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            liberadas = ReservaService.liberar_vencidas()
+            borradas = ReservaService.purgar(options['dias'])
+            TareaService.purgar_candados()
+            self.stdout.write(f"{liberadas} reservas liberadas, {borradas} borradas")
+            if not options['intervalo']:
+                break
+            time.sleep(options['intervalo'])
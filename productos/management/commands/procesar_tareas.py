@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from productos.services.tareas_service import TareaService
+
+
+class Command(BaseCommand):
+    help = "Worker de la cola de tareas en base de datos (facturas PDF, etc.)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tipo', action='append', dest='tipos', help="Procesar solo este tipo de tarea (repetible)")
+        parser.add_argument('--lote', type=int, default=10, help="Tareas a reclamar por vuelta")
+        parser.add_argument('--intervalo', type=float, default=2.0, help="Segundos de espera cuando no hay tareas")
+        parser.add_argument('--una-vez', action='store_true', help="Procesar lo pendiente y salir")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Worker de tareas iniciado")
+        while True:
+            close_old_connections()
+            tareas = TareaService.reclamar(limite=options['lote'], tipos=options['tipos'])
+            for tarea in tareas:
+                tarea = TareaService.ejecutar(tarea)
+                self.stdout.write(f"Tarea #{tarea.id} ({tarea.tipo}): {tarea.estado}")
+
+            if options['una_vez'] and not tareas:
+                break
+            if not tareas:
+                time.sleep(options['intervalo'])
@@ -0,0 +1,91 @@
+import asyncio
+import random
+import statistics
+import time
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+
+# (peso, nombre, método, ruta, cuerpo): mezcla de endpoints de I/O externo. Los ids de pago se
+# toman de un rango acotado, así el webhook deduplica y verificar_pago ejercita su caché.
+MEZCLA = [
+    (6, 'verificar-pago', 'GET', lambda n: f'/verificar-pago/?payment_id={n}', None),
+    (2, 'webhook', 'POST', lambda n: '/webhook/', lambda n: {'type': 'payment', 'data': {'id': str(n)}}),
+    (2, 'pago', 'POST', lambda n: '/pago/', lambda n: {'email': 'carga@example.com', 'items': [], 'total': 100, 'country': 'AR'}),
+]
+PAGOS_DISTINTOS = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga HTTP con la mezcla de endpoints de pagos contra uno o más servidores ya "
+        "levantados (p. ej. gunicorn sync vs gunicorn_asgi.conf.py) y compara req/s y latencias. "
+        "Escribe en la base (tareas del webhook): usar con PASARELA_FALSA=1 y fuera de producción."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', action='append', required=True,
+                            help="nombre=URL base, p. ej. sync=http://127.0.0.1:8001 (repetible)")
+        parser.add_argument('--concurrencia', type=int, default=50, help="Clientes simultáneos")
+        parser.add_argument('--duracion', type=float, default=20.0, help="Segundos de carga por servidor")
+        parser.add_argument('--prefijo', default='/api', help="Prefijo de las rutas de la API")
+        parser.add_argument('--timeout', type=float, default=30.0, help="Timeout de cada request")
+
+    def handle(self, *args, **options):
+        servidores = []
+        for valor in options['url']:
+            nombre, _, url = valor.rpartition('=')
+            if not url.startswith('http'):
+                raise CommandError(f"URL inválida: {valor}")
+            servidores.append((nombre or url, url.rstrip('/') + options['prefijo']))
+
+        self.stdout.write(
+            f"{'Servidor':<10} {'Endpoint':<16} {'Requests':>9} {'Errores':>8} {'req/s':>8} "
+            f"{'p50':>8} {'p95':>8} {'p99':>8}"
+        )
+        for nombre, url in servidores:
+            tiempos, errores, duracion = asyncio.run(
+                self.cargar(url, options['concurrencia'], options['duracion'], options['timeout'])
+            )
+            todos = [t for lista in tiempos.values() for t in lista]
+            for endpoint, lista in [*sorted(tiempos.items()), ('total', todos)]:
+                fallidos = errores.get(endpoint, 0) if endpoint != 'total' else sum(errores.values())
+                self.stdout.write(
+                    f"{nombre:<10} {endpoint:<16} {len(lista) + fallidos:>9} {fallidos:>8} "
+                    f"{(len(lista) + fallidos) / duracion:>8.1f} {self.p(lista, 50):>6.1f}ms "
+                    f"{self.p(lista, 95):>6.1f}ms {self.p(lista, 99):>6.1f}ms"
+                )
+
+    async def cargar(self, url, concurrencia, duracion, timeout):
+        tiempos = {nombre: [] for _, nombre, *_ in MEZCLA}
+        errores = {}
+        pesos = [peso for peso, *_ in MEZCLA]
+        limites = httpx.Limits(max_connections=concurrencia, max_keepalive_connections=concurrencia)
+        async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limites) as cliente:
+            inicio = time.perf_counter()
+            fin = inicio + duracion
+
+            async def usuario():
+                while time.perf_counter() < fin:
+                    _, nombre, metodo, ruta, cuerpo = random.choices(MEZCLA, weights=pesos)[0]
+                    n = random.randint(1, PAGOS_DISTINTOS)
+                    t0 = time.perf_counter()
+                    try:
+                        respuesta = await cliente.request(metodo, ruta(n), json=cuerpo(n) if cuerpo else None)
+                        ok = respuesta.status_code < 500
+                    except httpx.HTTPError:
+                        ok = False
+                    if ok:
+                        tiempos[nombre].append((time.perf_counter() - t0) * 1000)
+                    else:
+                        errores[nombre] = errores.get(nombre, 0) + 1
+
+            await asyncio.gather(*[usuario() for _ in range(concurrencia)])
+        return tiempos, errores, time.perf_counter() - inicio
+
+    @staticmethod
+    def p(tiempos, percentil):
+        if not tiempos:
+            return 0.0
+        if len(tiempos) == 1:
+            return tiempos[0]
+        return statistics.quantiles(tiempos, n=100, method='inclusive')[percentil - 1]
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from productos.services.producto_service import ProductoService
+
+
+class Command(BaseCommand):
+    help = "Recalcula los totales guardados en Producto (stock, vendidos y rating) desde atributos y reseñas"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verificar', action='store_true', help="Solo informar diferencias, sin corregirlas")
+
+    def handle(self, *args, **options):
+        desincronizados = list(ProductoService.totales_desincronizados().values_list(
+            'id', 'stock_total', 'stock_real', 'vendidos_total', 'vendidos_real',
+            'rating_count', 'rating_count_real',
+        ))
+        for producto_id, stock, stock_real, vendidos, vendidos_real, reviews, reviews_real in desincronizados:
+            self.stdout.write(
+                f"Producto #{producto_id}: stock {stock} (real {stock_real}), vendidos {vendidos} (real {vendidos_real}), "
+                f"reseñas {reviews} (real {reviews_real})"
+            )
+
+        if options['verificar']:
+            if desincronizados:
+                self.stderr.write(self.style.ERROR(f"{len(desincronizados)} productos con totales desincronizados"))
+                raise SystemExit(1)
+            self.stdout.write(self.style.SUCCESS("Todos los totales están sincronizados"))
+            return
+
+        actualizados = ProductoService.actualizar_totales()
+        ProductoService.recalcular_ratings()
+        self.stdout.write(self.style.SUCCESS(
+            f"Totales recalculados para {actualizados} productos ({len(desincronizados)} estaban desincronizados)"
+        ))
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:40
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def calcular_totales(apps, schema_editor):
+    Producto = apps.get_model('productos', 'Producto')
+    ProductoAtributo = apps.get_model('productos', 'ProductoAtributo')
+
+    def suma(campo):
+        return Coalesce(Subquery(
+            ProductoAtributo.objects.filter(producto=OuterRef('pk')).order_by()
+            .values('producto').annotate(total=Sum(campo)).values('total')
+        ), 0)
+
+    Producto.objects.update(stock_total=suma('stock'), vendidos_total=suma('cantidad_vendida'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0149_detalleventa_producto_atributo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='stock_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='vendidos_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['stock_total'], name='producto_stock_total_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['vendidos_total', 'id'], name='producto_vendidos_idx'),
+        ),
+        migrations.RunPython(calcular_totales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:10
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce
+
+
+def calcular_ratings(apps, schema_editor):
+    Producto = apps.get_model('productos', 'Producto')
+    ReviewProduct = apps.get_model('productos', 'ReviewProduct')
+
+    def agregado(expresion):
+        return Coalesce(Subquery(
+            ReviewProduct.objects.filter(product=OuterRef('pk'), approved=True).order_by()
+            .values('product').annotate(total=expresion).values('total')
+        ), 0)
+
+    Producto.objects.update(
+        rating_sum=agregado(Sum('rating')),
+        rating_count=agregado(Count('id')),
+        rating_avg=Coalesce(agregado(Cast(Sum('rating'), FloatField()) / Count('id')), Value(0.0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0150_producto_stock_total_vendidos_total'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='rating_avg',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['rating_avg', 'id'], name='producto_rating_idx'),
+        ),
+        migrations.RunPython(calcular_ratings, migrations.RunPython.noop),
+    ]
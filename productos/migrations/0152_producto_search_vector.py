@@ -0,0 +1,54 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:45
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def calcular_vectores(apps, schema_editor):
+    Producto = apps.get_model('productos', 'Producto')
+    ProductoAtributo = apps.get_model('productos', 'ProductoAtributo')
+    Marca = apps.get_model('productos', 'Marca')
+    TipoProducto = apps.get_model('productos', 'TipoProducto')
+
+    marca = Subquery(Marca.objects.filter(id=OuterRef('marca_id')).values('nombre')[:1])
+    tipo = Subquery(TipoProducto.objects.filter(id=OuterRef('tipo_id')).values('nombre')[:1])
+    atributos = Subquery(
+        ProductoAtributo.objects.filter(producto=OuterRef('pk')).order_by()
+        .values('producto').annotate(valores=StringAgg('atributo__valor', ' ')).values('valores')
+    )
+    Producto.objects.update(search_vector=(
+        SearchVector('nombre', weight='A', config='spanish') +
+        SearchVector('modelo_talle', marca, weight='B', config='spanish') +
+        SearchVector(tipo, atributos, weight='C', config='spanish') +
+        SearchVector('descripcion', weight='D', config='spanish')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0151_producto_rating'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='producto',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='producto_busqueda_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['nombre'], name='producto_nombre_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.RunPython(calcular_vectores, migrations.RunPython.noop),
+    ]
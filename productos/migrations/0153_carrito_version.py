@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0152_producto_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carrito',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0153_carrito_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venta',
+            name='referencia_pago',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.CreateModel(
+            name='ReservaStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('referencia', models.CharField(max_length=64)),
+                ('cantidad', models.PositiveIntegerField()),
+                ('estado', models.CharField(choices=[('activa', 'Activa'), ('confirmada', 'Confirmada'), ('consumida', 'Consumida'), ('liberada', 'Liberada')], default='activa', max_length=20)),
+                ('vence', models.DateTimeField()),
+                ('creada', models.DateTimeField(auto_now_add=True)),
+                ('producto_atributo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='productos.productoatributo')),
+            ],
+            options={
+                'unique_together': {('referencia', 'producto_atributo')},
+                'indexes': [models.Index(fields=['producto_atributo', 'estado', 'vence'], name='productos_r_product_2c15a6_idx'), models.Index(fields=['estado', 'vence'], name='productos_r_estado_a31e8c_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0154_reservastock_venta_referencia_pago'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pago',
+            name='mp_payment_id',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='pago',
+            name='referencia',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='pago',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
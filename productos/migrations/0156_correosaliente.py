@@ -0,0 +1,39 @@
+# Generated by Django 5.1.4 on 2026-10-18 21:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0155_pago_referencia_fecha_actualizacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorreoSaliente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=50)),
+                ('clave', models.CharField(blank=True, max_length=150, null=True, unique=True)),
+                ('prioridad', models.PositiveSmallIntegerField(default=0)),
+                ('remitente', models.CharField(blank=True, default='', max_length=254)),
+                ('destinatarios', models.JSONField(default=list)),
+                ('asunto', models.CharField(max_length=255)),
+                ('cuerpo', models.TextField()),
+                ('adjuntos', models.JSONField(blank=True, default=list)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('enviando', 'Enviando'), ('enviado', 'Enviado'), ('fallido', 'Fallido')], default='pendiente', max_length=20)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('max_intentos', models.PositiveIntegerField(default=6)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('disponible_desde', models.DateTimeField(default=django.utils.timezone.now)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('enviado', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['estado', 'prioridad', 'disponible_desde'], name='productos_c_estado_58ff2b_idx'), models.Index(fields=['enviado'], name='productos_c_enviado_b0a8de_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0156_correosaliente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venta',
+            name='stock_devuelto',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
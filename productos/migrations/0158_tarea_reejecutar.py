@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0157_venta_stock_devuelto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tarea',
+            name='reejecutar',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.4 on 2026-10-19 11:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0158_tarea_reejecutar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Candado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=150, unique=True)),
+                ('vence', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.4 on 2026-10-19 12:40
+
+from django.db import migrations, models
+
+
+def vaciar_referencias_en_blanco(apps, schema_editor):
+    # '' no es NULL: varias ventas sin referencia chocarían con la restricción única
+    Venta = apps.get_model('productos', 'Venta')
+    Venta.objects.filter(referencia_pago='').update(referencia_pago=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0159_candado'),
+    ]
+
+    operations = [
+        migrations.RunPython(vaciar_referencias_en_blanco, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='venta',
+            name='referencia_pago',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -3,3 +3,5 @@ from .configuracion import *
 from .producto import *
 from .venta import *
 from .usuario import *
+from .tarea import *
+from .correo import *
@@ -0,0 +1,46 @@
+from django.db import models
+from django.utils.timezone import now
+
+
+class CorreoSaliente(models.Model):
+    """Bandeja de salida: los requests solo insertan la fila y el worker enviar_correos la manda por SMTP."""
+    PENDIENTE = 'pendiente'
+    ENVIANDO = 'enviando'
+    ENVIADO = 'enviado'
+    FALLIDO = 'fallido'
+    ESTADOS = [
+        (PENDIENTE, 'Pendiente'),
+        (ENVIANDO, 'Enviando'),
+        (ENVIADO, 'Enviado'),
+        (FALLIDO, 'Fallido'),
+    ]
+    # Menor número = sale antes: los transaccionales no esperan detrás de una campaña
+    TRANSACCIONAL = 0
+    MARKETING = 10
+
+    tipo = models.CharField(max_length=50)
+    clave = models.CharField(max_length=150, unique=True, null=True, blank=True)
+    prioridad = models.PositiveSmallIntegerField(default=TRANSACCIONAL)
+    remitente = models.CharField(max_length=254, blank=True, default='')
+    destinatarios = models.JSONField(default=list)
+    asunto = models.CharField(max_length=255)
+    cuerpo = models.TextField()
+    # [{'nombre', 'ruta' (en el storage por defecto), 'mime'}]
+    adjuntos = models.JSONField(default=list, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=PENDIENTE)
+    intentos = models.PositiveIntegerField(default=0)
+    max_intentos = models.PositiveIntegerField(default=6)
+    error = models.TextField(null=True, blank=True)
+    disponible_desde = models.DateTimeField(default=now)
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+    enviado = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Correo #{self.id} {self.tipo} - {self.estado}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['estado', 'prioridad', 'disponible_desde']),
+            models.Index(fields=['enviado']),
+        ]
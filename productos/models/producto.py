@@ -1,3 +1,5 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils.timezone import now
 from decimal import Decimal
@@ -91,15 +93,20 @@ class Producto(models.Model):
     categoria = models.ForeignKey('Categoria', on_delete=models.CASCADE, related_name='productos', default=1, null=True, blank=True)
     puntos_club_acumulables = models.IntegerField(null=True, blank=True)
     qr_code = models.ImageField(storage=S3Boto3Storage(), upload_to='qr_codes/', null=True, blank=True)
+    # Totales de sus ProductoAtributo, mantenidos por ProductoService.actualizar_totales
+    stock_total = models.PositiveIntegerField(default=0, editable=False)
+    vendidos_total = models.PositiveIntegerField(default=0, editable=False)
+    # Agregados de las reseñas aprobadas, mantenidos por ProductoService.aplicar_ratings
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.FloatField(default=0, editable=False)
+    # Texto indexado para /productos/buscar/, mantenido por BusquedaService.actualizar_vectores
+    search_vector = SearchVectorField(null=True, editable=False)
 
 
-    @property
-    def stock_total(self):
-        return sum(attr.stock for attr in self.producto_atributos.all())
-
     @property
     def cantidad_vendida_total(self):
-        return sum(attr.cantidad_vendida for attr in self.producto_atributos.all())
+        return self.vendidos_total
 
     def __str__(self):
         marca_nombre = self.marca.nombre if self.marca else "Sin Marca"
@@ -111,6 +118,11 @@ class Producto(models.Model):
             models.Index(fields=['nombre', 'modelo_talle']),
             models.Index(fields=['tipo']),
             models.Index(fields=['marca']),
+            models.Index(fields=['stock_total'], name='producto_stock_total_idx'),
+            models.Index(fields=['vendidos_total', 'id'], name='producto_vendidos_idx'),
+            models.Index(fields=['rating_avg', 'id'], name='producto_rating_idx'),
+            GinIndex(fields=['search_vector'], name='producto_busqueda_idx'),
+            GinIndex(fields=['nombre'], name='producto_nombre_trgm_idx', opclasses=['gin_trgm_ops']),
         ]
 
 
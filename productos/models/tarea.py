@@ -0,0 +1,47 @@
+from django.db import models
+from django.contrib.auth.models import User
+from django.utils.timezone import now
+
+
+class Tarea(models.Model):
+    PENDIENTE = 'pendiente'
+    EN_PROCESO = 'en_proceso'
+    COMPLETADA = 'completada'
+    FALLIDA = 'fallida'
+    ESTADOS = [
+        (PENDIENTE, 'Pendiente'),
+        (EN_PROCESO, 'En proceso'),
+        (COMPLETADA, 'Completada'),
+        (FALLIDA, 'Fallida'),
+    ]
+
+    tipo = models.CharField(max_length=50)
+    clave = models.CharField(max_length=150, unique=True, null=True, blank=True)
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='tareas')
+    payload = models.JSONField(default=dict, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=PENDIENTE)
+    progreso = models.CharField(max_length=100, blank=True, default='')
+    resultado = models.JSONField(default=dict, blank=True)
+    error = models.TextField(null=True, blank=True)
+    intentos = models.PositiveIntegerField(default=0)
+    max_intentos = models.PositiveIntegerField(default=5)
+    # Llegó otra notificación mientras se procesaba: al terminar vuelve a la cola (TareaService.encolar con reabrir)
+    reejecutar = models.BooleanField(default=False)
+    disponible_desde = models.DateTimeField(default=now)
+    creada = models.DateTimeField(auto_now_add=True)
+    actualizada = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Tarea #{self.id} {self.tipo} - {self.estado}"
+
+    class Meta:
+        indexes = [models.Index(fields=['estado', 'disponible_desde'])]
+
+
+class Candado(models.Model):
+    """Lock entre procesos con vencimiento que no depende de la caché (la de archivos no tiene add atómico)."""
+    clave = models.CharField(max_length=150, unique=True)
+    vence = models.DateTimeField()
+
+    def __str__(self):
+        return f"Candado {self.clave} hasta {self.vence}"
@@ -1,9 +1,11 @@
+from datetime import timedelta
 from django.db import models
 from django.contrib.auth.models import User
 from productos.models.configuracion import Barrio
 from productos.models.producto import Producto,ProductoAtributo
 from storages.backends.s3boto3 import S3Boto3Storage
 from django.db.models import JSONField
+from django.utils import timezone
 
 class Roles(models.Model):
     nombre = models.CharField(max_length=50)
@@ -62,5 +64,5 @@ class PasswordResetCode(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.expires_at:
-            self.expires_at = datetime.now() + timedelta(minutes=10)
+            self.expires_at = timezone.now() + timedelta(minutes=10)
         super().save(*args, **kwargs)
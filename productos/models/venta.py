@@ -25,6 +25,11 @@ class Venta(models.Model):
     horario_entrega = models.CharField(max_length=50, blank=True, null=True)
     estado = models.ForeignKey(EstadosVenta, on_delete=models.SET_NULL, null=True, blank=True)
     comprobante_pdf = models.FileField(storage=S3Boto3Storage(), upload_to='comprobantes/', null=True, blank=True)
+    # external_reference de la preferencia de pago; identifica las reservas de stock de la compra.
+    # Única: un pago respalda una sola venta (sin referencia queda NULL, que no choca)
+    referencia_pago = models.CharField(max_length=64, null=True, blank=True, unique=True)
+    # El pago se rechazó o reembolsó después de registrar la venta y sus unidades ya volvieron al stock
+    stock_devuelto = models.BooleanField(default=False, editable=False)
 
     def __str__(self):
         return f"Venta #{self.id} - {self.fecha_venta.strftime('%d/%m/%Y')}"
@@ -32,6 +37,7 @@ class Venta(models.Model):
 class DetalleVenta(models.Model):
     venta = models.ForeignKey(Venta, on_delete=models.CASCADE, related_name='detalles', null=True)
     producto = models.ForeignKey(Producto, on_delete=models.CASCADE, null=True, blank=True)
+    producto_atributo = models.ForeignKey(ProductoAtributo, on_delete=models.SET_NULL, null=True, blank=True, related_name='detalles_venta')
     combinacion = JSONField(default=list)  
     cantidad = models.PositiveIntegerField()
     precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
@@ -43,6 +49,8 @@ class DetalleVenta(models.Model):
 
 class Carrito(models.Model):
     usuario = models.OneToOneField(User, on_delete=models.CASCADE)
+    # Se incrementa en cada modificación; los clientes la envían para no pisar cambios (CarritoService.aplicar)
+    version = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return f"Carrito de {self.usuario.username}"
@@ -60,14 +68,49 @@ class CarritoProducto(models.Model):
     class Meta:
         unique_together = ['carrito', 'producto_atributo']
 
+class ReservaStock(models.Model):
+    """Unidades apartadas mientras el comprador paga; ver ReservaService."""
+    ACTIVA = 'activa'
+    CONFIRMADA = 'confirmada'
+    CONSUMIDA = 'consumida'
+    LIBERADA = 'liberada'
+    ESTADOS = [
+        (ACTIVA, 'Activa'),
+        (CONFIRMADA, 'Confirmada'),
+        (CONSUMIDA, 'Consumida'),
+        (LIBERADA, 'Liberada'),
+    ]
+    # Las que todavía descuentan del stock disponible (si no vencieron)
+    VIGENTES = (ACTIVA, CONFIRMADA)
+
+    referencia = models.CharField(max_length=64)
+    producto_atributo = models.ForeignKey(ProductoAtributo, on_delete=models.CASCADE, related_name='reservas')
+    cantidad = models.PositiveIntegerField()
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=ACTIVA)
+    vence = models.DateTimeField()
+    creada = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Reserva {self.referencia} - {self.cantidad} x #{self.producto_atributo_id} ({self.estado})"
+
+    class Meta:
+        unique_together = ['referencia', 'producto_atributo']
+        indexes = [
+            models.Index(fields=['producto_atributo', 'estado', 'vence']),
+            models.Index(fields=['estado', 'vence']),
+        ]
+
 class Pago(models.Model):
     nombre = models.CharField(max_length=255)
     email = models.EmailField()
     monto = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=50, default="pending")
-    mp_payment_id = models.CharField(max_length=100, null=True, blank=True)
+    mp_payment_id = models.CharField(max_length=100, null=True, blank=True, unique=True)
     mp_status_detail = models.TextField(null=True, blank=True)
+    # external_reference del pago (Venta.referencia_pago)
+    referencia = models.CharField(max_length=64, null=True, blank=True, db_index=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.nombre} - {self.monto} - {self.status}"
\ No newline at end of file
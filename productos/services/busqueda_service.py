@@ -0,0 +1,81 @@
+import html
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.contrib.postgres.aggregates import StringAgg
+from django.db import connection
+from django.db.models import F, FloatField, OuterRef, Q, Subquery, Value
+from productos.models.producto import Producto, ProductoAtributo, Marca, TipoProducto
+
+CONFIG_BUSQUEDA = 'spanish'
+# ts_headline no escapa el texto: se marca con caracteres de uso privado y el HTML se arma en
+# resaltado_html, después de escapar el nombre/descripción (los carga el staff, pero igual son texto)
+INICIO_RESALTADO, FIN_RESALTADO = '\ue000', '\ue001'
+RESALTADO = {'start_sel': INICIO_RESALTADO, 'stop_sel': FIN_RESALTADO}
+
+
+class BusquedaService:
+    """
+    Búsqueda de productos sobre `Producto.search_vector` (tsvector con índice GIN) más
+    similitud por trigramas sobre el nombre para tolerar errores de tipeo. El vector incluye
+    datos de otras tablas (marca, tipo, valores de atributos), por eso se mantiene desde
+    las señales y no como columna generada.
+    """
+
+    @staticmethod
+    def disponible():
+        return connection.vendor == 'postgresql'
+
+    @staticmethod
+    def vector():
+        marca = Subquery(Marca.objects.filter(id=OuterRef('marca_id')).values('nombre')[:1])
+        tipo = Subquery(TipoProducto.objects.filter(id=OuterRef('tipo_id')).values('nombre')[:1])
+        atributos = Subquery(
+            ProductoAtributo.objects.filter(producto=OuterRef('pk')).order_by()
+            .values('producto').annotate(valores=StringAgg('atributo__valor', ' ')).values('valores')
+        )
+        return (
+            SearchVector('nombre', weight='A', config=CONFIG_BUSQUEDA) +
+            SearchVector('modelo_talle', marca, weight='B', config=CONFIG_BUSQUEDA) +
+            SearchVector(tipo, atributos, weight='C', config=CONFIG_BUSQUEDA) +
+            SearchVector('descripcion', weight='D', config=CONFIG_BUSQUEDA)
+        )
+
+    @staticmethod
+    def actualizar_vectores(producto_ids=None):
+        """Recalcula el vector de los productos indicados (lista o subconsulta de ids) en un UPDATE."""
+        if not BusquedaService.disponible():
+            return 0
+        queryset = Producto.objects.all() if producto_ids is None else Producto.objects.filter(id__in=producto_ids)
+        return queryset.update(search_vector=BusquedaService.vector())
+
+    @staticmethod
+    def resaltado_html(fragmento):
+        """Fragmento de SearchHeadline escapado, con las coincidencias entre <mark>."""
+        if fragmento is None:
+            return None
+        return html.escape(fragmento).replace(INICIO_RESALTADO, '<mark>').replace(FIN_RESALTADO, '</mark>')
+
+    @staticmethod
+    def buscar(texto, queryset=None):
+        """Filtra y anota `relevancia` y los textos resaltados (`nombre_resaltado`, `descripcion_resaltada`)."""
+        if queryset is None:
+            queryset = Producto.objects.all()
+
+        if not BusquedaService.disponible():
+            # Sin Postgres (tests locales): búsqueda simple por substring, sin ranking
+            return queryset.filter(
+                Q(nombre__icontains=texto) | Q(descripcion__icontains=texto) | Q(modelo_talle__icontains=texto) |
+                Q(marca__nombre__icontains=texto) | Q(tipo__nombre__icontains=texto) |
+                Q(producto_atributos__atributo__valor__icontains=texto)
+            ).distinct().annotate(relevancia=Value(0.0, output_field=FloatField()))
+
+        consulta = SearchQuery(texto, config=CONFIG_BUSQUEDA, search_type='websearch')
+        # Ambas condiciones usan índices GIN (tsvector y gin_trgm_ops); Postgres las combina con un BitmapOr
+        return queryset.filter(
+            Q(search_vector=consulta) | Q(nombre__trigram_similar=texto)
+        ).annotate(
+            relevancia=SearchRank(F('search_vector'), consulta) + TrigramSimilarity('nombre', texto),
+            nombre_resaltado=SearchHeadline('nombre', consulta, config=CONFIG_BUSQUEDA, highlight_all=True, **RESALTADO),
+            descripcion_resaltada=SearchHeadline(
+                'descripcion', consulta, config=CONFIG_BUSQUEDA, max_fragments=2, max_words=20, min_words=5, **RESALTADO
+            ),
+        )
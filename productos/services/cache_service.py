@@ -0,0 +1,36 @@
+import hashlib
+import time
+from django.core.cache import cache
+
+CACHE_PUBLICO_TTL = 60 * 60 * 6
+
+
+class CacheService:
+    """
+    Cache read-through con claves versionadas por grupo. Invalidar un grupo solo
+    incrementa su versión; las entradas viejas quedan huérfanas y expiran solas.
+    """
+
+    @staticmethod
+    def _clave_version(grupo):
+        return f'version:{grupo}'
+
+    @staticmethod
+    def version(grupo):
+        # La versión inicial se basa en el reloj para no reutilizar números si la clave se pierde
+        return cache.get_or_set(CacheService._clave_version(grupo), time.time_ns(), None)
+
+    @staticmethod
+    def invalidar(grupo):
+        try:
+            cache.incr(CacheService._clave_version(grupo))
+        except ValueError:
+            cache.set(CacheService._clave_version(grupo), time.time_ns(), None)
+
+    @staticmethod
+    def obtener(grupo, clave, calcular, timeout=CACHE_PUBLICO_TTL):
+        # Las claves suelen ser rutas con query string; se hashean para que sean válidas en cualquier backend
+        digest = hashlib.md5(clave.encode()).hexdigest()
+        clave_completa = f'{grupo}:{CacheService.version(grupo)}:{digest}'
+        return cache.get_or_set(clave_completa, calcular, timeout)
+
@@ -0,0 +1,326 @@
+import hashlib
+import re
+import secrets
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from urllib.parse import urljoin
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from productos.models.producto import Producto, ProductoAtributo
+from productos.models.venta import Carrito, CarritoProducto
+from productos.services.producto_service import ProductoService
+from productos.services.stock_service import StockService
+from productos.services.tareas_service import TareaService
+
+# Columnas que necesita la respuesta del carrito, leídas en una sola consulta con JOINs.
+# `disponible` es el stock sin las reservas vigentes, el mismo que se valida al comprar
+COLUMNAS_ITEM = [
+    'id', 'cantidad', 'producto_atributo_id', 'disponible',
+    'producto_atributo__cantidad_vendida', 'producto_atributo__imagen',
+    'producto_atributo__atributo_id', 'producto_atributo__atributo__nombre', 'producto_atributo__atributo__valor',
+    'producto_atributo__producto_id', 'producto_atributo__producto__nombre', 'producto_atributo__producto__categoria_id',
+    'producto_atributo__producto__precio', 'producto_atributo__producto__descuento',
+    'producto_atributo__producto__imagen', 'producto_atributo__producto__imagen_secundaria',
+    'producto_atributo__producto__imagen_terciaria',
+]
+
+
+AGREGAR, FIJAR, QUITAR = 'agregar', 'fijar', 'quitar'
+OPERACIONES = (AGREGAR, FIJAR, QUITAR)
+
+CARRITO_INVITADO_TTL = 60 * 60 * 24 * 7
+MAX_ITEMS_INVITADO = 100
+TOKEN_INVITADO = re.compile(r'[A-Za-z0-9_-]{16,64}')
+# Escrituras al mismo carrito invitado: se serializan con un candado corto (ver CarritoInvitadoService.bloqueado)
+CANDADO_INVITADO_SEGUNDOS = 5
+ESPERA_CANDADO_INVITADO = 2
+
+
+class VersionCarritoObsoleta(Exception):
+    """El cliente modificó un carrito que cambió desde su última lectura."""
+
+    def __init__(self, carrito):
+        self.carrito = carrito
+        super().__init__(f"El carrito cambió (versión actual {carrito.version}).")
+
+
+class CarritoInvalido(ValueError):
+    def __init__(self, errores):
+        self.errores = errores
+        super().__init__(str(errores))
+
+
+def _url(nombre):
+    return urljoin(settings.MEDIA_URL, str(nombre)) if nombre else None
+
+
+class CarritoService:
+    """
+    Escrituras del carrito por lote (`aplicar`, con control de versión) y modelo de lectura:
+    la misma forma que CarritoSerializer (carrito -> productos -> producto_atributo ->
+    producto/atributo) armada desde una consulta de `values()` y el mapa de descuentos
+    cacheado, sin instanciar modelos ni serializers.
+    """
+
+    @staticmethod
+    def obtener(usuario):
+        carrito, _ = Carrito.objects.get_or_create(usuario=usuario)
+        return carrito
+
+    @staticmethod
+    def calcular(operaciones, cantidades, stock, ajustar_a_stock=False):
+        """
+        Cantidades finales {producto_atributo_id: cantidad} (0 = quitar) de aplicar las operaciones
+        sobre `cantidades`. Lanza CarritoInvalido con los errores por índice de operación; con
+        `ajustar_a_stock` en cambio recorta al stock disponible y descarta los inexistentes.
+        """
+        errores = {}
+        finales = {}
+        for indice, operacion in enumerate(operaciones):
+            producto_atributo_id = operacion['producto_atributo_id']
+            if producto_atributo_id not in stock:
+                if not ajustar_a_stock:
+                    errores[str(indice)] = f"Producto/atributo #{producto_atributo_id} no encontrado."
+                continue
+            actual = finales.get(producto_atributo_id, cantidades.get(producto_atributo_id, 0))
+            if operacion['op'] == AGREGAR:
+                finales[producto_atributo_id] = actual + operacion['cantidad']
+            elif operacion['op'] == FIJAR:
+                finales[producto_atributo_id] = operacion['cantidad']
+            else:
+                finales[producto_atributo_id] = 0
+        if ajustar_a_stock:
+            return {i: min(cantidad, stock[i]) for i, cantidad in finales.items()}
+        for indice, operacion in enumerate(operaciones):
+            producto_atributo_id = operacion['producto_atributo_id']
+            if finales.get(producto_atributo_id, 0) > stock.get(producto_atributo_id, 0):
+                errores.setdefault(
+                    str(indice), f"No hay suficiente stock. Stock disponible: {stock[producto_atributo_id]}"
+                )
+        if errores:
+            raise CarritoInvalido(errores)
+        return finales
+
+    @staticmethod
+    def aplicar(carrito, operaciones, version=None, ajustar_a_stock=False):
+        """
+        Aplica [{'op': 'agregar'|'fijar'|'quitar', 'producto_atributo_id', 'cantidad'}] en una
+        transacción: una consulta de stock para todos los ítems, un DELETE y un upsert. Con
+        `version` se rechaza la escritura si el carrito cambió desde que el cliente lo leyó.
+        """
+        with transaction.atomic():
+            # El bloqueo del carrito serializa las modificaciones concurrentes del mismo usuario
+            carrito = Carrito.objects.select_for_update().get(id=carrito.id)
+            if version is not None and carrito.version != version:
+                raise VersionCarritoObsoleta(carrito)
+
+            ids = {operacion['producto_atributo_id'] for operacion in operaciones}
+            stock = StockService.disponibles(ids)
+            cantidades = dict(
+                CarritoProducto.objects.filter(carrito=carrito, producto_atributo_id__in=ids)
+                .values_list('producto_atributo_id', 'cantidad')
+            )
+
+            finales = CarritoService.calcular(operaciones, cantidades, stock, ajustar_a_stock)
+
+            quitar = [i for i, cantidad in finales.items() if cantidad == 0 and i in cantidades]
+            if quitar:
+                CarritoProducto.objects.filter(carrito=carrito, producto_atributo_id__in=quitar).delete()
+            guardar = [
+                CarritoProducto(carrito=carrito, producto_atributo_id=i, cantidad=cantidad)
+                for i, cantidad in finales.items() if cantidad > 0 and cantidad != cantidades.get(i)
+            ]
+            if guardar:
+                CarritoProducto.objects.bulk_create(
+                    guardar, update_conflicts=True, unique_fields=['carrito', 'producto_atributo'], update_fields=['cantidad'],
+                )
+            if quitar or guardar:
+                Carrito.objects.filter(id=carrito.id).update(version=F('version') + 1)
+                carrito.version += 1
+        return carrito
+
+    @staticmethod
+    def filas(carrito):
+        return list(
+            CarritoProducto.objects.filter(carrito=carrito).order_by('id').annotate(
+                disponible=StockService.disponible('producto_atributo__stock', 'producto_atributo_id')
+            ).values(*COLUMNAS_ITEM)
+        )
+
+    @staticmethod
+    def filas_invitado(cantidades):
+        """Mismas filas que `filas()` para un carrito sin registro en la base ({producto_atributo_id: cantidad})."""
+        columnas = {
+            columna: columna.removeprefix('producto_atributo__')
+            for columna in COLUMNAS_ITEM if columna.startswith('producto_atributo__')
+        }
+        filas = []
+        productos_atributos = ProductoAtributo.objects.filter(id__in=cantidades).order_by('id').annotate(
+            disponible=StockService.disponible()
+        ).values('id', 'disponible', *columnas.values())
+        for producto_atributo in productos_atributos:
+            fila = {columna: producto_atributo[origen] for columna, origen in columnas.items()}
+            fila.update(
+                id=None, cantidad=cantidades[producto_atributo['id']], producto_atributo_id=producto_atributo['id'],
+                disponible=producto_atributo['disponible'],
+            )
+            filas.append(fila)
+        return filas
+
+    @staticmethod
+    def etag(cabecera, filas, descuentos):
+        """Hash del estado que se ve en la respuesta (ítems, stock, precios y descuentos aplicables)."""
+        categorias = {fila['producto_atributo__producto__categoria_id'] for fila in filas}
+        estado = (
+            sorted(cabecera.items()), settings.MEDIA_URL,
+            [tuple(fila[columna] for columna in COLUMNAS_ITEM) for fila in filas],
+            sorted((c, descuentos[c]) for c in categorias if c in descuentos),
+        )
+        return '"%s"' % hashlib.md5(repr(estado).encode()).hexdigest()
+
+    @staticmethod
+    def _item(fila, descuentos):
+        if fila['producto_atributo_id'] is None:
+            return {'id': fila['id'], 'producto_atributo': None, 'cantidad': fila['cantidad']}
+        producto = Producto(
+            id=fila['producto_atributo__producto_id'],
+            precio=fila['producto_atributo__producto__precio'],
+            descuento=fila['producto_atributo__producto__descuento'],
+            categoria_id=fila['producto_atributo__producto__categoria_id'],
+        )
+        return {
+            'id': fila['id'],
+            'producto_atributo': {
+                'id': fila['producto_atributo_id'],
+                'producto': {
+                    'id': producto.id,
+                    'nombre': fila['producto_atributo__producto__nombre'],
+                    'categoria': producto.categoria_id,
+                    'imagen': _url(fila['producto_atributo__producto__imagen']),
+                    'imagen_secundaria': _url(fila['producto_atributo__producto__imagen_secundaria']),
+                    'imagen_terciaria': _url(fila['producto_atributo__producto__imagen_terciaria']),
+                    'precio_final': ProductoService.calcular_precio_final(producto, descuentos),
+                    'descuento': ProductoService.obtener_descuento(producto, descuentos),
+                },
+                'atributo': {
+                    'id': fila['producto_atributo__atributo_id'],
+                    'nombre': fila['producto_atributo__atributo__nombre'],
+                    'valor': fila['producto_atributo__atributo__valor'],
+                },
+                'stock': fila['disponible'],
+                'cantidad_vendida': fila['producto_atributo__cantidad_vendida'],
+                'imagen': _url(fila['producto_atributo__imagen']),
+            },
+            'cantidad': fila['cantidad'],
+        }
+
+    @staticmethod
+    def proyectar(cabecera, filas, si_no_coincide=None):
+        """
+        Devuelve (datos, etag). Si `si_no_coincide` (lista de ETags del cliente) contiene el
+        ETag actual, `datos` es None: el carrito no cambió y no hace falta armarlo.
+        """
+        descuentos = ProductoService.mapa_descuentos()
+        etag = CarritoService.etag(cabecera, filas, descuentos)
+        if si_no_coincide and (etag in si_no_coincide or '*' in si_no_coincide):
+            return None, etag
+        return {**cabecera, 'productos': [CarritoService._item(fila, descuentos) for fila in filas]}, etag
+
+    @staticmethod
+    def proyeccion(carrito, si_no_coincide=None):
+        cabecera = {'id': carrito.id, 'usuario': carrito.usuario_id, 'version': carrito.version}
+        return CarritoService.proyectar(cabecera, CarritoService.filas(carrito), si_no_coincide)
+
+
+class CarritoInvitadoService:
+    """
+    Carrito de visitantes sin cuenta: {producto_atributo_id: cantidad} en el cache compartido
+    bajo un token aleatorio que guarda el cliente. No crea filas en la base; expira solo
+    (TTL renovado en cada escritura) y al iniciar sesión se fusiona en el Carrito del usuario.
+    """
+
+    @staticmethod
+    def _clave(token):
+        return f'carrito_invitado:{token}'
+
+    @staticmethod
+    def token_valido(token):
+        return bool(token) and bool(TOKEN_INVITADO.fullmatch(token))
+
+    @staticmethod
+    def leer(token):
+        """Devuelve {'version', 'items'}; un token desconocido o expirado es un carrito vacío."""
+        datos = cache.get(CarritoInvitadoService._clave(token)) if CarritoInvitadoService.token_valido(token) else None
+        if not datos:
+            return {'version': 0, 'items': {}}
+        return {'version': datos['version'], 'items': {int(i): cantidad for i, cantidad in datos['items'].items()}}
+
+    @staticmethod
+    @contextmanager
+    def bloqueado(token):
+        """
+        Lectura-comparación-escritura exclusiva sobre el carrito `token`. La caché de archivos no tiene
+        operaciones atómicas, así que el candado es una fila en la base (TareaService.tomar_candado)
+        que se borra al terminar. Si no se consigue en ESPERA_CANDADO_INVITADO segundos, hay otra
+        escritura colgada: se informa como versión obsoleta para que el cliente vuelva a leer.
+        """
+        clave = CarritoInvitadoService._clave(token)
+        limite = time.monotonic() + ESPERA_CANDADO_INVITADO
+        while not (vence := TareaService.tomar_candado(clave, CANDADO_INVITADO_SEGUNDOS)):
+            if time.monotonic() > limite:
+                raise VersionCarritoObsoleta(SimpleNamespace(token=token, **CarritoInvitadoService.leer(token)))
+            time.sleep(0.05)
+        try:
+            yield
+        finally:
+            TareaService.soltar_candado(clave, vence)
+
+    @staticmethod
+    def aplicar(token, operaciones, version=None):
+        """Mismas operaciones y validaciones que CarritoService.aplicar. Devuelve (token, datos)."""
+        if not CarritoInvitadoService.token_valido(token):
+            token = secrets.token_urlsafe(18)
+        with CarritoInvitadoService.bloqueado(token):
+            return CarritoInvitadoService._aplicar(token, operaciones, version)
+
+    @staticmethod
+    def _aplicar(token, operaciones, version):
+        datos = CarritoInvitadoService.leer(token)
+        if version is not None and datos['version'] != version:
+            raise VersionCarritoObsoleta(SimpleNamespace(token=token, **datos))
+
+        ids = {operacion['producto_atributo_id'] for operacion in operaciones}
+        stock = StockService.disponibles(ids)
+        finales = CarritoService.calcular(operaciones, datos['items'], stock)
+        items = {**datos['items'], **finales}
+        items = {i: cantidad for i, cantidad in items.items() if cantidad > 0}
+        if len(items) > MAX_ITEMS_INVITADO:
+            raise CarritoInvalido({'operaciones': f"El carrito admite hasta {MAX_ITEMS_INVITADO} productos."})
+
+        datos = {'version': datos['version'] + 1, 'items': items}
+        cache.set(CarritoInvitadoService._clave(token), datos, CARRITO_INVITADO_TTL)
+        return token, datos
+
+    @staticmethod
+    def proyeccion(token, datos, si_no_coincide=None):
+        cabecera = {'id': None, 'usuario': None, 'token': token, 'version': datos['version']}
+        return CarritoService.proyectar(cabecera, CarritoService.filas_invitado(datos['items']), si_no_coincide)
+
+    @staticmethod
+    def fusionar(usuario_id, token):
+        """Suma el carrito invitado al del usuario en una sola operación (recortando al stock) y lo borra."""
+        carrito, _ = Carrito.objects.get_or_create(usuario_id=usuario_id)
+        if not CarritoInvitadoService.token_valido(token):
+            return carrito
+        with CarritoInvitadoService.bloqueado(token):
+            datos = CarritoInvitadoService.leer(token)
+            if datos['items']:
+                operaciones = [
+                    {'op': AGREGAR, 'producto_atributo_id': i, 'cantidad': cantidad} for i, cantidad in datos['items'].items()
+                ]
+                carrito = CarritoService.aplicar(carrito, operaciones, ajustar_a_stock=True)
+            cache.delete(CarritoInvitadoService._clave(token))
+        return carrito
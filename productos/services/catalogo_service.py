@@ -0,0 +1,37 @@
+from django.db.models import Prefetch
+from productos.models.producto import Producto, ProductoAtributo, ReviewProduct
+
+
+class CatalogoService:
+    # Columnas pesadas que no usa ProductoSimpleSerializer y se pueden diferir
+    COLUMNAS_DIFERIBLES = ['descripcion', 'qr_code']
+
+    @staticmethod
+    def planificar(queryset=None, campos=None):
+        """
+        Devuelve el queryset del catálogo con todo lo que necesita ProductoSerializer
+        precargado, de modo que la cantidad de consultas no dependa del tamaño de la página.
+        `campos` es el conjunto de campos pedidos (sparse fieldset); None significa todos.
+        """
+        if queryset is None:
+            queryset = Producto.objects.all()
+
+        def pedido(*nombres):
+            return campos is None or any(nombre in campos for nombre in nombres)
+
+        queryset = queryset.select_related('tipo', 'marca', 'categoria')
+
+        if pedido('producto_atributos'):
+            queryset = queryset.prefetch_related(Prefetch(
+                'producto_atributos',
+                queryset=ProductoAtributo.objects.select_related('atributo').order_by('id')
+            ))
+        if pedido('reviews'):
+            queryset = queryset.prefetch_related(
+                Prefetch('reviews', queryset=ReviewProduct.objects.select_related('user'))
+            )
+
+        diferidas = [col for col in CatalogoService.COLUMNAS_DIFERIBLES if not pedido(col)]
+        if diferidas:
+            queryset = queryset.defer(*diferidas)
+        return queryset
@@ -0,0 +1,223 @@
+from datetime import timedelta
+import smtplib
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.mail import EmailMessage, get_connection
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from productos.models.correo import CorreoSaliente
+from productos.services.tareas_service import TareaService
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Correos por vuelta del worker: todos salen por la misma conexión SMTP
+CORREO_LOTE = 50
+BACKOFF_BASE_SEGUNDOS = 60
+BACKOFF_MAXIMO_SEGUNDOS = 60 * 60
+# Un correo 'enviando' sin novedades por más de esto se considera abandonado (worker caído)
+CORREO_ABANDONADO_SEGUNDOS = 10 * 60
+CANDADO_CUPO = 'correos:cupo'
+CANDADO_CUPO_SEGUNDOS = 30
+
+
+class CorreoSinDestinatarios(Exception):
+    """EmailMessage.send() no manda nada (y no falla) si la lista de destinatarios queda vacía."""
+
+
+# Errores que no se arreglan reintentando
+ERRORES_PERMANENTES = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, CorreoSinDestinatarios)
+
+
+class CorreoService:
+    @staticmethod
+    def encolar(tipo, asunto, cuerpo, destinatarios, remitente=None, adjuntos=None, clave=None,
+                prioridad=CorreoSaliente.TRANSACCIONAL, max_intentos=6):
+        """
+        Deja el correo en la bandeja de salida; lo envía el worker (manage.py enviar_correos).
+        Con `clave` es idempotente: si ya existe un correo con esa clave se devuelve ese.
+        """
+        correo = CorreoSaliente(
+            tipo=tipo, clave=clave, prioridad=prioridad, remitente=remitente or '',
+            destinatarios=list(destinatarios), asunto=asunto[:255], cuerpo=cuerpo,
+            adjuntos=adjuntos or [], max_intentos=max_intentos,
+        )
+        if clave is None:
+            correo.save()
+            return correo
+        try:
+            with transaction.atomic():
+                correo.save()
+            return correo
+        except IntegrityError:
+            return CorreoSaliente.objects.get(clave=clave)
+
+    @staticmethod
+    def encolar_masivo(tipo, asunto, cuerpo, destinatarios, campania):
+        """
+        Campañas de marketing: un correo por destinatario, con prioridad baja para no demorar
+        los transaccionales. Volver a lanzar la misma `campania` solo agrega los que faltan.
+        """
+        correos = [
+            CorreoSaliente(
+                tipo=tipo, clave=f"{campania}:{destinatario}"[:150], prioridad=CorreoSaliente.MARKETING,
+                destinatarios=[destinatario], asunto=asunto[:255], cuerpo=cuerpo,
+            )
+            for destinatario in dict.fromkeys(destinatarios)
+        ]
+        antes = CorreoSaliente.objects.filter(clave__startswith=f"{campania}:").count()
+        CorreoSaliente.objects.bulk_create(correos, batch_size=500, ignore_conflicts=True)
+        return CorreoSaliente.objects.filter(clave__startswith=f"{campania}:").count() - antes
+
+    @staticmethod
+    def reintentar_fallidos(tipo=None):
+        """Vuelve a poner en cola los correos que agotaron sus intentos (p. ej. tras arreglar credenciales)."""
+        queryset = CorreoSaliente.objects.filter(estado=CorreoSaliente.FALLIDO)
+        if tipo:
+            queryset = queryset.filter(tipo=tipo)
+        return queryset.update(
+            estado=CorreoSaliente.PENDIENTE, intentos=0, error=None, disponible_desde=timezone.now()
+        )
+
+    @staticmethod
+    def cupo():
+        """
+        Correos que todavía se pueden mandar sin pasar los límites del proveedor
+        (CORREO_MAX_POR_MINUTO / CORREO_MAX_POR_DIA). Se cuenta en la base y los 'enviando'
+        ya ocupan cupo; enviar_lote lo calcula y reclama bajo un candado, así vale para todos los workers.
+        """
+        ahora = timezone.now()
+        conteo = CorreoSaliente.objects.filter(
+            Q(enviado__gte=ahora - timedelta(days=1)) | Q(estado=CorreoSaliente.ENVIANDO)
+        ).aggregate(
+            minuto=Count('id', filter=Q(enviado__gte=ahora - timedelta(minutes=1)) | Q(estado=CorreoSaliente.ENVIANDO)),
+            dia=Count('id'),
+        )
+        return max(0, min(
+            settings.CORREO_MAX_POR_MINUTO - conteo['minuto'],
+            settings.CORREO_MAX_POR_DIA - conteo['dia'],
+        ))
+
+    @staticmethod
+    def reclamar(limite):
+        """Toma correos pendientes sin bloquear a otros workers (SKIP LOCKED), transaccionales primero."""
+        ahora = timezone.now()
+        with transaction.atomic():
+            correos = list(
+                CorreoSaliente.objects.select_for_update(skip_locked=True).filter(
+                    Q(estado=CorreoSaliente.PENDIENTE, disponible_desde__lte=ahora) |
+                    Q(estado=CorreoSaliente.ENVIANDO, actualizado__lt=ahora - timedelta(seconds=CORREO_ABANDONADO_SEGUNDOS))
+                ).order_by('prioridad', 'disponible_desde', 'id')[:limite]
+            )
+            CorreoSaliente.objects.filter(id__in=[c.id for c in correos]).update(
+                estado=CorreoSaliente.ENVIANDO, actualizado=ahora
+            )
+        for correo in correos:
+            correo.estado = CorreoSaliente.ENVIANDO
+        return correos
+
+    @staticmethod
+    def mensaje(correo, conexion):
+        email = EmailMessage(
+            subject=correo.asunto,
+            body=correo.cuerpo,
+            from_email=correo.remitente or None,
+            to=correo.destinatarios,
+            connection=conexion,
+        )
+        for adjunto in correo.adjuntos:
+            with default_storage.open(adjunto['ruta'], 'rb') as archivo:
+                email.attach(adjunto['nombre'], archivo.read(), adjunto.get('mime'))
+        return email
+
+    @staticmethod
+    def fallar(correo, error, permanente=False):
+        correo.intentos += 1
+        correo.error = str(error)
+        if permanente or correo.intentos >= correo.max_intentos:
+            correo.estado = CorreoSaliente.FALLIDO
+            logger.error(f"Correo #{correo.id} ({correo.tipo}) falló definitivamente: {error}")
+        else:
+            espera = min(BACKOFF_BASE_SEGUNDOS * 2 ** (correo.intentos - 1), BACKOFF_MAXIMO_SEGUNDOS)
+            correo.estado = CorreoSaliente.PENDIENTE
+            correo.disponible_desde = timezone.now() + timedelta(seconds=espera)
+            logger.warning(f"Correo #{correo.id} ({correo.tipo}) falló, reintento en {espera}s: {error}")
+        correo.save(update_fields=['intentos', 'error', 'estado', 'disponible_desde', 'actualizado'])
+
+    @staticmethod
+    def enviar_lote(limite=CORREO_LOTE):
+        """
+        Envía hasta `limite` correos (acotado por el cupo del proveedor) abriendo una sola
+        conexión SMTP para todo el lote. Devuelve {'enviados', 'fallidos'}.
+        """
+        resumen = {'enviados': 0, 'fallidos': 0}
+        # Calcular el cupo y reclamar van bajo un mismo candado: si no, cada worker vería el cupo
+        # entero y reclamaría esa cantidad. Si lo tiene otro worker, se sigue en la próxima vuelta.
+        vence = TareaService.tomar_candado(CANDADO_CUPO, CANDADO_CUPO_SEGUNDOS)
+        if not vence:
+            return resumen
+        try:
+            limite = min(limite, CorreoService.cupo())
+            correos = CorreoService.reclamar(limite) if limite > 0 else []
+        finally:
+            TareaService.soltar_candado(CANDADO_CUPO, vence)
+        if not correos:
+            return resumen
+
+        conexion = get_connection(fail_silently=False)
+        try:
+            conexion.open()
+        except Exception as e:
+            # Sin conexión (credenciales, red): todo el lote vuelve a la cola con backoff
+            for correo in correos:
+                CorreoService.fallar(correo, e)
+            resumen['fallidos'] = len(correos)
+            return resumen
+
+        try:
+            for i, correo in enumerate(correos):
+                try:
+                    if not CorreoService.mensaje(correo, conexion).send():
+                        raise CorreoSinDestinatarios(f"El correo #{correo.id} no tiene destinatarios válidos")
+                except Exception as e:
+                    CorreoService.fallar(correo, e, permanente=isinstance(e, ERRORES_PERMANENTES))
+                    resumen['fallidos'] += 1
+                    if isinstance(e, smtplib.SMTPServerDisconnected):
+                        # El servidor cortó (p. ej. límite de mensajes por conexión): se reabre para el resto
+                        conexion.close()
+                        try:
+                            conexion.open()
+                        except Exception as e:
+                            for resto in correos[i + 1:]:
+                                CorreoService.fallar(resto, e)
+                            resumen['fallidos'] += len(correos) - i - 1
+                            break
+                    continue
+                correo.intentos += 1
+                correo.estado = CorreoSaliente.ENVIADO
+                correo.enviado = timezone.now()
+                correo.error = None
+                correo.save(update_fields=['intentos', 'estado', 'enviado', 'error', 'actualizado'])
+                resumen['enviados'] += 1
+        finally:
+            conexion.close()
+        return resumen
+
+    @staticmethod
+    def metricas():
+        """Estado de la bandeja de salida para monitoreo (una sola consulta)."""
+        ahora = timezone.now()
+        datos = CorreoSaliente.objects.aggregate(
+            pendientes=Count('id', filter=Q(estado=CorreoSaliente.PENDIENTE)),
+            reintentando=Count('id', filter=Q(estado=CorreoSaliente.PENDIENTE, intentos__gt=0)),
+            enviando=Count('id', filter=Q(estado=CorreoSaliente.ENVIANDO)),
+            fallidos=Count('id', filter=Q(estado=CorreoSaliente.FALLIDO)),
+            enviados_ultima_hora=Count('id', filter=Q(enviado__gte=ahora - timedelta(hours=1))),
+            enviados_ultimo_dia=Count('id', filter=Q(enviado__gte=ahora - timedelta(days=1))),
+            pendiente_mas_antiguo=Min('creado', filter=Q(estado=CorreoSaliente.PENDIENTE)),
+        )
+        antiguo = datos.pop('pendiente_mas_antiguo')
+        datos['antiguedad_pendiente_segundos'] = int((ahora - antiguo).total_seconds()) if antiguo else 0
+        datos['cupo_disponible'] = CorreoService.cupo()
+        return datos
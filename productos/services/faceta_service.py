@@ -0,0 +1,189 @@
+from collections import defaultdict
+from django.db.models import Count, Exists, OuterRef, Q
+from rest_framework.exceptions import ValidationError
+from productos.models.producto import Producto, ProductoAtributo, Atributo
+from productos.services.cache_service import CacheService
+from productos.services.stock_service import StockService
+
+# Bandas de precio de lista: (clave para ?precio=, desde, hasta exclusivo; None = sin tope)
+BANDAS_PRECIO = [
+    ('0-10000', 0, 10000),
+    ('10000-25000', 10000, 25000),
+    ('25000-50000', 25000, 50000),
+    ('50000-100000', 50000, 100000),
+    ('100000+', 100000, None),
+]
+
+
+class FacetaService:
+    """
+    Filtros del catálogo y conteos por faceta. Cada faceta se cuenta con todos los filtros
+    menos el suyo (así seleccionar una marca no oculta las demás marcas), con una consulta
+    agrupada por faceta. Los atributos se combinan con OR dentro del mismo nombre
+    (talle M o L) y con AND entre nombres distintos (talle M y color rojo). "En stock"
+    descuenta las reservas vigentes, igual que el checkout (StockService.disponible).
+    """
+
+    @staticmethod
+    def _en_stock():
+        return Q(Exists(ProductoAtributo.objects.filter(StockService.con_disponible(), producto=OuterRef('pk'))))
+
+    @staticmethod
+    def _ids(params, nombre):
+        valores = [valor.strip() for valor in params.get(nombre, '').split(',') if valor.strip()]
+        try:
+            return sorted({int(valor) for valor in valores})
+        except ValueError:
+            raise ValidationError({nombre: "Debe ser una lista de ids separados por coma."})
+
+    @staticmethod
+    def leer_filtros(params):
+        """?marca=1,2&tipo=3&categoria=Remeras&atributo=4,9&precio=0-10000,10000-25000&en_stock=1"""
+        filtros = {}
+        for nombre in ('marca', 'tipo'):
+            ids = FacetaService._ids(params, nombre)
+            if ids:
+                filtros[nombre] = ids
+        if params.get('categoria'):
+            filtros['categoria'] = params['categoria']
+
+        atributo_ids = FacetaService._ids(params, 'atributo')
+        if atributo_ids:
+            # Se agrupan por nombre de atributo para el OR/AND; un id inexistente no filtra nada
+            por_nombre = defaultdict(list)
+            for atributo_id, nombre in Atributo.objects.filter(id__in=atributo_ids).values_list('id', 'nombre'):
+                por_nombre[nombre].append(atributo_id)
+            filtros['atributo'] = dict(por_nombre)
+
+        bandas = {clave: (desde, hasta) for clave, desde, hasta in BANDAS_PRECIO}
+        precios = [valor.strip() for valor in params.get('precio', '').split(',') if valor.strip()]
+        if precios:
+            desconocidas = [valor for valor in precios if valor not in bandas]
+            if desconocidas:
+                raise ValidationError({'precio': f"Bandas válidas: {', '.join(bandas)}."})
+            filtros['precio'] = [bandas[valor] for valor in precios]
+
+        if params.get('en_stock') in ('1', 'true'):
+            filtros['en_stock'] = True
+        return filtros
+
+    @staticmethod
+    def _atributos_condicion(atributo_ids, en_stock):
+        lineas = ProductoAtributo.objects.filter(atributo_id__in=atributo_ids)
+        if en_stock:
+            lineas = lineas.filter(StockService.con_disponible())
+        return Q(id__in=lineas.values('producto_id'))
+
+    @staticmethod
+    def filtrar(queryset, filtros, excepto=None, excepto_atributo=None):
+        """
+        Aplica los filtros salvo la faceta `excepto` (o solo el nombre de atributo
+        `excepto_atributo`). Los atributos van como subconsultas para no duplicar filas.
+        """
+        if 'marca' in filtros and excepto != 'marca':
+            queryset = queryset.filter(marca_id__in=filtros['marca'])
+        if 'tipo' in filtros and excepto != 'tipo':
+            queryset = queryset.filter(tipo_id__in=filtros['tipo'])
+        if 'categoria' in filtros and excepto != 'categoria':
+            queryset = queryset.filter(categoria__nombre=filtros['categoria'])
+        if 'precio' in filtros and excepto != 'precio':
+            condicion = Q()
+            for desde, hasta in filtros['precio']:
+                condicion |= Q(precio__gte=desde) & (Q(precio__lt=hasta) if hasta is not None else Q())
+            queryset = queryset.filter(condicion)
+        en_stock = filtros.get('en_stock', False)
+        if en_stock and excepto != 'en_stock':
+            queryset = queryset.filter(FacetaService._en_stock())
+        if excepto != 'atributo':
+            for nombre, atributo_ids in filtros.get('atributo', {}).items():
+                if nombre != excepto_atributo:
+                    queryset = queryset.filter(FacetaService._atributos_condicion(atributo_ids, en_stock))
+        return queryset
+
+    @staticmethod
+    def _agrupar(queryset, campo_id, campo_nombre):
+        filas = queryset.order_by().values(campo_id, campo_nombre).annotate(cantidad=Count('id'))
+        return sorted(
+            [{'id': fila[campo_id], 'nombre': fila[campo_nombre], 'cantidad': fila['cantidad']}
+             for fila in filas if fila[campo_id] is not None],
+            key=lambda fila: (-fila['cantidad'], fila['nombre'] or ''),
+        )
+
+    @staticmethod
+    def _nombres(nombres):
+        # Atributo.nombre admite NULL, que no entra en un IN
+        condicion = Q(atributo__nombre__in=[nombre for nombre in nombres if nombre is not None])
+        if None in nombres:
+            condicion |= Q(atributo__nombre__isnull=True)
+        return condicion
+
+    @staticmethod
+    def _contar_atributos(productos, en_stock, solo=None, excluir=()):
+        lineas = ProductoAtributo.objects.filter(producto__in=productos.values('id'))
+        if en_stock:
+            lineas = lineas.filter(StockService.con_disponible())
+        if solo is not None:
+            lineas = lineas.filter(FacetaService._nombres(solo))
+        elif excluir:
+            lineas = lineas.exclude(FacetaService._nombres(excluir))
+        # (producto, atributo) es único, así que contar líneas es contar productos
+        return lineas.order_by().values('atributo_id', 'atributo__nombre', 'atributo__valor').annotate(
+            cantidad=Count('id')
+        )
+
+    @staticmethod
+    def calcular(filtros, queryset=None):
+        """Conteos de todas las facetas para los filtros dados."""
+        if queryset is None:
+            queryset = Producto.objects.all()
+        en_stock = filtros.get('en_stock', False)
+
+        def sin(faceta):
+            return FacetaService.filtrar(queryset, filtros, excepto=faceta)
+
+        precios = sin('precio').aggregate(**{
+            clave: Count('id', filter=Q(precio__gte=desde) & (Q(precio__lt=hasta) if hasta is not None else Q()))
+            for clave, desde, hasta in BANDAS_PRECIO
+        })
+        stock = sin('en_stock').aggregate(en_stock=Count('id', filter=FacetaService._en_stock()))
+
+        # Nombres sin selección: una consulta con todos los filtros; cada nombre seleccionado
+        # se cuenta aparte sin su propio filtro
+        seleccionados = list(filtros.get('atributo', {}))
+        filas = list(FacetaService._contar_atributos(
+            FacetaService.filtrar(queryset, filtros), en_stock, excluir=seleccionados
+        ))
+        for nombre in seleccionados:
+            filas += FacetaService._contar_atributos(
+                FacetaService.filtrar(queryset, filtros, excepto_atributo=nombre), en_stock, solo=[nombre]
+            )
+        atributos = defaultdict(list)
+        for fila in sorted(filas, key=lambda fila: (-fila['cantidad'], fila['atributo__valor'])):
+            atributos[fila['atributo__nombre'] or ''].append(
+                {'id': fila['atributo_id'], 'valor': fila['atributo__valor'], 'cantidad': fila['cantidad']}
+            )
+
+        return {
+            'total': FacetaService.filtrar(queryset, filtros).count(),
+            'marcas': FacetaService._agrupar(sin('marca'), 'marca_id', 'marca__nombre'),
+            'tipos': FacetaService._agrupar(sin('tipo'), 'tipo_id', 'tipo__nombre'),
+            'categorias': FacetaService._agrupar(sin('categoria'), 'categoria_id', 'categoria__nombre'),
+            'atributos': dict(atributos),
+            'precios': [
+                {'banda': clave, 'desde': desde, 'hasta': hasta, 'cantidad': precios[clave]}
+                for clave, desde, hasta in BANDAS_PRECIO
+            ],
+            'en_stock': stock['en_stock'],
+        }
+
+    @staticmethod
+    def facetas(filtros):
+        """
+        Las páginas de categoría sin filtros son las más visitadas: sus conteos se cachean en
+        el grupo 'facetas', que se invalida con cambios de productos, atributos o stock.
+        """
+        if set(filtros) - {'categoria'}:
+            return FacetaService.calcular(filtros)
+        return CacheService.obtener(
+            'facetas', f"categoria:{filtros.get('categoria', '')}", lambda: FacetaService.calcular(filtros)
+        )
@@ -0,0 +1,227 @@
+from copy import deepcopy
+from decimal import Decimal
+from io import BytesIO
+from xml.sax.saxutils import escape
+from django.db.models import Prefetch, QuerySet
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_LEFT, TA_RIGHT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import mm
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from productos.models.configuracion import InformacionWeb
+from productos.models.venta import Venta, DetalleVenta
+
+MARGEN = 8*mm
+ANCHOS_COLUMNAS = [10*mm, 90*mm, 30*mm, 20*mm, 30*mm]
+GRIS_PIE = colors.Color(100/255, 100/255, 100/255)
+
+
+def _estilo(base, **cambios):
+    # Copia el estilo de la hoja de ejemplo en lugar de mutarlo, así los estilos son inmutables y compartibles
+    estilo = deepcopy(base)
+    for atributo, valor in cambios.items():
+        setattr(estilo, atributo, valor)
+    return estilo
+
+
+# Estilos construidos una sola vez por proceso; cada factura los reutiliza
+_HOJA = getSampleStyleSheet()
+ESTILOS = {
+    'titulo': _estilo(_HOJA['Title'], name='FacturaTitulo', fontSize=12, textColor=colors.black, fontName='Helvetica-Bold'),
+    'empresa': _estilo(_HOJA['Heading1'], name='FacturaEmpresa', fontSize=20, alignment=TA_RIGHT),
+    'empresa_dato': _estilo(_HOJA['Normal'], name='FacturaEmpresaDato', fontSize=10, alignment=TA_RIGHT),
+    'numero': _estilo(_HOJA['Heading3'], name='FacturaNumero', fontSize=12, fontName='Helvetica-Bold'),
+    'derecha': _estilo(_HOJA['Normal'], name='FacturaDerecha', fontSize=12, alignment=TA_RIGHT),
+    'seccion': _estilo(_HOJA['Heading4'], name='FacturaSeccion', fontSize=12, fontName='Helvetica-Bold'),
+    'normal': _estilo(_HOJA['Normal'], name='FacturaNormal', fontSize=12, alignment=TA_LEFT),
+    'subtitulo': _estilo(_HOJA['Heading2'], name='FacturaSubtitulo', fontSize=14, fontName='Helvetica-Bold'),
+    'pie': _estilo(_HOJA['Normal'], name='FacturaPie', fontSize=8, alignment=TA_LEFT, textColor=GRIS_PIE),
+}
+ESTILO_SEPARADOR = TableStyle([('LINEBELOW', (0, 0), (-1, -1), 1, colors.black)])
+ESTILO_DETALLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.Color(50/255, 50/255, 50/255)),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+])
+ENCABEZADO_DETALLE = ["#", "Descripción", "Precio Unitario", "Cantidad", "Subtotal"]
+
+
+def _texto(valor, defecto='No disponible'):
+    # Los datos vienen de la base pero los cargan usuarios: se escapan para el mini-markup de Paragraph
+    return escape(str(valor)) if valor not in (None, '') else defecto
+
+
+class FacturaRenderer:
+    """
+    Genera el PDF de la factura a partir de Venta/DetalleVenta (no de datos enviados
+    por el cliente). Para reimpresiones masivas usar `renderizar_lote`.
+    """
+
+    @staticmethod
+    def ventas(venta_ids=None):
+        """Queryset con todo lo que necesita la factura en un número fijo de consultas."""
+        queryset = Venta.objects.select_related('comprador', 'barrio', 'tipo_envio').prefetch_related(
+            Prefetch(
+                'detalles',
+                queryset=DetalleVenta.objects.select_related('producto').only(
+                    'venta_id', 'combinacion', 'cantidad', 'precio_unitario', 'subtotal', 'producto__nombre'
+                ).order_by('id'),
+            ),
+            'comprador__perfilusuario_set',
+        )
+        if venta_ids is not None:
+            queryset = queryset.filter(id__in=venta_ids)
+        return queryset.order_by('id')
+
+    @staticmethod
+    def datos_empresa():
+        # Los datos de la empresa se cargan como InformacionWeb (nombre -> contenido)
+        return {
+            nombre: contenido or ''
+            for nombre, contenido in InformacionWeb.objects.values_list('nombre', 'contenido')
+            if nombre
+        }
+
+    @staticmethod
+    def renderizar(venta, empresa=None, detalles=None) -> bytes:
+        if empresa is None:
+            empresa = FacturaRenderer.datos_empresa()
+        buffer = BytesIO()
+        doc = SimpleDocTemplate(
+            buffer, pagesize=A4, rightMargin=MARGEN, leftMargin=MARGEN, topMargin=MARGEN, bottomMargin=MARGEN
+        )
+        if detalles is None:
+            detalles = venta.detalles.all()
+        doc.build(FacturaRenderer._elementos(venta, detalles, empresa, doc.width))
+        return buffer.getvalue()
+
+    @staticmethod
+    def renderizar_lote(ventas, empresa=None):
+        """
+        Genera (venta, pdf) para cada venta, de a una para no acumular todos los PDFs
+        en memoria. Acepta ids o un queryset/lista de ventas ya planificado.
+        """
+        if empresa is None:
+            empresa = FacturaRenderer.datos_empresa()
+        if isinstance(ventas, QuerySet):
+            ventas = ventas.iterator(chunk_size=100)
+        else:
+            ventas = list(ventas)
+            if ventas and not isinstance(ventas[0], Venta):
+                ventas = FacturaRenderer.ventas(ventas).iterator(chunk_size=100)
+        for venta in ventas:
+            yield venta, FacturaRenderer.renderizar(venta, empresa)
+
+    @staticmethod
+    def _cliente(venta):
+        comprador = venta.comprador
+        if comprador is None:
+            return {'nombre': venta.comprador_sin_cuenta, 'correo': None, 'telefono': None, 'pais': None, 'dni': None}
+        perfil = next(iter(comprador.perfilusuario_set.all()), None)
+        return {
+            'nombre': (perfil and perfil.nombre_apellido) or comprador.get_full_name() or comprador.username,
+            'correo': comprador.email,
+            'telefono': perfil and perfil.telefono,
+            'pais': perfil and perfil.pais,
+            'dni': perfil and perfil.dni,
+        }
+
+    @staticmethod
+    def _elementos(venta, detalles, empresa, ancho_pagina):
+        cliente = FacturaRenderer._cliente(venta)
+        elementos = [
+            Paragraph("Factura Fiscal", ESTILOS['titulo']),
+            Paragraph(_texto(empresa.get('nombre'), ''), ESTILOS['empresa']),
+            Paragraph(
+                f"Dirección: {_texto(empresa.get('direccion'), 'N/A')}, "
+                f"{_texto(empresa.get('ciudad'), 'N/A')}, {_texto(empresa.get('pais'), 'N/A')}",
+                ESTILOS['empresa_dato']
+            ),
+            Paragraph(
+                f"Tel: {_texto(empresa.get('telefono'), 'N/A')} | Email: {_texto(empresa.get('email'), 'N/A')}",
+                ESTILOS['empresa_dato']
+            ),
+            Spacer(1, 35),
+            Paragraph(f"Factura N°: {str(venta.id).zfill(8)}", ESTILOS['numero']),
+            Paragraph(f"Fecha de Emisión: {timezone.now().strftime('%d/%m/%Y')}", ESTILOS['derecha']),
+            Spacer(1, 10),
+            Paragraph("Cliente:", ESTILOS['seccion']),
+            Spacer(1, 5),
+            Paragraph(f"Nombre: {_texto(cliente['nombre'], 'Desconocido')}", ESTILOS['normal']),
+            Paragraph(f"Teléfono: {_texto(cliente['telefono'])}", ESTILOS['normal']),
+            Paragraph(f"Correo: {_texto(cliente['correo'])}", ESTILOS['normal']),
+            Paragraph(f"Dirección: {_texto(venta.domicilio)}", ESTILOS['normal']),
+            Paragraph(f"Barrio: {_texto(venta.barrio, 'N/A')}", ESTILOS['normal']),
+            Paragraph(f"País/Estado: {_texto(cliente['pais'], 'N/A')}", ESTILOS['normal']),
+            Paragraph(f"ID Fiscal: {_texto(cliente['dni'], 'No proporcionado')}", ESTILOS['normal']),
+            Spacer(1, 35),
+            Paragraph("Detalles de Entrega:", ESTILOS['seccion']),
+            Spacer(1, 5),
+            Paragraph(f"Método: {_texto(venta.tipo_envio)}", ESTILOS['normal']),
+            Paragraph(
+                f"Fecha de Venta: {timezone.localtime(venta.fecha_venta).strftime('%d/%m/%Y') if venta.fecha_venta else 'No disponible'}",
+                ESTILOS['normal']
+            ),
+            Paragraph(
+                f"Fecha de Entrega: {venta.fecha_entrega.strftime('%d/%m/%Y') if venta.fecha_entrega else 'No disponible'}",
+                ESTILOS['normal']
+            ),
+            Paragraph(f"Horario: {_texto(venta.horario_entrega)}", ESTILOS['normal']),
+            Spacer(1, 20),
+            Table([['']], colWidths=[ancho_pagina], rowHeights=[1], style=ESTILO_SEPARADOR),
+            Spacer(1, 10),
+            Paragraph("Detalles de la Compra", ESTILOS['subtitulo']),
+            Spacer(1, 5),
+        ]
+
+        filas = [ENCABEZADO_DETALLE]
+        subtotal = Decimal('0')
+        for index, detalle in enumerate(detalles, 1):
+            combinacion = ", ".join(
+                f"{item.get('tipo', '')}: {item.get('valor', '')}" for item in detalle.combinacion or []
+                if isinstance(item, dict)
+            ) or "N/A"
+            nombre = detalle.producto.nombre if detalle.producto else 'Desconocido'
+            subtotal += detalle.subtotal
+            filas.append([
+                str(index),
+                f"{nombre} ({combinacion})",
+                f"${detalle.precio_unitario:.2f}",
+                str(detalle.cantidad),
+                f"${detalle.subtotal:.2f}",
+            ])
+        # repeatRows: en pedidos largos la tabla parte en varias páginas con el encabezado repetido
+        elementos.append(Table(filas, colWidths=ANCHOS_COLUMNAS, style=ESTILO_DETALLE, repeatRows=1))
+        elementos.append(Spacer(1, 10))
+
+        try:
+            tasa_impuesto = Decimal(empresa.get('impuesto') or 0) / 100
+        except ArithmeticError:
+            tasa_impuesto = Decimal('0')
+        precio_envio = (venta.barrio.precio if venta.barrio else None) or Decimal('0')
+        impuesto_valor = subtotal * tasa_impuesto
+        total = venta.precio_total if venta.precio_total is not None else subtotal + precio_envio + impuesto_valor
+
+        elementos += [
+            Paragraph(f"Subtotal: ${subtotal:.2f}", ESTILOS['derecha']),
+            Paragraph(f"Envío: ${precio_envio:.2f}", ESTILOS['derecha']),
+            Paragraph(f"Impuesto ({tasa_impuesto * 100:.1f}%): ${impuesto_valor:.2f}", ESTILOS['derecha']),
+            Paragraph(f"Total: ${total:.2f}", ESTILOS['derecha']),
+            Paragraph(f"Moneda: {_texto(empresa.get('moneda_local'), '')}", ESTILOS['derecha']),
+            Spacer(1, 50),
+            Paragraph(f"Puntos acumulados: {venta.puntos_club_acumulados or 0}", ESTILOS['normal']),
+            Spacer(1, 10),
+            Paragraph(
+                "Este documento es un comprobante fiscal válido. Conservar para fines fiscales.<br/>"
+                f"Emitido conforme a las leyes fiscales aplicables en {_texto(empresa.get('pais'), 'N/A')}.<br/>"
+                "Para reclamos, contactar a info@empresa.com dentro de los 30 días posteriores a la emisión.",
+                ESTILOS['pie']
+            ),
+        ]
+        return elementos
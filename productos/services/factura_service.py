@@ -0,0 +1,74 @@
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from productos.models.venta import Venta
+from productos.services.correo_service import CorreoService
+from productos.services.factura_renderer import FacturaRenderer
+from productos.services.tareas_service import TareaService, ErrorPermanente
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FacturaService:
+    @staticmethod
+    def nombre_pdf(venta_id):
+        return f"Factura_{str(venta_id).zfill(8)}.pdf"
+
+    @staticmethod
+    def encolar(venta, usuario, correo=None):
+        # Una tarea por venta: los dobles clics mientras está pendiente devuelven la tarea existente,
+        # y un pedido posterior la reabre para volver a mandar el mail (con el PDF ya subido).
+        # El contenido de la factura sale de la venta; `correo` solo se usa para ventas sin cuenta.
+        return TareaService.encolar(
+            'factura_pdf',
+            {'venta_id': venta.id, 'correo': correo, 'solicitada': timezone.now().isoformat()},
+            clave=f'factura:{venta.id}',
+            usuario=usuario,
+            reabrir=True,
+        )
+
+    @staticmethod
+    def destinatario(venta, correo=None):
+        if venta.comprador and venta.comprador.email:
+            return venta.comprador.email
+        return correo
+
+
+def procesar_tarea_factura(tarea):
+    """Renderiza y sube a S3 la factura y encola el mail con el PDF. Cada paso ya hecho se saltea al reintentar."""
+    venta_id = tarea.payload['venta_id']
+
+    venta = FacturaRenderer.ventas([venta_id]).first()
+    if venta is None:
+        raise ErrorPermanente(f"Venta con ID {venta_id} no encontrada")
+
+    pdf_name = FacturaService.nombre_pdf(venta_id)
+    if not (tarea.resultado.get('pdf_subido') and venta.comprobante_pdf):
+        TareaService.actualizar_progreso(tarea, 'renderizando')
+        pdf = FacturaRenderer.renderizar(venta)
+        TareaService.actualizar_progreso(tarea, 'subiendo')
+        venta.comprobante_pdf.save(pdf_name, ContentFile(pdf), save=True)
+        TareaService.actualizar_progreso(tarea, 'pdf subido', pdf_subido=True, pdf_url=venta.comprobante_pdf.url)
+
+    # Cada pedido manda su mail; los reintentos del mismo pedido no lo duplican
+    solicitada = tarea.payload.get('solicitada', '')
+    if not (tarea.resultado.get('correo_id') and tarea.resultado.get('solicitada', '') == solicitada):
+        destinatario = FacturaService.destinatario(venta, tarea.payload.get('correo'))
+        if not destinatario:
+            raise ErrorPermanente(f"La venta #{venta_id} no tiene un correo al que enviar la factura")
+        nombre = venta.comprador.username if venta.comprador else venta.comprador_sin_cuenta
+        # El envío (con el PDF ya subido como adjunto) lo hace el worker de correos
+        correo = CorreoService.encolar(
+            'factura',
+            f"Factura #{venta_id}",
+            f"Hola {nombre},\n\nAdjuntamos el comprobante de tu compra (Factura #{venta_id}).\n\nGracias por tu compra!",
+            [destinatario],
+            remitente=os.getenv('EMAIL_HOST'),
+            adjuntos=[{'nombre': pdf_name, 'ruta': venta.comprobante_pdf.name, 'mime': 'application/pdf'}],
+            clave=f'factura:{venta_id}:{solicitada}',
+        )
+        TareaService.actualizar_progreso(tarea, 'email encolado', correo_id=correo.id, solicitada=solicitada)
+        logger.info(f"Factura de la venta #{venta_id} encolada para {destinatario} (correo #{correo.id})")
+
+    return {'pdf_url': venta.comprobante_pdf.url}
@@ -0,0 +1,363 @@
+import csv
+import io
+import json
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from django.db import DatabaseError, transaction
+from django.db.models import Prefetch
+from productos.models.categoria import Categoria
+from productos.models.producto import Producto, ProductoAtributo, Marca, TipoProducto, Atributo
+from productos.services.busqueda_service import BusquedaService
+from productos.services.producto_service import ProductoService
+
+# Una fila CSV por producto/atributo; en JSONL una línea por producto con la lista `atributos`
+COLUMNAS_PRODUCTO = [
+    'nombre', 'modelo_talle', 'descripcion', 'precio', 'descuento', 'valor_en_puntos',
+    'puntos_club_acumulables', 'tendencia', 'marca', 'tipo', 'categoria',
+]
+COLUMNAS_CSV = COLUMNAS_PRODUCTO + ['atributo_nombre', 'atributo_valor', 'stock']
+CAMPOS_ACTUALIZABLES = [
+    'descripcion', 'precio', 'descuento', 'valor_en_puntos', 'puntos_club_acumulables', 'tendencia',
+]
+# Marca, tipo y categoría solo se actualizan si la fila los trae: en blanco conservan el valor actual
+CAMPOS_REFERENCIA = ['marca', 'tipo', 'categoria']
+FORMATOS = ('csv', 'jsonl')
+TAMANIO_LOTE = 500
+MAX_ERRORES_REPORTADOS = 1000
+
+
+class ErrorFila(ValueError):
+    pass
+
+
+def _texto(valor):
+    return str(valor).strip() if valor not in (None, '') else ''
+
+
+def _decimal(fila, campo, digitos_enteros, requerido=False):
+    valor = _texto(fila.get(campo))
+    if not valor:
+        if requerido:
+            raise ErrorFila(f"'{campo}' es obligatorio")
+        return None
+    try:
+        numero = Decimal(valor.replace(',', '.'))
+    except InvalidOperation:
+        raise ErrorFila(f"'{campo}' no es un número: {valor}")
+    if not numero.is_finite():
+        raise ErrorFila(f"'{campo}' no es un número: {valor}")
+    numero = numero.quantize(Decimal('0.01'))
+    if numero < 0 or numero >= 10 ** digitos_enteros:
+        raise ErrorFila(f"'{campo}' fuera de rango: {valor}")
+    return numero
+
+
+def _entero(fila, campo, defecto=None):
+    valor = _texto(fila.get(campo))
+    if not valor:
+        return defecto
+    try:
+        numero = int(valor)
+    except ValueError:
+        raise ErrorFila(f"'{campo}' no es un entero: {valor}")
+    if numero < 0:
+        raise ErrorFila(f"'{campo}' no puede ser negativo")
+    return numero
+
+
+def _largo(valor, campo, maximo=100):
+    if len(valor) > maximo:
+        raise ErrorFila(f"'{campo}' supera los {maximo} caracteres")
+    return valor
+
+
+class _Catalogos:
+    """Mapas nombre -> id de las tablas de referencia; los faltantes se crean por lote."""
+
+    def __init__(self):
+        self.cargar()
+
+    def cargar(self):
+        self.mapas = {}
+        for modelo in (Marca, TipoProducto, Categoria):
+            mapa = {}
+            # Los nombres no son únicos: gana el de menor id, como un .filter(nombre=..).first()
+            for id_, nombre in modelo.objects.order_by('-id').values_list('id', 'nombre'):
+                mapa[nombre] = id_
+            self.mapas[modelo] = mapa
+        self.atributos = {
+            (nombre, valor): id_ for id_, nombre, valor in Atributo.objects.values_list('id', 'nombre', 'valor')
+        }
+
+    def resolver(self, modelo, nombres):
+        mapa = self.mapas[modelo]
+        faltantes = sorted({nombre for nombre in nombres if nombre and nombre not in mapa})
+        if faltantes:
+            for objeto in modelo.objects.bulk_create([modelo(nombre=nombre) for nombre in faltantes]):
+                mapa[objeto.nombre] = objeto.id
+            # Algunos backends no devuelven ids en bulk_create
+            if any(mapa.get(nombre) is None for nombre in faltantes):
+                mapa.update(modelo.objects.filter(nombre__in=faltantes).values_list('nombre', 'id'))
+        return mapa
+
+    def resolver_atributos(self, pares):
+        faltantes = sorted({par for par in pares if par not in self.atributos})
+        if faltantes:
+            Atributo.objects.bulk_create(
+                [Atributo(nombre=nombre, valor=valor) for nombre, valor in faltantes], ignore_conflicts=True
+            )
+            for id_, nombre, valor in Atributo.objects.filter(
+                valor__in={valor for _, valor in faltantes}
+            ).values_list('id', 'nombre', 'valor'):
+                self.atributos[(nombre, valor)] = id_
+        return self.atributos
+
+
+class ResultadoImportacion:
+    def __init__(self):
+        self.productos = 0
+        self.atributos = 0
+        self.errores = []
+        self.filas_con_error = 0
+
+    def error(self, linea, mensaje):
+        self.filas_con_error += 1
+        if len(self.errores) < MAX_ERRORES_REPORTADOS:
+            self.errores.append({'linea': linea, 'error': str(mensaje)})
+
+    def como_dict(self):
+        return {
+            'productos': self.productos,
+            'atributos': self.atributos,
+            'filas_con_error': self.filas_con_error,
+            'errores': self.errores,
+        }
+
+
+class ImportacionService:
+    """
+    Importación/exportación masiva del catálogo. La importación lee el archivo por lotes,
+    hace upsert de productos por (nombre, modelo_talle) y de stock por (producto, atributo)
+    con bulk_create(update_conflicts=True), y registra los errores por fila sin cortar.
+    """
+
+    @staticmethod
+    def formato(nombre_archivo, formato=None):
+        formato = (formato or nombre_archivo.rsplit('.', 1)[-1]).lower()
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato no soportado: {formato} (usar {', '.join(FORMATOS)})")
+        return formato
+
+    @staticmethod
+    def leer(archivo_binario, formato):
+        """Genera (linea, producto) con los atributos en `producto['atributos']`."""
+        texto = io.TextIOWrapper(archivo_binario, encoding='utf-8-sig', newline='')
+        if formato == 'csv':
+            lector = csv.DictReader(texto)
+            for fila in lector:
+                linea = lector.line_num
+                atributo = {'nombre': fila.get('atributo_nombre'), 'valor': fila.get('atributo_valor'), 'stock': fila.get('stock')}
+                fila['atributos'] = [atributo] if _texto(atributo['valor']) else []
+                yield linea, fila
+        else:
+            for linea, contenido in enumerate(texto, start=1):
+                if not contenido.strip():
+                    continue
+                try:
+                    fila = json.loads(contenido)
+                    if not isinstance(fila, dict):
+                        raise ValueError("se esperaba un objeto")
+                except ValueError as e:
+                    yield linea, ErrorFila(f"JSON inválido: {e}")
+                    continue
+                yield linea, fila
+
+    @staticmethod
+    def _normalizar(fila):
+        nombre = _largo(_texto(fila.get('nombre')), 'nombre')
+        modelo_talle = _largo(_texto(fila.get('modelo_talle')), 'modelo_talle')
+        if not nombre or not modelo_talle:
+            raise ErrorFila("'nombre' y 'modelo_talle' son obligatorios (identifican al producto)")
+        tendencia = _texto(fila.get('tendencia')).lower()
+        atributos = []
+        for atributo in fila.get('atributos') or []:
+            if not isinstance(atributo, dict):
+                raise ErrorFila("'atributos' debe ser una lista de objetos {nombre, valor, stock}")
+            valor = _largo(_texto(atributo.get('valor')), 'atributo_valor')
+            if not valor:
+                raise ErrorFila("cada atributo necesita 'valor'")
+            atributos.append((
+                _largo(_texto(atributo.get('nombre')), 'atributo_nombre') or None, valor, _entero(atributo, 'stock', 0)
+            ))
+        return {
+            'nombre': nombre,
+            'modelo_talle': modelo_talle,
+            'descripcion': _texto(fila.get('descripcion')),
+            'precio': _decimal(fila, 'precio', 8, requerido=True),
+            'descuento': _decimal(fila, 'descuento', 2),
+            'valor_en_puntos': _decimal(fila, 'valor_en_puntos', 8) or Decimal('0'),
+            'puntos_club_acumulables': _entero(fila, 'puntos_club_acumulables'),
+            'tendencia': tendencia in ('1', 'true', 'si', 'sí') if tendencia else None,
+            'marca': _largo(_texto(fila.get('marca')), 'marca'),
+            'tipo': _largo(_texto(fila.get('tipo')), 'tipo'),
+            'categoria': _largo(_texto(fila.get('categoria')), 'categoria', 50),
+            'atributos': atributos,
+        }
+
+    @staticmethod
+    def importar(filas, tamanio_lote=TAMANIO_LOTE):
+        """Importa las filas de `leer()` por lotes; cada lote se confirma por separado."""
+        resultado = ResultadoImportacion()
+        catalogos = _Catalogos()
+        filas = iter(filas)
+        while True:
+            lote = list(islice(filas, tamanio_lote))
+            if not lote:
+                break
+            productos = {}
+            for linea, fila in lote:
+                try:
+                    if isinstance(fila, Exception):
+                        raise fila
+                    datos = ImportacionService._normalizar(fila)
+                except ErrorFila as e:
+                    resultado.error(linea, e)
+                    continue
+                clave = (datos['nombre'], datos['modelo_talle'])
+                # Las filas del mismo producto (CSV con un atributo por fila) se combinan
+                if clave in productos:
+                    previos = productos[clave][1]
+                    datos['atributos'] = previos['atributos'] + datos['atributos']
+                    for campo in CAMPOS_REFERENCIA:
+                        datos[campo] = datos[campo] or previos[campo]
+                productos[clave] = (productos.get(clave, (linea,))[0], datos)
+            if productos:
+                ImportacionService._guardar_lote(list(productos.values()), catalogos, resultado)
+        return resultado
+
+    @staticmethod
+    def _guardar_lote(productos, catalogos, resultado):
+        try:
+            with transaction.atomic():
+                ImportacionService._guardar(productos, catalogos, resultado)
+        except DatabaseError:
+            # Se reintenta de a uno para aislar las filas que rechaza la base. Los mapas se
+            # recargan tras cada rollback: pueden tener ids de marcas/atributos que se deshicieron
+            catalogos.cargar()
+            for linea, datos in productos:
+                try:
+                    with transaction.atomic():
+                        ImportacionService._guardar([(linea, datos)], catalogos, resultado)
+                except DatabaseError as e:
+                    catalogos.cargar()
+                    resultado.error(linea, e)
+
+    @staticmethod
+    def _guardar(productos, catalogos, resultado):
+        marcas = catalogos.resolver(Marca, [datos['marca'] for _, datos in productos])
+        tipos = catalogos.resolver(TipoProducto, [datos['tipo'] for _, datos in productos])
+        categorias = catalogos.resolver(Categoria, [datos['categoria'] for _, datos in productos])
+        atributos = catalogos.resolver_atributos(
+            [(nombre, valor) for _, datos in productos for nombre, valor, _ in datos['atributos']]
+        )
+
+        # Un upsert por combinación de referencias presentes (en la práctica, uno o dos por lote)
+        grupos = defaultdict(list)
+        for _, datos in productos:
+            grupos[tuple(campo for campo in CAMPOS_REFERENCIA if datos[campo])].append(Producto(
+                nombre=datos['nombre'], modelo_talle=datos['modelo_talle'], descripcion=datos['descripcion'],
+                precio=datos['precio'], descuento=datos['descuento'], valor_en_puntos=datos['valor_en_puntos'],
+                puntos_club_acumulables=datos['puntos_club_acumulables'], tendencia=datos['tendencia'],
+                marca_id=marcas.get(datos['marca']), tipo_id=tipos.get(datos['tipo']),
+                categoria_id=categorias.get(datos['categoria']),
+            ))
+        for referencias, objetos in grupos.items():
+            Producto.objects.bulk_create(
+                objetos, update_conflicts=True, unique_fields=['nombre', 'modelo_talle'],
+                update_fields=CAMPOS_ACTUALIZABLES + list(referencias),
+            )
+        ids = {
+            (nombre, modelo_talle): id_ for id_, nombre, modelo_talle in Producto.objects.filter(
+                modelo_talle__in={datos['modelo_talle'] for _, datos in productos},
+                nombre__in={datos['nombre'] for _, datos in productos},
+            ).values_list('id', 'nombre', 'modelo_talle')
+        }
+
+        lineas = {}
+        for _, datos in productos:
+            producto_id = ids[(datos['nombre'], datos['modelo_talle'])]
+            for nombre, valor, stock in datos['atributos']:
+                lineas[(producto_id, atributos[(nombre, valor)])] = stock
+        ProductoAtributo.objects.bulk_create(
+            [ProductoAtributo(producto_id=p, atributo_id=a, stock=stock) for (p, a), stock in lineas.items()],
+            update_conflicts=True, unique_fields=['producto', 'atributo'], update_fields=['stock'],
+        )
+
+        # bulk_create no dispara señales: totales, vector de búsqueda y facetas se actualizan acá
+        producto_ids = list(ids.values())
+        ProductoService.actualizar_totales(producto_ids)
+        BusquedaService.actualizar_vectores(producto_ids)
+        resultado.productos += len(productos)
+        resultado.atributos += len(lineas)
+
+    @staticmethod
+    def productos_exportables():
+        return Producto.objects.select_related('marca', 'tipo', 'categoria').prefetch_related(
+            Prefetch('producto_atributos', queryset=ProductoAtributo.objects.select_related('atributo').order_by('id'))
+        ).defer('qr_code', 'search_vector').order_by('id')
+
+    @staticmethod
+    def _fila_producto(producto):
+        return {
+            'nombre': producto.nombre,
+            'modelo_talle': producto.modelo_talle,
+            'descripcion': producto.descripcion,
+            'precio': str(producto.precio),
+            'descuento': str(producto.descuento) if producto.descuento is not None else '',
+            'valor_en_puntos': str(producto.valor_en_puntos) if producto.valor_en_puntos is not None else '',
+            'puntos_club_acumulables': producto.puntos_club_acumulables,
+            'tendencia': producto.tendencia,
+            'marca': producto.marca.nombre if producto.marca else '',
+            'tipo': producto.tipo.nombre if producto.tipo else '',
+            'categoria': producto.categoria.nombre if producto.categoria else '',
+        }
+
+    @staticmethod
+    def exportar(formato, queryset=None, chunk_size=TAMANIO_LOTE):
+        """Genera el archivo línea por línea (str); nunca carga el catálogo entero en memoria."""
+        if queryset is None:
+            queryset = ImportacionService.productos_exportables()
+        productos = queryset.iterator(chunk_size=chunk_size)
+
+        if formato == 'jsonl':
+            for producto in productos:
+                fila = ImportacionService._fila_producto(producto)
+                fila['atributos'] = [
+                    {'nombre': pa.atributo.nombre, 'valor': pa.atributo.valor, 'stock': pa.stock}
+                    for pa in producto.producto_atributos.all()
+                ]
+                yield json.dumps(fila, ensure_ascii=False) + '\n'
+            return
+
+        buffer = io.StringIO()
+        escritor = csv.DictWriter(buffer, fieldnames=COLUMNAS_CSV)
+
+        def vaciar():
+            contenido = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return contenido
+
+        escritor.writeheader()
+        yield vaciar()
+        for producto in productos:
+            fila = ImportacionService._fila_producto(producto)
+            atributos = list(producto.producto_atributos.all())
+            if not atributos:
+                escritor.writerow(fila)
+            for pa in atributos:
+                escritor.writerow({
+                    **fila, 'atributo_nombre': pa.atributo.nombre or '', 'atributo_valor': pa.atributo.valor, 'stock': pa.stock
+                })
+            yield vaciar()
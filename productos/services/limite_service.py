@@ -0,0 +1,171 @@
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+import logging
+
+logger = logging.getLogger(__name__)
+
+PERIODOS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+# El fallback en sqlite borra las cubetas ya llenas (equivalen a no tener registro) cada tantas consultas
+PURGA_CADA = 200
+
+# Token bucket atómico en Redis: recarga según el tiempo transcurrido, consume una ficha
+# y deja la clave con vencimiento para cuando la cubeta vuelva a estar llena.
+SCRIPT_REDIS = """
+local capacidad = tonumber(ARGV[1])
+local recarga = tonumber(ARGV[2])
+local ahora = tonumber(ARGV[3])
+local datos = redis.call('HMGET', KEYS[1], 'fichas', 'ts')
+local fichas = tonumber(datos[1]) or capacidad
+local ts = tonumber(datos[2]) or ahora
+fichas = math.min(capacidad, fichas + math.max(0, ahora - ts) * recarga)
+local espera = 0
+if fichas >= 1 then
+    fichas = fichas - 1
+else
+    espera = (1 - fichas) / recarga
+end
+redis.call('HSET', KEYS[1], 'fichas', tostring(fichas), 'ts', tostring(ahora))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacidad - fichas) / recarga * 1000) + 1000)
+return tostring(espera)
+"""
+
+
+def parsear_tasa(tasa):
+    """'5/m' -> (capacidad 5, recarga 5/60 fichas por segundo); mismo formato que usaba django-ratelimit."""
+    cantidad, periodo = tasa.split('/')
+    return int(cantidad), int(cantidad) / PERIODOS[periodo]
+
+
+# Clave compartida cuando no se puede saber la IP: esas requests se limitan juntas, no quedan libres
+IP_DESCONOCIDA = 'desconocida'
+
+
+def ip_cliente(request):
+    """
+    IP del cliente según LIMITES_IP_META_KEY (X-Real-IP detrás de nginx; con X-Forwarded-For se toma
+    la última, la que agrega el proxy). Detrás de un socket unix REMOTE_ADDR viene vacío o no viene.
+    """
+    ip = (request.META.get(settings.LIMITES_IP_META_KEY) or '').split(',')[-1].strip()
+    if not ip:
+        logger.warning(f"No se pudo obtener la IP del cliente de {settings.LIMITES_IP_META_KEY} para {request.path}")
+        return IP_DESCONOCIDA
+    return ip
+
+
+class AlmacenRedis:
+    """Cubetas en el Redis de la caché (REDIS_URL): compartidas por todos los workers y servidores."""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.script = None
+
+    def consumir(self, clave, capacidad, recarga):
+        cliente = self.cache._cache.get_client(write=True)
+        if self.script is None:
+            self.script = cliente.register_script(SCRIPT_REDIS)
+        espera = self.script(
+            keys=[self.cache.make_and_validate_key(f"limite:{clave}")],
+            args=[capacidad, recarga, time.time()],
+            client=cliente,
+        )
+        return float(espera)
+
+
+class AlmacenSqlite:
+    """
+    Fallback sin Redis: las cubetas en un archivo sqlite compartido por los procesos de la máquina
+    (BEGIN IMMEDIATE serializa la lectura y escritura de cada consumo). Se purgan las cubetas llenas
+    y se acota la cantidad de claves a LIMITES_MAX_CLAVES.
+    """
+
+    def __init__(self, ruta, max_claves):
+        self.ruta = ruta
+        self.max_claves = max_claves
+        self.local = threading.local()
+
+    def conexion(self):
+        conexion = getattr(self.local, 'conexion', None)
+        if conexion is None:
+            os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+            conexion = sqlite3.connect(self.ruta, timeout=5, isolation_level=None)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS cubetas (clave TEXT PRIMARY KEY, fichas REAL, ts REAL, llena REAL)"
+            )
+            conexion.execute("CREATE INDEX IF NOT EXISTS cubetas_llena ON cubetas (llena)")
+            self.local.conexion = conexion
+        return conexion
+
+    def consumir(self, clave, capacidad, recarga):
+        conexion = self.conexion()
+        ahora = time.time()
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            fila = conexion.execute("SELECT fichas, ts FROM cubetas WHERE clave = ?", (clave,)).fetchone()
+            fichas, ts = fila if fila else (capacidad, ahora)
+            fichas = min(capacidad, fichas + max(0, ahora - ts) * recarga)
+            espera = 0
+            if fichas >= 1:
+                fichas -= 1
+            else:
+                espera = (1 - fichas) / recarga
+            conexion.execute(
+                "INSERT OR REPLACE INTO cubetas (clave, fichas, ts, llena) VALUES (?, ?, ?, ?)",
+                (clave, fichas, ahora, ahora + (capacidad - fichas) / recarga),
+            )
+            if random.randrange(PURGA_CADA) == 0:
+                self.purgar(conexion, ahora)
+            conexion.execute("COMMIT")
+        except Exception:
+            conexion.execute("ROLLBACK")
+            raise
+        return espera
+
+    def purgar(self, conexion, ahora):
+        conexion.execute("DELETE FROM cubetas WHERE llena < ?", (ahora,))
+        sobrantes = conexion.execute("SELECT COUNT(*) FROM cubetas").fetchone()[0] - self.max_claves
+        if sobrantes > 0:
+            # Si igual hay demasiadas claves, se descartan las más cerca de llenarse
+            conexion.execute(
+                "DELETE FROM cubetas WHERE clave IN (SELECT clave FROM cubetas ORDER BY llena LIMIT ?)",
+                (sobrantes,),
+            )
+
+
+class LimiteService:
+    _almacen = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def almacen():
+        if LimiteService._almacen is None:
+            with LimiteService._lock:
+                if LimiteService._almacen is None:
+                    cache = caches['default']
+                    if settings.CACHES['default']['BACKEND'].endswith('RedisCache'):
+                        LimiteService._almacen = AlmacenRedis(cache)
+                    else:
+                        LimiteService._almacen = AlmacenSqlite(settings.LIMITES_SQLITE, settings.LIMITES_MAX_CLAVES)
+        return LimiteService._almacen
+
+    @staticmethod
+    def consumir(grupo, clave):
+        """
+        Consume una ficha de la cubeta `grupo` para `clave` (IP, usuario) según la tasa de
+        settings.LIMITES_TASA. Devuelve 0 si se permite o los segundos a esperar si no.
+        """
+        capacidad, recarga = parsear_tasa(settings.LIMITES_TASA[grupo])
+        # Claves de largo fijo: el usuario o la IP los elige el cliente
+        digest = hashlib.sha1(str(clave).encode()).hexdigest()[:20]
+        try:
+            return LimiteService.almacen().consumir(f"{grupo}:{digest}", capacidad, recarga)
+        except Exception as e:
+            # Si el almacén no responde se deja pasar: el limitador no debe tumbar el login
+            logger.warning(f"Limitador de tasa no disponible ({grupo}): {e}")
+            return 0
@@ -0,0 +1,174 @@
+from decimal import Decimal
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+from productos.models.venta import DetalleVenta, EstadosVenta, Pago, Venta
+from productos.services.pasarela_service import ErrorPasarela, pasarela
+from productos.services.reserva_service import ReservaService
+from productos.services.stock_service import StockService
+from productos.services.tareas_service import ErrorPermanente, TareaService
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Estado de Mercado Pago -> EstadosVenta.estado al que pasa la venta
+ESTADOS_VENTA_POR_PAGO = {
+    'approved': 'Pagada',
+    'authorized': 'Pendiente de pago',
+    'pending': 'Pendiente de pago',
+    'in_process': 'Pendiente de pago',
+    'in_mediation': 'En mediación',
+    'rejected': 'Pago rechazado',
+    'cancelled': 'Pago rechazado',
+    'refunded': 'Reembolsada',
+    'charged_back': 'Reembolsada',
+}
+# Estados de Mercado Pago con los que las unidades reservadas vuelven al stock disponible
+ESTADOS_PAGO_FALLIDO = ('rejected', 'cancelled', 'refunded', 'charged_back')
+# Estados que todavía pueden cambiar sin que llegue el webhook: justifican consultar a Mercado Pago
+ESTADOS_PAGO_PENDIENTE = ('pending', 'in_process', 'authorized', 'in_mediation')
+
+# verificar_pago: cuánto se reutiliza la respuesta mientras el pago está pendiente / ya resuelto
+VERIFICACION_TTL_PENDIENTE = 3
+VERIFICACION_TTL_FINAL = 5 * 60
+# Como mucho una consulta a Mercado Pago por pago cada tantos segundos, entre todos los procesos
+VERIFICACION_INTERVALO_CONSULTA = 10
+
+
+class PagoService:
+    @staticmethod
+    def registrar_notificacion(payment_id, evento):
+        """
+        Guarda la notificación de Mercado Pago como tarea (una por pago: los reintentos de MP
+        se deduplican) para que el webhook responda sin esperar a la API. Si el pago ya se
+        había procesado se reabre, porque la notificación puede traer un cambio de estado.
+        """
+        return TareaService.encolar(
+            'pago_mp', {'payment_id': str(payment_id), 'evento': evento},
+            clave=f"pago_mp:{payment_id}", max_intentos=8, reabrir=True,
+        )
+
+    @staticmethod
+    def estado_venta(status):
+        nombre = ESTADOS_VENTA_POR_PAGO.get(status)
+        if nombre is None:
+            return None
+        estado = EstadosVenta.objects.filter(estado=nombre).order_by('id').first()
+        return estado or EstadosVenta.objects.create(estado=nombre)
+
+    @staticmethod
+    def ultimo_pago(referencia):
+        """Último pago registrado con esa referencia (ventas creadas después del webhook)."""
+        return Pago.objects.filter(referencia=referencia).order_by('-fecha_actualizacion').first()
+
+    @staticmethod
+    def _clave_verificacion(payment_id):
+        return f"pago:verificacion:{payment_id}"
+
+    @staticmethod
+    async def averificar(payment_id):
+        """
+        Estado de un pago para el polling del frontend: {'status', 'referencia'} con status None si
+        no se conoce. Sale de la caché o de la tabla Pago (que llena el webhook); solo si el pago
+        sigue pendiente o todavía no llegó la notificación se consulta a Mercado Pago, y una sola
+        vez por intervalo: el que toma el candado (en la base, atómico con cualquier caché) consulta
+        y el resto responde con lo local. Async para que la consulta no bloquee el event loop.
+        """
+        clave = PagoService._clave_verificacion(payment_id)
+        datos = await cache.aget(clave)
+        if datos is not None:
+            return datos
+
+        pago = await Pago.objects.filter(mp_payment_id=payment_id).values('status', 'referencia').afirst()
+        datos = pago or {'status': None, 'referencia': None}
+        if not PagoService._resuelto(datos) and await sync_to_async(TareaService.tomar_candado)(
+            f"{clave}:consulta", VERIFICACION_INTERVALO_CONSULTA
+        ):
+            try:
+                info = await pasarela('mercadopago').aobtener_pago(payment_id)
+                pago, _ = await sync_to_async(PagoService.registrar)(info)
+                datos = {'status': pago.status, 'referencia': pago.referencia}
+            except ErrorPasarela as e:
+                logger.warning(f"No se pudo consultar el pago {payment_id}: {e}")
+        await cache.aset(clave, datos, VERIFICACION_TTL_FINAL if PagoService._resuelto(datos) else VERIFICACION_TTL_PENDIENTE)
+        return datos
+
+    @staticmethod
+    def verificar(payment_id):
+        """averificar() desde código sync (vistas WSGI, shell)."""
+        return async_to_sync(PagoService.averificar)(payment_id)
+
+    @staticmethod
+    def _resuelto(datos):
+        return bool(datos['status']) and datos['status'] not in ESTADOS_PAGO_PENDIENTE
+
+    @staticmethod
+    def registrar(info):
+        """Guarda (upsert por mp_payment_id) el pago de Mercado Pago y mueve la venta y las reservas asociadas."""
+        payer = info.get('payer') or {}
+        nombre = " ".join(filter(None, [payer.get('first_name'), payer.get('last_name')])) or payer.get('email') or ''
+        referencia = info.get('external_reference') or None
+        status = info.get('status') or 'pending'
+        with transaction.atomic():
+            pago, _ = Pago.objects.update_or_create(
+                mp_payment_id=str(info['id']),
+                defaults={
+                    'nombre': nombre[:255],
+                    'email': payer.get('email') or '',
+                    'monto': Decimal(str(info.get('transaction_amount') or 0)),
+                    'status': status,
+                    'mp_status_detail': info.get('status_detail'),
+                    'referencia': referencia,
+                },
+            )
+            ventas = 0
+            if referencia:
+                estado = PagoService.estado_venta(status)
+                if estado is not None:
+                    ventas_pago = Venta.objects.filter(referencia_pago=referencia)
+                    if status == 'approved':
+                        # Un pago aprobado por otro monto no aprueba la venta: queda para revisar a mano
+                        distintas = list(ventas_pago.exclude(precio_total=pago.monto).values_list('id', flat=True))
+                        if distintas:
+                            logger.error(f"Pago {pago.mp_payment_id} de {pago.monto} no coincide con las ventas {distintas}")
+                            ventas_pago = ventas_pago.exclude(id__in=distintas)
+                    ventas = ventas_pago.update(estado=estado)
+                if status == 'approved':
+                    ReservaService.confirmar(referencia)
+                elif status in ESTADOS_PAGO_FALLIDO:
+                    ReservaService.liberar(referencia)
+                    PagoService.devolver_stock(referencia)
+            # El próximo verificar_pago lee el estado nuevo
+            transaction.on_commit(lambda: cache.delete(PagoService._clave_verificacion(pago.mp_payment_id)))
+        return pago, ventas
+
+    @staticmethod
+    def devolver_stock(referencia):
+        """
+        Pago rechazado, cancelado o reembolsado de una venta ya registrada: las unidades que
+        descontó vuelven al stock. Una sola vez por venta (stock_devuelto), aunque MP repita el aviso.
+        """
+        ventas = list(Venta.objects.select_for_update().filter(
+            referencia_pago=referencia, stock_devuelto=False
+        ).values_list('id', flat=True))
+        if not ventas:
+            return 0
+        StockService.reponer(StockService.agrupar(
+            DetalleVenta.objects.filter(venta_id__in=ventas, producto_atributo__isnull=False)
+            .values_list('producto_atributo_id', 'cantidad')
+        ))
+        return Venta.objects.filter(id__in=ventas).update(stock_devuelto=True)
+
+
+def procesar_tarea_pago(tarea):
+    payment_id = tarea.payload['payment_id']
+    # Pool de conexiones, timeouts y circuit breaker en pasarela_service; si falla, la tarea se reintenta con backoff
+    try:
+        info = pasarela('mercadopago').obtener_pago(payment_id)
+    except ErrorPasarela as e:
+        if e.status == 404:
+            raise ErrorPermanente(f"Pago {payment_id} inexistente en Mercado Pago")
+        raise
+    pago, ventas = PagoService.registrar(info)
+    logger.info(f"Pago {payment_id} registrado: {pago.status} ({ventas} ventas actualizadas)")
+    return {'pago_id': pago.id, 'status': pago.status, 'ventas': ventas}
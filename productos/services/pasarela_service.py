@@ -0,0 +1,362 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+import weakref
+import httpx
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+PAISES_MERCADOPAGO = ("AR", "BR", "MX", "CO")
+MONEDAS_MERCADOPAGO = {"AR": "ARS", "BR": "BRL"}
+TITULO_ITEM = "Productos en Tienda Sollu-store"
+
+
+class ErrorPasarela(Exception):
+    def __init__(self, proveedor, mensaje, status=None):
+        self.proveedor = proveedor
+        self.status = status
+        super().__init__(f"{proveedor}: {mensaje}")
+
+
+class CircuitoAbierto(ErrorPasarela):
+    """El proveedor viene fallando: se responde al instante en lugar de esperar otro timeout."""
+
+
+class Circuito:
+    """
+    Circuit breaker de un proveedor, en memoria de cada proceso. Tras `fallas_maximas` errores
+    de red, timeouts o 5xx seguidos se abre y las llamadas fallan sin salir a la red durante
+    `enfriamiento` segundos; después deja pasar una sola de prueba que lo cierra o lo reabre.
+    """
+
+    def __init__(self, fallas_maximas, enfriamiento):
+        self.fallas_maximas = fallas_maximas
+        self.enfriamiento = enfriamiento
+        self.fallas = 0
+        self.abierto_desde = None
+        self.probando = False
+        self.lock = threading.Lock()
+
+    @property
+    def abierto(self):
+        return self.abierto_desde is not None
+
+    def permitir(self):
+        with self.lock:
+            if self.abierto_desde is None:
+                return True
+            if self.probando or time.monotonic() - self.abierto_desde < self.enfriamiento:
+                return False
+            self.probando = True
+            return True
+
+    def exito(self):
+        with self.lock:
+            self.fallas = 0
+            self.abierto_desde = None
+            self.probando = False
+
+    def falla(self):
+        with self.lock:
+            self.fallas += 1
+            if self.probando or self.fallas >= self.fallas_maximas:
+                self.abierto_desde = time.monotonic()
+            self.probando = False
+
+    def cancelar(self):
+        # La llamada de prueba terminó sin respuesta del proveedor (p. ej. request cancelado)
+        with self.lock:
+            self.probando = False
+
+
+class PasarelaPago:
+    """
+    Cliente HTTP de un proveedor de pagos con un pool de conexiones por proceso (y uno por
+    event loop para las variantes async `a*`), timeouts estrictos de conexión y lectura,
+    reintento solo de conexiones fallidas y circuit breaker. Las subclases arman los
+    requests (`datos_preferencia`, `ruta_pago`, `cabeceras`) e interpretan las respuestas.
+    """
+    nombre = None
+    url_base = None
+    ruta_preferencia = None
+
+    def __init__(self):
+        self.circuito = Circuito(settings.PASARELA_CIRCUITO_FALLAS, settings.PASARELA_CIRCUITO_ENFRIAMIENTO)
+        self._cliente = None
+        self._clientes_async = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def opciones_cliente(self):
+        return {
+            'base_url': self.url_base,
+            'timeout': httpx.Timeout(
+                settings.PASARELA_TIMEOUT_LECTURA,
+                connect=settings.PASARELA_TIMEOUT_CONEXION,
+                # Esperar un lugar en el pool también tiene límite: con el proveedor lento no se apilan requests
+                pool=settings.PASARELA_TIMEOUT_CONEXION,
+            ),
+            'limits': httpx.Limits(
+                max_connections=settings.PASARELA_CONEXIONES,
+                max_keepalive_connections=settings.PASARELA_CONEXIONES,
+            ),
+        }
+
+    @property
+    def cliente(self):
+        if self._cliente is None:
+            with self._lock:
+                if self._cliente is None:
+                    self._cliente = httpx.Client(**self.opciones_cliente(), transport=httpx.HTTPTransport(retries=2))
+        return self._cliente
+
+    def cliente_async(self):
+        loop = asyncio.get_running_loop()
+        cliente = self._clientes_async.get(loop)
+        if cliente is None:
+            cliente = httpx.AsyncClient(**self.opciones_cliente(), transport=httpx.AsyncHTTPTransport(retries=2))
+            self._clientes_async[loop] = cliente
+        return cliente
+
+    def cabeceras(self):
+        return {}
+
+    async def acabeceras(self):
+        return self.cabeceras()
+
+    def _verificar_circuito(self):
+        if not self.circuito.permitir():
+            raise CircuitoAbierto(self.nombre, "proveedor no disponible, reintentar en unos segundos", status=503)
+
+    def _interpretar(self, respuesta):
+        if respuesta.status_code >= 500:
+            self.circuito.falla()
+            raise ErrorPasarela(self.nombre, f"respondió {respuesta.status_code}", status=respuesta.status_code)
+        self.circuito.exito()
+        if respuesta.status_code >= 400:
+            raise ErrorPasarela(self.nombre, f"respondió {respuesta.status_code}: {respuesta.text[:200]}", status=respuesta.status_code)
+        return respuesta.json()
+
+    def _falla_de_red(self, error):
+        self.circuito.falla()
+        logger.warning(f"Error de red con {self.nombre}: {error!r}")
+        return ErrorPasarela(self.nombre, f"sin respuesta ({type(error).__name__})", status=504)
+
+    def solicitar(self, metodo, ruta, **kwargs):
+        self._verificar_circuito()
+        try:
+            respuesta = self.cliente.request(metodo, ruta, headers=self.cabeceras(), **kwargs)
+            return self._interpretar(respuesta)
+        except ErrorPasarela:
+            raise
+        except httpx.TransportError as e:
+            raise self._falla_de_red(e) from e
+        except BaseException:
+            self.circuito.cancelar()
+            raise
+
+    async def asolicitar(self, metodo, ruta, **kwargs):
+        self._verificar_circuito()
+        try:
+            respuesta = await self.cliente_async().request(metodo, ruta, headers=await self.acabeceras(), **kwargs)
+            return self._interpretar(respuesta)
+        except ErrorPasarela:
+            raise
+        except httpx.TransportError as e:
+            raise self._falla_de_red(e) from e
+        except BaseException:
+            self.circuito.cancelar()
+            raise
+
+    def url_pago(self, respuesta):
+        raise NotImplementedError
+
+    def _url_pago(self, respuesta):
+        try:
+            return self.url_pago(respuesta)
+        except (KeyError, StopIteration, TypeError):
+            raise ErrorPasarela(self.nombre, "la respuesta no trae el link de pago")
+
+    def crear_preferencia(self, email, items, total, country, referencia=None):
+        """Crea el pago en el proveedor y devuelve la URL a la que se redirige al comprador."""
+        datos = self.datos_preferencia(email, items, total, country, referencia)
+        return self._url_pago(self.solicitar('POST', self.ruta_preferencia, json=datos))
+
+    async def acrear_preferencia(self, email, items, total, country, referencia=None):
+        datos = self.datos_preferencia(email, items, total, country, referencia)
+        return self._url_pago(await self.asolicitar('POST', self.ruta_preferencia, json=datos))
+
+    def obtener_pago(self, payment_id):
+        return self.solicitar('GET', self.ruta_pago(payment_id))
+
+    async def aobtener_pago(self, payment_id):
+        return await self.asolicitar('GET', self.ruta_pago(payment_id))
+
+
+def url_frontend(ruta):
+    return f'{os.getenv("URL_FRONTEND")}/{ruta}'
+
+
+class MercadoPago(PasarelaPago):
+    nombre = 'mercadopago'
+    url_base = 'https://api.mercadopago.com'
+    ruta_preferencia = '/checkout/preferences'
+
+    def cabeceras(self):
+        return {'Authorization': f"Bearer {os.getenv('KEY_MP')}"}
+
+    def datos_preferencia(self, email, items, total, country, referencia=None):
+        moneda = MONEDAS_MERCADOPAGO.get(country, "MXN")
+        datos = {
+            "items": [
+                {"title": TITULO_ITEM, "quantity": 1, "unit_price": float(total), "currency_id": moneda},
+                {"title": TITULO_ITEM, "quantity": 1, "unit_price": 0, "currency_id": moneda},
+            ],
+            "payer": {"email": email},
+            "back_urls": {
+                "success": url_frontend("pago-exitoso"),
+                "failure": url_frontend("pago-fallido"),
+                "pending": url_frontend("pago-pendiente"),
+            },
+            "auto_return": "approved",
+        }
+        if referencia:
+            datos["external_reference"] = referencia
+        return datos
+
+    def url_pago(self, respuesta):
+        return respuesta["init_point"]
+
+    def ruta_pago(self, payment_id):
+        return f'/v1/payments/{payment_id}'
+
+
+class PayPal(PasarelaPago):
+    nombre = 'paypal'
+    ruta_preferencia = '/v1/payments/payment'
+
+    def __init__(self):
+        super().__init__()
+        self.url_base = 'https://api-m.paypal.com' if settings.PAYPAL_MODE == 'live' else 'https://api-m.sandbox.paypal.com'
+        self._token = None
+        self._token_vence = 0
+
+    def _pedido_token(self):
+        return {
+            'data': {'grant_type': 'client_credentials'},
+            'auth': (os.getenv('PAYPAL_CLIENT_ID') or '', os.getenv('PAYPAL_CLIENT_SECRET') or ''),
+        }
+
+    def _guardar_token(self, respuesta):
+        datos = self._interpretar(respuesta)
+        self._token = datos['access_token']
+        # Se renueva un minuto antes de que venza
+        self._token_vence = time.monotonic() + int(datos.get('expires_in', 0)) - 60
+
+    def _token_vigente(self):
+        return self._token and time.monotonic() < self._token_vence
+
+    def cabeceras(self):
+        if not self._token_vigente():
+            self._guardar_token(self.cliente.post('/v1/oauth2/token', **self._pedido_token()))
+        return {'Authorization': f"Bearer {self._token}"}
+
+    async def acabeceras(self):
+        if not self._token_vigente():
+            self._guardar_token(await self.cliente_async().post('/v1/oauth2/token', **self._pedido_token()))
+        return {'Authorization': f"Bearer {self._token}"}
+
+    def datos_preferencia(self, email, items, total, country, referencia=None):
+        transaccion = {
+            "amount": {"total": str(total), "currency": "USD"},
+            "description": ", ".join(items),
+        }
+        if referencia:
+            transaccion["custom"] = referencia
+        return {
+            "intent": "sale",
+            "payer": {"payment_method": "paypal"},
+            "transactions": [transaccion],
+            "redirect_urls": {
+                "return_url": url_frontend("pago-exitoso"),
+                "cancel_url": url_frontend("pago-fallido"),
+            },
+        }
+
+    def url_pago(self, respuesta):
+        return next(link["href"] for link in respuesta["links"] if link.get("method") == "REDIRECT")
+
+    def ruta_pago(self, payment_id):
+        return f'/v1/payments/payment/{payment_id}'
+
+
+class PasarelaFalsa(PasarelaPago):
+    """
+    Proveedor en memoria para pruebas y benchmarks (settings.PASARELA_FALSA): misma interfaz y
+    circuit breaker, sin red. `latencia` simula la demora del proveedor real; los pagos que no se
+    registraron con `registrar_pago` figuran aprobados.
+    """
+
+    def __init__(self, nombre, latencia=0.0):
+        super().__init__()
+        self.nombre = nombre
+        self.latencia = latencia
+        self.preferencias = {}
+        self.pagos = {}
+
+    def registrar_pago(self, payment_id, **datos):
+        self.pagos[str(payment_id)] = {'id': payment_id, **datos}
+
+    def _responder(self, metodo, ruta, datos):
+        if metodo == 'POST':
+            preferencia_id = uuid.uuid4().hex
+            self.preferencias[preferencia_id] = datos
+            return {'id': preferencia_id, 'init_point': f"https://pagos.falsos/{self.nombre}/{preferencia_id}"}
+        payment_id = ruta.rsplit('/', 1)[-1]
+        return self.pagos.get(payment_id) or {
+            'id': payment_id, 'status': 'approved', 'status_detail': 'accredited',
+            'transaction_amount': 0, 'payer': {'email': ''}, 'external_reference': None,
+        }
+
+    def solicitar(self, metodo, ruta, json=None, **kwargs):
+        self._verificar_circuito()
+        time.sleep(self.latencia)
+        return self._responder(metodo, ruta, json)
+
+    async def asolicitar(self, metodo, ruta, json=None, **kwargs):
+        self._verificar_circuito()
+        await asyncio.sleep(self.latencia)
+        return self._responder(metodo, ruta, json)
+
+    def datos_preferencia(self, email, items, total, country, referencia=None):
+        return {'email': email, 'items': items, 'total': total, 'country': country, 'external_reference': referencia}
+
+    def url_pago(self, respuesta):
+        return respuesta['init_point']
+
+    def ruta_pago(self, payment_id):
+        return f'/pagos/{payment_id}'
+
+
+PROVEEDORES = {'mercadopago': MercadoPago, 'paypal': PayPal}
+_pasarelas = {}
+_pasarelas_lock = threading.Lock()
+
+
+def pasarela(nombre):
+    """Instancia única por proceso de cada proveedor (comparten pool de conexiones y circuito)."""
+    if nombre not in _pasarelas:
+        with _pasarelas_lock:
+            if nombre not in _pasarelas:
+                if settings.PASARELA_FALSA:
+                    _pasarelas[nombre] = PasarelaFalsa(nombre, settings.PASARELA_FALSA_LATENCIA)
+                else:
+                    _pasarelas[nombre] = PROVEEDORES[nombre]()
+    return _pasarelas[nombre]
+
+
+def pasarela_para_pais(country):
+    return pasarela('mercadopago' if country in PAISES_MERCADOPAGO else 'paypal')
@@ -1,19 +1,139 @@
 from decimal import Decimal
-from productos.models.producto import Producto
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+from productos.models.producto import Producto, ProductoAtributo, ReviewProduct
 from productos.models.categoria import Descuento
+from productos.services.cache_service import CacheService
+
+CACHE_DESCUENTOS = 'descuentos_por_categoria'
+CACHE_DESCUENTOS_TTL = 60 * 10
 
 class ProductoService:
     @staticmethod
-    def calcular_precio_final(producto: Producto) -> Decimal:
+    def mapa_descuentos() -> dict:
+        """Mapa categoria_id -> porcentaje, cacheado e invalidado por las señales de Descuento."""
+        def _cargar():
+            mapa = {}
+            # Se recorre de mayor a menor id para que gane el primero, igual que .first()
+            for categoria_id, porcentaje in Descuento.objects.order_by('-id').values_list('categoria_id', 'porcentaje'):
+                mapa[categoria_id] = porcentaje
+            return mapa
+        return cache.get_or_set(CACHE_DESCUENTOS, _cargar, CACHE_DESCUENTOS_TTL)
+
+    @staticmethod
+    def invalidar_descuentos():
+        cache.delete(CACHE_DESCUENTOS)
+
+    @staticmethod
+    def _suma_atributos(campo):
+        return Coalesce(Subquery(
+            ProductoAtributo.objects.filter(producto=OuterRef('pk')).order_by()
+            .values('producto').annotate(total=Sum(campo)).values('total')
+        ), 0)
+
+    @staticmethod
+    def actualizar_totales(producto_ids=None):
+        """
+        Recalcula stock_total/vendidos_total desde sus ProductoAtributo en un único UPDATE.
+        `producto_ids` puede ser una lista o un queryset de ids (se usa como subconsulta).
+        """
+        queryset = Producto.objects.all() if producto_ids is None else Producto.objects.filter(id__in=producto_ids)
+        # Todo cambio de stock pasa por acá (señales y UPDATEs masivos): los conteos por faceta dependen de él.
+        # Se invalida al confirmar: antes, otra request podría recalcular y cachear los conteos viejos.
+        transaction.on_commit(lambda: CacheService.invalidar('facetas'))
+        return queryset.update(
+            stock_total=ProductoService._suma_atributos('stock'),
+            vendidos_total=ProductoService._suma_atributos('cantidad_vendida'),
+        )
+
+    @staticmethod
+    def _agregado_reviews(agregado):
+        return Coalesce(Subquery(
+            ReviewProduct.objects.filter(product=OuterRef('pk'), approved=True).order_by()
+            .values('product').annotate(total=agregado).values('total')
+        ), 0)
+
+    @staticmethod
+    def aplicar_ratings(deltas):
+        """
+        Aplica {producto_id: (delta_suma, delta_cantidad)} a los agregados de rating con
+        un UPDATE por producto, sin releer las reseñas.
+        """
+        for producto_id, (delta_suma, delta_cantidad) in sorted(deltas.items()):
+            if not delta_suma and not delta_cantidad:
+                continue
+            suma = F('rating_sum') + delta_suma
+            cantidad = F('rating_count') + delta_cantidad
+            Producto.objects.filter(id=producto_id).update(
+                rating_sum=suma,
+                rating_count=cantidad,
+                # Los SET usan los valores previos de la fila, por eso el promedio se arma con las mismas expresiones
+                rating_avg=Case(
+                    When(rating_count__gt=-delta_cantidad, then=Cast(suma, FloatField()) / Cast(cantidad, FloatField())),
+                    default=Value(0.0),
+                    output_field=FloatField(),
+                ),
+            )
+
+    @staticmethod
+    def aprobar_reviews(queryset):
+        """Aprobación masiva (acción del admin): un UPDATE de reseñas y los deltas por producto."""
+        with transaction.atomic():
+            pendientes = queryset.filter(approved=False).order_by()
+            deltas = {
+                fila['product']: (fila['suma'], fila['cantidad'])
+                for fila in pendientes.values('product').annotate(suma=Sum('rating'), cantidad=Count('id'))
+            }
+            aprobadas = pendientes.update(approved=True)
+            ProductoService.aplicar_ratings(deltas)
+        return aprobadas
+
+    @staticmethod
+    def recalcular_ratings(producto_ids=None):
+        """Reconstruye los agregados de rating desde las reseñas aprobadas."""
+        queryset = Producto.objects.all() if producto_ids is None else Producto.objects.filter(id__in=producto_ids)
+        suma = ProductoService._agregado_reviews(Sum('rating'))
+        cantidad = ProductoService._agregado_reviews(Count('id'))
+        return queryset.update(
+            rating_sum=suma,
+            rating_count=cantidad,
+            rating_avg=Coalesce(
+                ProductoService._agregado_reviews(Cast(Sum('rating'), FloatField()) / Count('id')), Value(0.0)
+            ),
+        )
+
+    @staticmethod
+    def totales_desincronizados():
+        """Productos cuyos totales guardados no coinciden con sus atributos o reseñas."""
+        return Producto.objects.annotate(
+            stock_real=ProductoService._suma_atributos('stock'),
+            vendidos_real=ProductoService._suma_atributos('cantidad_vendida'),
+            rating_sum_real=ProductoService._agregado_reviews(Sum('rating')),
+            rating_count_real=ProductoService._agregado_reviews(Count('id')),
+        ).filter(
+            ~Q(stock_total=F('stock_real')) | ~Q(vendidos_total=F('vendidos_real')) |
+            ~Q(rating_sum=F('rating_sum_real')) | ~Q(rating_count=F('rating_count_real'))
+        )
+
+    @staticmethod
+    def porcentaje_categoria(producto: Producto, descuentos=None):
+        if descuentos is None:
+            descuentos = ProductoService.mapa_descuentos()
+        return descuentos.get(producto.categoria_id)
+
+    @staticmethod
+    def calcular_precio_final(producto: Producto, descuentos=None) -> Decimal:
         precio_final = producto.precio
         descuento_aplicado = Decimal(0)
 
         if producto.descuento is not None and producto.descuento > 0:
             descuento_aplicado = producto.descuento
         else:
-            descuento = Descuento.objects.filter(categoria=producto.categoria).first()
-            if descuento and descuento.porcentaje:
-                descuento_aplicado = descuento.porcentaje
+            porcentaje = ProductoService.porcentaje_categoria(producto, descuentos)
+            if porcentaje:
+                descuento_aplicado = porcentaje
 
         if descuento_aplicado > 0:
             precio_final -= (precio_final * (descuento_aplicado / Decimal(100)))
@@ -21,9 +141,19 @@ class ProductoService:
         return round(precio_final, 2)
 
     @staticmethod
-    def obtener_descuento(producto: Producto) -> int:
+    def obtener_descuento(producto: Producto, descuentos=None) -> int:
         if producto.descuento is not None and producto.descuento > 0:
             return round(producto.descuento, 0)
-        descuento = Descuento.objects.filter(categoria=producto.categoria).first()
-        porcentaje = descuento.porcentaje if descuento else 0
-        return round(porcentaje, 0)
\ No newline at end of file
+        porcentaje = ProductoService.porcentaje_categoria(producto, descuentos) or 0
+        return round(porcentaje, 0)
+
+    @staticmethod
+    def precios_finales(productos) -> dict:
+        """Precio final de cada producto (id -> precio) resolviendo los descuentos una sola vez."""
+        if hasattr(productos, 'only'):
+            productos = productos.only('id', 'precio', 'descuento', 'categoria_id')
+        descuentos = ProductoService.mapa_descuentos()
+        return {
+            producto.id: ProductoService.calcular_precio_final(producto, descuentos)
+            for producto in productos
+        }
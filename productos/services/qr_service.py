@@ -0,0 +1,44 @@
+from io import BytesIO
+from django.core.files.base import ContentFile
+from django.db.models import Q
+import qrcode
+from productos.models.producto import Producto
+from productos.services.tareas_service import TareaService, ErrorPermanente
+
+
+def renderizar_qr(producto_id):
+    """PNG del QR de un producto. Solo usa CPU: se puede ejecutar en otro proceso."""
+    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
+    qr.add_data(f"PRODUCTO_ID:{producto_id}")
+    qr.make(fit=True)
+    buffer = BytesIO()
+    qr.make_image(fill='black', back_color='white').save(buffer, format="PNG")
+    return producto_id, buffer.getvalue()
+
+
+class QrService:
+    @staticmethod
+    def sin_qr():
+        return Producto.objects.filter(Q(qr_code='') | Q(qr_code__isnull=True))
+
+    @staticmethod
+    def guardar(producto_id, png):
+        """Sube el PNG y guarda la ruta con un UPDATE (sin save(): no dispara las señales del producto)."""
+        campo = Producto._meta.get_field('qr_code')
+        nombre = campo.storage.save(campo.generate_filename(None, f'qr_{producto_id}.png'), ContentFile(png))
+        Producto.objects.filter(id=producto_id).update(qr_code=nombre)
+        return nombre
+
+    @staticmethod
+    def encolar(producto):
+        return TareaService.encolar('qr_producto', {'producto_id': producto.id}, clave=f'qr:{producto.id}')
+
+
+def procesar_tarea_qr(tarea):
+    producto_id = tarea.payload['producto_id']
+    producto = Producto.objects.filter(id=producto_id).only('id', 'qr_code').first()
+    if producto is None:
+        raise ErrorPermanente(f"Producto con ID {producto_id} no encontrado")
+    if producto.qr_code:
+        return {'qr_code': producto.qr_code.name}
+    return {'qr_code': QrService.guardar(*renderizar_qr(producto_id))}
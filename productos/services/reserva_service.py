@@ -0,0 +1,104 @@
+import uuid
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from productos.models.producto import ProductoAtributo
+from productos.models.venta import ReservaStock
+from productos.services.cache_service import CacheService
+from productos.services.stock_service import StockInsuficiente, StockService
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tiempo que el comprador tiene para pagar antes de perder las unidades apartadas
+RESERVA_MINUTOS = 15
+# Con el pago aprobado la reserva se mantiene hasta que se registra la venta
+RESERVA_CONFIRMADA_MINUTOS = 24 * 60
+# Las reservas ya cerradas se borran después de esto (solo sirven para auditar)
+RESERVA_HISTORIAL_DIAS = 30
+
+
+class ReservaService:
+    """
+    Reservas de stock entre la preferencia de pago y la venta. No tocan `stock`: las
+    reservas vigentes (activas o confirmadas y sin vencer) se restan al calcular el
+    disponible (StockService.disponibles / descontar), así que una reserva vencida deja
+    de contar sola aunque el limpiador (manage.py liberar_reservas) todavía no haya pasado.
+    """
+
+    @staticmethod
+    def reservar(cantidades, minutos=RESERVA_MINUTOS):
+        """
+        Aparta {producto_atributo_id: cantidad} bajo una referencia nueva o lanza StockInsuficiente.
+        Las filas de ProductoAtributo se bloquean en orden, igual que al descontar, para que dos
+        reservas (o una reserva y una venta) sobre el mismo producto se serialicen. Devuelve (referencia, vence).
+        """
+        referencia = uuid.uuid4().hex
+        vence = timezone.now() + timedelta(minutes=minutos)
+        ids = sorted(cantidades)
+        with transaction.atomic():
+            list(ProductoAtributo.objects.select_for_update().filter(id__in=ids).order_by('id').values_list('id', flat=True))
+            disponibles = StockService.disponibles(ids)
+            for producto_atributo_id in ids:
+                if disponibles.get(producto_atributo_id, 0) < cantidades[producto_atributo_id]:
+                    raise StockInsuficiente(producto_atributo_id, cantidades[producto_atributo_id])
+            ReservaStock.objects.bulk_create([
+                ReservaStock(referencia=referencia, producto_atributo_id=i, cantidad=cantidades[i], vence=vence)
+                for i in ids
+            ])
+            if any(disponibles[i] == cantidades[i] for i in ids):
+                # Se reservaron las últimas unidades: el filtro y el conteo "en stock" cambian
+                ReservaService.invalidar_facetas()
+        return referencia, vence
+
+    @staticmethod
+    def invalidar_facetas():
+        transaction.on_commit(lambda: CacheService.invalidar('facetas'))
+
+    @staticmethod
+    def confirmar(referencia):
+        """Pago aprobado: la reserva se extiende hasta que la venta la consuma."""
+        return ReservaStock.objects.filter(referencia=referencia, estado__in=ReservaStock.VIGENTES).update(
+            estado=ReservaStock.CONFIRMADA,
+            vence=timezone.now() + timedelta(minutes=RESERVA_CONFIRMADA_MINUTOS),
+        )
+
+    @staticmethod
+    def liberar(referencia):
+        """Pago rechazado o cancelado: las unidades vuelven a estar disponibles."""
+        liberadas = ReservaStock.objects.filter(referencia=referencia, estado__in=ReservaStock.VIGENTES).update(
+            estado=ReservaStock.LIBERADA
+        )
+        if liberadas:
+            ReservaService.invalidar_facetas()
+        return liberadas
+
+    @staticmethod
+    def consumir(referencia):
+        """
+        Cierra la reserva al registrar la venta. Debe correr en la transacción de la venta y
+        antes de descontar, para que las unidades propias no cuenten como reservadas.
+        """
+        return ReservaStock.objects.filter(referencia=referencia, estado__in=ReservaStock.VIGENTES).update(
+            estado=ReservaStock.CONSUMIDA
+        )
+
+    @staticmethod
+    def liberar_vencidas():
+        """Marca como liberadas todas las reservas vencidas en un solo UPDATE."""
+        liberadas = ReservaStock.objects.filter(
+            estado__in=ReservaStock.VIGENTES, vence__lte=timezone.now()
+        ).update(estado=ReservaStock.LIBERADA)
+        if liberadas:
+            # Ya no contaban como reservadas, pero los conteos cacheados mientras estaban vigentes sí
+            ReservaService.invalidar_facetas()
+        return liberadas
+
+    @staticmethod
+    def purgar(dias=RESERVA_HISTORIAL_DIAS):
+        """Borra las reservas cerradas hace más de `dias`."""
+        borradas, _ = ReservaStock.objects.filter(
+            estado__in=(ReservaStock.CONSUMIDA, ReservaStock.LIBERADA),
+            vence__lt=timezone.now() - timedelta(days=dias),
+        ).delete()
+        return borradas
@@ -0,0 +1,177 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, PositiveIntegerField, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from productos.models.producto import ProductoAtributo
+from productos.models.venta import ReservaStock
+from productos.services.busqueda_service import BusquedaService
+from productos.services.producto_service import ProductoService
+
+
+class StockInsuficiente(ValueError):
+    def __init__(self, producto_atributo_id, cantidad):
+        self.producto_atributo_id = producto_atributo_id
+        self.cantidad = cantidad
+        super().__init__(f"Stock insuficiente para el producto/atributo #{producto_atributo_id} (se pidieron {cantidad}).")
+
+
+class _LineasSinStock(Exception):
+    pass
+
+
+class StockService:
+    """
+    Descuento de stock con dos consultas por venta, sin importar la cantidad de líneas:
+    primero se bloquean las filas con SELECT ... FOR UPDATE ORDER BY id (siempre en el
+    mismo orden, así dos ventas con los mismos productos no se trabarán en un deadlock) y
+    después un único UPDATE ... SET stock = CASE id WHEN .. THEN stock - n .. END
+    WHERE (id = a AND stock >= na + reservado) OR ... que nunca deja el stock en negativo
+    ni toma unidades reservadas por otra compra en curso (ver ReservaService).
+    """
+
+    @staticmethod
+    def reservado(producto_atributo='pk'):
+        """
+        Subconsulta con las unidades en reservas vigentes de cada ProductoAtributo (0 si no hay).
+        `producto_atributo` es la columna de la consulta externa con el id (p. ej. desde el carrito).
+        """
+        return Coalesce(Subquery(
+            ReservaStock.objects.filter(
+                producto_atributo=OuterRef(producto_atributo), estado__in=ReservaStock.VIGENTES, vence__gt=timezone.now(),
+            ).values('producto_atributo').annotate(total=Sum('cantidad')).values('total'),
+            output_field=PositiveIntegerField(),
+        ), 0)
+
+    @staticmethod
+    def disponible(stock='stock', producto_atributo='pk'):
+        """Expresión stock - reservado (nunca negativa): lo que ve el catálogo y el carrito."""
+        return Greatest(F(stock) - StockService.reservado(producto_atributo), Value(0))
+
+    @staticmethod
+    def con_disponible():
+        """Condición sobre ProductoAtributo: le quedan unidades sin reservar."""
+        return Q(stock__gt=StockService.reservado())
+
+    @staticmethod
+    def disponibles(ids):
+        """{producto_atributo_id: stock - reservado} en una sola consulta."""
+        return dict(
+            ProductoAtributo.objects.filter(id__in=ids).annotate(
+                disponible=StockService.disponible()
+            ).values_list('id', 'disponible')
+        )
+
+    @staticmethod
+    def agrupar(lineas):
+        """[(producto_atributo_id, cantidad), ...] -> {id: cantidad total}, sumando ids repetidos."""
+        cantidades = defaultdict(int)
+        for producto_atributo_id, cantidad in lineas:
+            cantidades[producto_atributo_id] += cantidad
+        return dict(cantidades)
+
+    @staticmethod
+    def _con_stock(cantidades):
+        condicion = Q()
+        reservado = StockService.reservado()
+        for producto_atributo_id, cantidad in cantidades.items():
+            condicion |= Q(id=producto_atributo_id, stock__gte=reservado + cantidad)
+        return condicion
+
+    @staticmethod
+    def descontar(cantidades):
+        """
+        Descuenta {producto_atributo_id: cantidad} o lanza StockInsuficiente. Si falla una
+        línea se deshacen todas: usar dentro de la transacción de la venta.
+        """
+        if not cantidades:
+            return
+        ids = sorted(cantidades)
+        try:
+            with transaction.atomic():
+                StockService._actualizar(cantidades, ids)
+        except _LineasSinStock:
+            # Ya revertido el UPDATE parcial, se busca la primera línea que no alcanza para informarla
+            suficientes = set(
+                ProductoAtributo.objects.filter(StockService._con_stock(cantidades)).values_list('id', flat=True)
+            )
+            faltante = next((i for i in ids if i not in suficientes), ids[0])
+            raise StockInsuficiente(faltante, cantidades[faltante])
+
+    @staticmethod
+    def _actualizar(cantidades, ids):
+        list(ProductoAtributo.objects.select_for_update().filter(id__in=ids).order_by('id').values_list('id', flat=True))
+        actualizadas = ProductoAtributo.objects.filter(StockService._con_stock(cantidades)).update(
+            stock=Case(
+                *[When(id=i, then=F('stock') - cantidades[i]) for i in ids],
+                output_field=PositiveIntegerField(),
+            ),
+            cantidad_vendida=Case(
+                *[When(id=i, then=F('cantidad_vendida') + cantidades[i]) for i in ids],
+                output_field=PositiveIntegerField(),
+            ),
+        )
+        if actualizadas != len(ids):
+            raise _LineasSinStock()
+        StockService._actualizar_productos(ids)
+
+    @staticmethod
+    def _actualizar_productos(ids):
+        # Los UPDATE masivos no disparan señales: los totales del producto se recalculan acá
+        ProductoService.actualizar_totales(
+            ProductoAtributo.objects.filter(id__in=ids).values('producto_id')
+        )
+
+    @staticmethod
+    def gestionar_atributos(producto_id, cambios, eliminar=(), atributos_por_id=None):
+        """
+        Aplica en bloque los atributos de un producto: `cambios` es [{'atributo_id', 'stock' | 'delta'}]
+        y `eliminar` ids de Atributo a quitar. Un SELECT ... FOR UPDATE de las filas existentes (para
+        los deltas) y un único upsert. Devuelve (filas resultantes, cantidad eliminada).
+        """
+        with transaction.atomic():
+            actuales = {
+                fila.atributo_id: fila for fila in ProductoAtributo.objects.select_for_update().filter(
+                    producto_id=producto_id, atributo_id__in=[cambio['atributo_id'] for cambio in cambios]
+                ).order_by('id')
+            }
+            filas = []
+            for cambio in cambios:
+                actual = actuales.get(cambio['atributo_id'])
+                stock = cambio.get('stock', 0)
+                if 'delta' in cambio:
+                    stock = (actual.stock if actual else 0) + cambio['delta']
+                    if stock < 0:
+                        raise StockInsuficiente(actual.id if actual else None, -cambio['delta'])
+                filas.append(ProductoAtributo(
+                    producto_id=producto_id, atributo_id=cambio['atributo_id'], stock=stock,
+                    cantidad_vendida=actual.cantidad_vendida if actual else 0,
+                ))
+            ProductoAtributo.objects.bulk_create(
+                filas, update_conflicts=True, unique_fields=['producto', 'atributo'], update_fields=['stock'],
+            )
+            for fila in filas:
+                if fila.id is None and fila.atributo_id in actuales:
+                    fila.id = actuales[fila.atributo_id].id
+                if atributos_por_id:
+                    fila.atributo = atributos_por_id[fila.atributo_id]
+
+            eliminados = 0
+            if eliminar:
+                eliminados, _ = ProductoAtributo.objects.filter(producto_id=producto_id, atributo_id__in=eliminar).delete()
+            # El upsert no dispara señales
+            ProductoService.actualizar_totales([producto_id])
+            BusquedaService.actualizar_vectores([producto_id])
+        return filas, eliminados
+
+    @staticmethod
+    def reponer(cantidades):
+        """Devuelve stock (ventas con el pago rechazado o reembolsado, ver PagoService.devolver_stock); revierte también las unidades vendidas."""
+        with transaction.atomic():
+            for producto_atributo_id in sorted(cantidades):
+                cantidad = cantidades[producto_atributo_id]
+                ProductoAtributo.objects.filter(id=producto_atributo_id).update(
+                    stock=F('stock') + cantidad,
+                    cantidad_vendida=Greatest(F('cantidad_vendida') - cantidad, Value(0)),
+                )
+            StockService._actualizar_productos(list(cantidades))
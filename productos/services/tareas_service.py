@@ -0,0 +1,165 @@
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from productos.models.tarea import Candado, Tarea
+import logging
+
+logger = logging.getLogger(__name__)
+
+# tipo de tarea -> función que la procesa; recibe la Tarea y devuelve un dict con el resultado
+HANDLERS = {
+    'factura_pdf': 'productos.services.factura_service.procesar_tarea_factura',
+    'qr_producto': 'productos.services.qr_service.procesar_tarea_qr',
+    'pago_mp': 'productos.services.pago_service.procesar_tarea_pago',
+}
+
+BACKOFF_BASE_SEGUNDOS = 30
+BACKOFF_MAXIMO_SEGUNDOS = 60 * 60
+# Una tarea 'en_proceso' sin novedades por más de esto se considera abandonada (worker caído)
+TAREA_ABANDONADA_SEGUNDOS = 15 * 60
+
+
+class ErrorPermanente(Exception):
+    """Error que no tiene sentido reintentar (datos inválidos, registros inexistentes)."""
+
+
+class TareaService:
+    @staticmethod
+    def tomar_candado(clave, segundos):
+        """
+        Toma el candado `clave` por `segundos`: devuelve su vencimiento (para soltarlo) o None si
+        lo tiene otro. Atómico en la base: gana quien inserta la fila o, si ya existe vencida,
+        quien la actualiza primero.
+        """
+        ahora = timezone.now()
+        vence = ahora + timedelta(seconds=segundos)
+        try:
+            with transaction.atomic():
+                Candado.objects.create(clave=clave, vence=vence)
+            return vence
+        except IntegrityError:
+            if Candado.objects.filter(clave=clave, vence__lte=ahora).update(vence=vence) == 1:
+                return vence
+            return None
+
+    @staticmethod
+    def soltar_candado(clave, vence):
+        # Con el vencimiento: si el candado ya venció y lo tomó otro, no se le borra
+        Candado.objects.filter(clave=clave, vence=vence).delete()
+
+    @staticmethod
+    def purgar_candados():
+        return Candado.objects.filter(vence__lt=timezone.now()).delete()[0]
+
+    @staticmethod
+    def encolar(tipo, payload, clave=None, usuario=None, max_intentos=5, reabrir=False):
+        """
+        Encola una tarea. Si ya existe una con la misma clave se devuelve esa
+        (idempotencia); solo se reactiva si había fallado definitivamente o, con
+        `reabrir`, si ya se había completado (p. ej. un pago que cambió de estado).
+        Con `reabrir` y la tarea en proceso, se marca para correr de nuevo al terminar:
+        el worker pudo haber leído el estado anterior.
+        """
+        if clave is None:
+            return Tarea.objects.create(tipo=tipo, payload=payload, usuario=usuario, max_intentos=max_intentos)
+
+        try:
+            with transaction.atomic():
+                return Tarea.objects.create(
+                    tipo=tipo, clave=clave, payload=payload, usuario=usuario, max_intentos=max_intentos
+                )
+        except IntegrityError:
+            pass
+
+        with transaction.atomic():
+            tarea = Tarea.objects.select_for_update().get(clave=clave)
+            if tarea.estado == Tarea.FALLIDA or (reabrir and tarea.estado == Tarea.COMPLETADA):
+                tarea.estado = Tarea.PENDIENTE
+                tarea.payload = payload
+                tarea.intentos = 0
+                tarea.error = None
+                tarea.disponible_desde = timezone.now()
+                tarea.save()
+            elif reabrir and tarea.estado == Tarea.EN_PROCESO:
+                tarea.payload = payload
+                tarea.reejecutar = True
+                tarea.save(update_fields=['payload', 'reejecutar', 'actualizada'])
+            return tarea
+
+    @staticmethod
+    def reclamar(limite=10, tipos=None):
+        """
+        Toma tareas pendientes sin bloquear a otros workers (SKIP LOCKED). El intento se cuenta
+        al reclamar: si el worker se cae a mitad de la tarea, ese intento igual suma para
+        max_intentos, y una tarea abandonada que ya los agotó se da por fallida en vez de reintentarse.
+        """
+        ahora = timezone.now()
+        with transaction.atomic():
+            queryset = Tarea.objects.select_for_update(skip_locked=True).filter(
+                Q(estado=Tarea.PENDIENTE, disponible_desde__lte=ahora) |
+                Q(estado=Tarea.EN_PROCESO, actualizada__lt=ahora - timedelta(seconds=TAREA_ABANDONADA_SEGUNDOS))
+            )
+            if tipos:
+                queryset = queryset.filter(tipo__in=tipos)
+            tareas = list(queryset.order_by('disponible_desde', 'id')[:limite])
+            agotadas = [t.id for t in tareas if t.estado == Tarea.EN_PROCESO and t.intentos >= t.max_intentos]
+            if agotadas:
+                Tarea.objects.filter(id__in=agotadas).update(
+                    estado=Tarea.FALLIDA, error='El worker se detuvo en el último intento', actualizada=ahora
+                )
+                logger.error(f"Tareas {agotadas} abandonadas sin intentos restantes: se marcan fallidas")
+            tareas = [t for t in tareas if t.id not in agotadas]
+            Tarea.objects.filter(id__in=[t.id for t in tareas]).update(
+                estado=Tarea.EN_PROCESO, intentos=F('intentos') + 1, actualizada=ahora
+            )
+        for tarea in tareas:
+            tarea.estado = Tarea.EN_PROCESO
+            tarea.intentos += 1
+        return tareas
+
+    @staticmethod
+    def actualizar_progreso(tarea, progreso, **resultado):
+        tarea.progreso = progreso
+        tarea.resultado = {**tarea.resultado, **resultado}
+        Tarea.objects.filter(id=tarea.id).update(
+            progreso=progreso, resultado=tarea.resultado, actualizada=timezone.now()
+        )
+
+    @staticmethod
+    def ejecutar(tarea):
+        """Corre una tarea devuelta por reclamar() (que ya contó el intento) y guarda el resultado."""
+        try:
+            if tarea.tipo not in HANDLERS:
+                raise ErrorPermanente(f"Tipo de tarea desconocido: {tarea.tipo}")
+            handler = import_string(HANDLERS[tarea.tipo])
+            resultado = handler(tarea) or {}
+        except Exception as e:
+            permanente = isinstance(e, ErrorPermanente)
+            tarea.error = str(e)
+            if permanente or tarea.intentos >= tarea.max_intentos:
+                tarea.estado = Tarea.FALLIDA
+                logger.error(f"Tarea #{tarea.id} ({tarea.tipo}) falló definitivamente: {e}")
+            else:
+                espera = min(BACKOFF_BASE_SEGUNDOS * 2 ** (tarea.intentos - 1), BACKOFF_MAXIMO_SEGUNDOS)
+                tarea.estado = Tarea.PENDIENTE
+                tarea.disponible_desde = timezone.now() + timedelta(seconds=espera)
+                logger.warning(f"Tarea #{tarea.id} ({tarea.tipo}) falló, reintento en {espera}s: {e}")
+        else:
+            tarea.estado = Tarea.COMPLETADA
+            tarea.error = None
+            tarea.resultado = {**tarea.resultado, **resultado}
+        with transaction.atomic():
+            # El flag lo pudo poner encolar() mientras corría el handler: se lee con la fila bloqueada
+            reejecutar = Tarea.objects.select_for_update().filter(id=tarea.id).values_list('reejecutar', flat=True).first()
+            if reejecutar and tarea.estado in (Tarea.COMPLETADA, Tarea.FALLIDA):
+                tarea.estado = Tarea.PENDIENTE
+                tarea.intentos = 0
+                tarea.disponible_desde = timezone.now()
+            tarea.reejecutar = False
+            # Sin el payload: encolar() pudo haberlo actualizado
+            tarea.save(update_fields=[
+                'estado', 'progreso', 'error', 'resultado', 'intentos', 'disponible_desde', 'reejecutar', 'actualizada',
+            ])
+        return tarea
@@ -1,14 +1,25 @@
 from rest_framework import status
 from rest_framework.response import Response
 from productos.models.venta import Venta, DetalleVenta, CarritoProducto, Carrito
-from productos.models.producto import Producto
+from productos.models.producto import Producto, ProductoAtributo
 from productos.models.configuracion import PuntosClub
 from productos.models.usuario import PerfilUsuario, HistorialPuntos
-from django.db import transaction
+from productos.services.cache_service import CacheService
+from productos.services.pago_service import PagoService
+from productos.services.reserva_service import ReservaService
+from productos.services.stock_service import StockService
+from django.db import IntegrityError, transaction
+from django.db.models import F, Prefetch, prefetch_related_objects
+from django.db.models.functions import Coalesce
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+class ReferenciaPagoInvalida(ValueError):
+    """La referencia de pago ya tiene una venta o su pago es por otro monto."""
+
+
 class VentaService:
     @staticmethod
     def validate_venta_data(data, request):
@@ -22,36 +33,135 @@ class VentaService:
         return data
 
     @staticmethod
-    def create_venta(validated_data, request):
+    def resolver_producto_atributos(ids):
+        """Trae en una sola consulta los ProductoAtributo de una venta con su producto y atributo."""
+        return ProductoAtributo.objects.select_related('producto', 'atributo').in_bulk(set(ids))
+
+    @staticmethod
+    def prefetch_detalles():
+        """Prefetch de las líneas con lo que muestra DetalleVentaSerializer, sin consultas por línea."""
+        return Prefetch(
+            'detalles',
+            queryset=DetalleVenta.objects.select_related(
+                'producto_atributo__producto', 'producto_atributo__atributo'
+            ).order_by('id'),
+        )
+
+    @staticmethod
+    def puntos_club_activo():
+        def calcular():
+            puntos_club = PuntosClub.objects.first()
+            return bool(puntos_club and puntos_club.activo)
+        return CacheService.obtener('puntos_club', 'activo', calcular)
+
+    @staticmethod
+    def calcular_puntos(detalles_data):
+        if not VentaService.puntos_club_activo():
+            return 0
+        return sum(
+            (detalle['producto_atributo'].producto.puntos_club_acumulables or 0) * detalle['cantidad']
+            for detalle in detalles_data
+        )
+
+    @staticmethod
+    def registrar_detalles(venta, detalles_data):
+        """
+        Descuenta el stock de forma atómica (ver StockService) y guarda las líneas de la
+        venta en un solo INSERT. Lanza StockInsuficiente; debe correr en la transacción de la venta.
+        """
+        StockService.descontar(StockService.agrupar(
+            (detalle['producto_atributo'].id, detalle['cantidad']) for detalle in detalles_data
+        ))
+        return DetalleVenta.objects.bulk_create([
+            DetalleVenta(
+                venta=venta,
+                producto_id=detalle['producto_atributo'].producto_id,
+                producto_atributo=detalle['producto_atributo'],
+                combinacion=[{
+                    'tipo': detalle['producto_atributo'].atributo.nombre,
+                    'valor': detalle['producto_atributo'].atributo.valor,
+                }],
+                cantidad=detalle['cantidad'],
+                precio_unitario=detalle['precio_unitario'],
+                subtotal=detalle['subtotal'],
+            )
+            for detalle in detalles_data
+        ])
+
+    @staticmethod
+    def acreditar_puntos(venta, puntos):
+        # `usuario` no es único y no todo usuario tiene perfil: sin perfil no se acredita, pero la venta sigue
+        perfil = PerfilUsuario.objects.filter(usuario=venta.comprador).order_by('id').first()
+        if perfil is None:
+            logger.warning(f"Venta #{venta.id}: el comprador #{venta.comprador_id} no tiene perfil, no se acreditan {puntos} puntos")
+            return
+        PerfilUsuario.objects.filter(id=perfil.id).update(
+            puntos_acumulados=Coalesce(F('puntos_acumulados'), 0) + puntos
+        )
+        HistorialPuntos.objects.create(
+            perfil=perfil,
+            puntos_obtenidos=puntos,
+            descripcion=f"Puntos obtenidos por compra (Venta #{venta.id})"
+        )
+
+    @staticmethod
+    def validar_referencia_pago(referencia, precio_total):
+        """
+        La referencia la manda el cliente: no puede reutilizar la de otra venta ni la de un
+        pago por otro monto. Si el webhook todavía no llegó, el monto se controla al registrarlo.
+        """
+        if Venta.objects.filter(referencia_pago=referencia).exists():
+            raise ReferenciaPagoInvalida("La referencia de pago ya corresponde a otra venta.")
+        pago = PagoService.ultimo_pago(referencia)
+        if pago and pago.monto != precio_total:
+            raise ReferenciaPagoInvalida("El monto del pago no coincide con el total de la venta.")
+        return pago
+
+    @staticmethod
+    def registrar_venta(validated_data, detalles_data):
+        """
+        Escribe una venta completa con un número fijo de consultas sin importar la cantidad
+        de líneas. Los `producto_atributo` de `detalles_data` deben venir de
+        `resolver_producto_atributos` para no consultar producto/atributo por línea.
+        """
         with transaction.atomic():
-            detalles_data = validated_data.pop('detalles')
-            venta = Venta.objects.create(**validated_data)
-            puntos_club_activo = PuntosClub.objects.first()
-            puntos_acumulados = 0
-
-            for detalle_data in detalles_data:
-                producto_atributo = detalle_data['producto_atributo']
-                cantidad = detalle_data['cantidad']
-                producto_atributo.stock -= cantidad
-                producto_atributo.cantidad_vendida += cantidad
-                producto_atributo.save()
-                DetalleVenta.objects.create(venta=venta, **detalle_data)
-
-                if puntos_club_activo and puntos_club_activo.activo and producto_atributo.producto.puntos_club_acumulables:
-                    puntos_acumulados += producto_atributo.producto.puntos_club_acumulables * cantidad
-
-            if puntos_acumulados > 0 and venta.comprador:
-                venta.puntos_club_acumulados = puntos_acumulados
-                venta.save()
-                perfil = PerfilUsuario.objects.get(usuario=venta.comprador)
-                perfil.puntos_acumulados = (perfil.puntos_acumulados or 0) + puntos_acumulados
-                perfil.save()
-                HistorialPuntos.objects.create(
-                    perfil=perfil,
-                    puntos_obtenidos=puntos_acumulados,
-                    descripcion=f"Puntos por compra (Venta #{venta.id})"
+            puntos = VentaService.calcular_puntos(detalles_data) if validated_data.get('comprador') else 0
+            if puntos > 0:
+                validated_data['puntos_club_acumulados'] = puntos
+            if 'referencia_pago' in validated_data:
+                validated_data['referencia_pago'] = validated_data['referencia_pago'] or None
+            if validated_data.get('referencia_pago'):
+                pago = VentaService.validar_referencia_pago(
+                    validated_data['referencia_pago'], validated_data.get('precio_total')
                 )
-            return venta
+                if pago and not validated_data.get('estado'):
+                    # Si el webhook ya registró el pago, la venta nace en el estado que corresponde
+                    validated_data['estado'] = PagoService.estado_venta(pago.status)
+            try:
+                with transaction.atomic():
+                    venta = Venta.objects.create(**validated_data)
+            except IntegrityError:
+                # Dos ventas concurrentes con la misma referencia: la restricción única deja pasar una
+                raise ReferenciaPagoInvalida("La referencia de pago ya corresponde a otra venta.")
+            if venta.referencia_pago:
+                # Las unidades reservadas al pagar pasan a descontarse del stock
+                ReservaService.consumir(venta.referencia_pago)
+            VentaService.registrar_detalles(venta, detalles_data)
+            if puntos > 0:
+                VentaService.acreditar_puntos(venta, puntos)
+        # Deja las líneas listas para la respuesta en una sola consulta
+        prefetch_related_objects([venta], VentaService.prefetch_detalles())
+        return venta
+
+    @staticmethod
+    def create_venta(validated_data, request):
+        detalles_data = validated_data.pop('detalles')
+        productos_atributos = VentaService.resolver_producto_atributos(
+            detalle['producto_atributo'].id for detalle in detalles_data
+        )
+        for detalle in detalles_data:
+            detalle['producto_atributo'] = productos_atributos[detalle['producto_atributo'].id]
+        return VentaService.registrar_venta(validated_data, detalles_data)
 
     @staticmethod
     def agregar_producto_al_carrito(request):
@@ -0,0 +1,142 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete, pre_save
+from django.dispatch import receiver
+from productos.models.categoria import Categoria, Descuento
+from productos.models.configuracion import (
+    Barrio, Color, Componentes_Configuraciones, ContenidosWeb, Diseños, Fuente,
+    InformacionWeb, PuntosClub, Tema
+)
+from productos.models.producto import Atributo, Marca, Producto, ProductoAtributo, ReviewProduct, TipoProducto
+from productos.services.busqueda_service import BusquedaService
+from productos.services.cache_service import CacheService
+from productos.services.producto_service import ProductoService
+
+# Grupos de cache que dependen de cada modelo
+GRUPOS_CACHE = {
+    Color: ['home'],
+    Tema: ['home', 'temas'],
+    Diseños: ['home', 'disenos'],
+    Fuente: ['home'],
+    Componentes_Configuraciones: ['componentes'],
+    ContenidosWeb: ['contenidos'],
+    InformacionWeb: ['informacion'],
+    Categoria: ['categorias', 'facetas'],
+    Marca: ['marcas', 'facetas'],
+    TipoProducto: ['facetas'],
+    Atributo: ['facetas'],
+    Producto: ['facetas'],
+    Barrio: ['barrios'],
+    PuntosClub: ['puntos_club'],
+}
+
+
+@receiver([post_save, post_delete], sender=Descuento)
+def invalidar_descuentos(sender, **kwargs):
+    transaction.on_commit(ProductoService.invalidar_descuentos)
+
+
+@receiver([post_save, post_delete], sender=ProductoAtributo)
+def actualizar_totales_producto(sender, instance, **kwargs):
+    ProductoService.actualizar_totales([instance.producto_id])
+    BusquedaService.actualizar_vectores([instance.producto_id])
+
+
+# El vector de búsqueda incluye textos de marca, tipo y atributos
+@receiver(post_save, sender=Producto)
+def actualizar_busqueda_producto(sender, instance, **kwargs):
+    BusquedaService.actualizar_vectores([instance.id])
+
+
+@receiver(post_save, sender=Marca)
+def actualizar_busqueda_marca(sender, instance, created, **kwargs):
+    if not created:
+        BusquedaService.actualizar_vectores(Producto.objects.filter(marca=instance).values('id'))
+
+
+@receiver(post_save, sender=TipoProducto)
+def actualizar_busqueda_tipo(sender, instance, created, **kwargs):
+    if not created:
+        BusquedaService.actualizar_vectores(Producto.objects.filter(tipo=instance).values('id'))
+
+
+@receiver(post_save, sender=Atributo)
+def actualizar_busqueda_atributo(sender, instance, created, **kwargs):
+    if not created:
+        BusquedaService.actualizar_vectores(
+            ProductoAtributo.objects.filter(atributo=instance).values('producto_id')
+        )
+
+
+# Estado de rating de una reseña tal como está guardada: (producto_id, rating) si cuenta para
+# el promedio, None si no; DESCONOCIDO si se cargó con campos diferidos y hay que recalcular
+DESCONOCIDO = object()
+CAMPOS_RATING = {'product_id', 'rating', 'approved'}
+
+
+def estado_rating(review):
+    return (review.product_id, review.rating) if review.approved else None
+
+
+@receiver(post_init, sender=ReviewProduct)
+def recordar_rating(sender, instance, **kwargs):
+    diferidos = instance.get_deferred_fields()
+    # El producto se recuerda aparte: aunque el estado sea DESCONOCIDO, si la reseña cambia de
+    # producto hay que recalcular también el anterior
+    instance._producto_guardado = None if 'product_id' in diferidos else instance.product_id
+    if instance.pk is None:
+        instance._rating_guardado = None
+    elif CAMPOS_RATING & diferidos:
+        instance._rating_guardado = DESCONOCIDO
+    else:
+        instance._rating_guardado = estado_rating(instance)
+
+
+@receiver(pre_save, sender=ReviewProduct)
+def leer_producto_guardado(sender, instance, **kwargs):
+    # Cargada sin product_id: se lee el guardado antes de pisarlo, solo si hay que recalcular
+    if instance.pk and getattr(instance, '_producto_guardado', None) is None \
+            and getattr(instance, '_rating_guardado', DESCONOCIDO) is DESCONOCIDO:
+        instance._producto_guardado = ReviewProduct.objects.filter(pk=instance.pk).values_list('product_id', flat=True).first()
+
+
+def aplicar_cambio_rating(anterior, actual, producto_id, producto_anterior=None):
+    if anterior is DESCONOCIDO:
+        ProductoService.recalcular_ratings(sorted({producto_id, producto_anterior} - {None}))
+        return
+    deltas = defaultdict(lambda: (0, 0))
+    if anterior:
+        suma, cantidad = deltas[anterior[0]]
+        deltas[anterior[0]] = (suma - anterior[1], cantidad - 1)
+    if actual:
+        suma, cantidad = deltas[actual[0]]
+        deltas[actual[0]] = (suma + actual[1], cantidad + 1)
+    ProductoService.aplicar_ratings(deltas)
+
+
+@receiver(post_save, sender=ReviewProduct)
+def actualizar_rating_guardado(sender, instance, **kwargs):
+    actual = estado_rating(instance)
+    aplicar_cambio_rating(
+        getattr(instance, '_rating_guardado', DESCONOCIDO), actual, instance.product_id,
+        getattr(instance, '_producto_guardado', None),
+    )
+    instance._rating_guardado = actual
+    instance._producto_guardado = instance.product_id
+
+
+@receiver(post_delete, sender=ReviewProduct)
+def actualizar_rating_eliminado(sender, instance, **kwargs):
+    aplicar_cambio_rating(getattr(instance, '_rating_guardado', DESCONOCIDO), None, instance.product_id)
+
+
+def invalidar_grupos_cache(sender, **kwargs):
+    # Recién al confirmar la transacción: si se invalida antes, una lectura concurrente vuelve a
+    # cachear los datos viejos con la versión nueva. Fuera de un atomic on_commit corre en el acto.
+    for grupo in GRUPOS_CACHE.get(sender, []):
+        transaction.on_commit(lambda grupo=grupo: CacheService.invalidar(grupo))
+
+
+for modelo in GRUPOS_CACHE:
+    post_save.connect(invalidar_grupos_cache, sender=modelo, dispatch_uid=f'cache_{modelo.__name__}_save')
+    post_delete.connect(invalidar_grupos_cache, sender=modelo, dispatch_uid=f'cache_{modelo.__name__}_delete')
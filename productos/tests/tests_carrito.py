@@ -0,0 +1,70 @@
+import threading
+from unittest import mock
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from productos.models.producto import Atributo, Producto, ProductoAtributo
+from productos.services.carrito_service import AGREGAR, CarritoInvitadoService, VersionCarritoObsoleta
+from productos.services.tareas_service import TareaService
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CarritoInvitadoConcurrenteTest(TransactionTestCase):
+    """Dos escrituras simultáneas con la misma versión: una gana y la otra recibe el conflicto."""
+
+    def test_misma_version_no_pisa_cambios(self):
+        producto = Producto.objects.create(nombre='Remera', descripcion='Algodón', precio=1000, categoria=None)
+        ids = [
+            ProductoAtributo.objects.create(
+                producto=producto, atributo=Atributo.objects.create(nombre='Talle', valor=valor), stock=5,
+            ).id
+            for valor in ('S', 'M', 'L', 'XL')
+        ]
+        token = 't' * 24
+        barrera = threading.Barrier(len(ids))
+        resultados = []
+
+        def agregar(producto_atributo_id):
+            try:
+                barrera.wait()
+                CarritoInvitadoService.aplicar(
+                    token, [{'op': AGREGAR, 'producto_atributo_id': producto_atributo_id, 'cantidad': 1}], version=0,
+                )
+                resultados.append('ok')
+            except VersionCarritoObsoleta:
+                resultados.append('conflicto')
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=agregar, args=(i,)) for i in ids]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(resultados.count('ok'), 1)
+        datos = CarritoInvitadoService.leer(token)
+        self.assertEqual((datos['version'], len(datos['items'])), (1, 1))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class FusionarOcupadoTest(TestCase):
+    """Fusionar mientras otra request escribe el carrito invitado responde 409, no 500."""
+
+    def test_carrito_invitado_bloqueado(self):
+        producto = Producto.objects.create(nombre='Remera', descripcion='Algodón', precio=1000, categoria=None)
+        producto_atributo = ProductoAtributo.objects.create(
+            producto=producto, atributo=Atributo.objects.create(nombre='Talle', valor='M'), stock=5,
+        )
+        token, _ = CarritoInvitadoService.aplicar('', [{'op': AGREGAR, 'producto_atributo_id': producto_atributo.id, 'cantidad': 1}])
+        TareaService.tomar_candado(CarritoInvitadoService._clave(token), 60)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('cliente1', 'cliente@example.com', 'x'))
+
+        with mock.patch('productos.services.carrito_service.ESPERA_CANDADO_INVITADO', 0):
+            response = client.post('/api/carrito/fusionar/', {'carrito_token': token}, format='json')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['productos'], [])
+        self.assertEqual(CarritoInvitadoService.leer(token)['items'], {producto_atributo.id: 1})
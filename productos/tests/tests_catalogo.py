@@ -0,0 +1,129 @@
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from productos.models.categoria import Categoria
+from productos.models.producto import Atributo, Marca, Producto, ProductoAtributo, ReviewProduct, TipoProducto
+from productos.services.busqueda_service import FIN_RESALTADO, INICIO_RESALTADO, BusquedaService
+from productos.services.cache_service import CacheService
+
+
+# Sin caché: se miden las consultas del listado y no la respuesta guardada
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class ListadoProductosConsultasTest(TestCase):
+    """El listado del catálogo hace la misma cantidad de consultas para 1 producto que para N."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tipo = TipoProducto.objects.create(nombre='Remera')
+        cls.marca = Marca.objects.create(nombre='Sollu')
+        cls.categoria = Categoria.objects.create(nombre='Hombre')
+        cls.atributos = [Atributo.objects.create(nombre='Talle', valor=valor) for valor in ('S', 'M', 'L')]
+        cls.usuario = User.objects.create_user('cliente', 'cliente@example.com', 'x')
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def crear_producto(self, numero):
+        producto = Producto.objects.create(
+            tipo=self.tipo, marca=self.marca, categoria=self.categoria,
+            nombre=f'Producto {numero}', descripcion='Algodón', precio=1000,
+        )
+        for atributo in self.atributos:
+            ProductoAtributo.objects.create(producto=producto, atributo=atributo, stock=5)
+        ReviewProduct.objects.create(product=producto, user=self.usuario, rating=5, comment='Bien', approved=True)
+
+    def listar(self):
+        response = self.client.get('/api/productos/')
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_consultas_no_dependen_de_la_cantidad_de_productos(self):
+        self.crear_producto(0)
+        with CaptureQueriesContext(connection) as un_producto:
+            self.assertEqual(len(self.listar()), 1)
+
+        for numero in range(1, 10):
+            self.crear_producto(numero)
+        with self.assertNumQueries(len(un_producto.captured_queries)):
+            self.assertEqual(len(self.listar()), 10)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class InvalidacionCacheTest(TestCase):
+    """Los grupos de caché se invalidan recién cuando se confirma la transacción."""
+
+    def test_invalida_al_confirmar(self):
+        version = CacheService.version('marcas')
+        with self.captureOnCommitCallbacks(execute=True):
+            Marca.objects.create(nombre='Sollu')
+            self.assertEqual(CacheService.version('marcas'), version)
+        self.assertNotEqual(CacheService.version('marcas'), version)
+
+    def test_no_invalida_si_se_revierte(self):
+        version = CacheService.version('facetas')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                Marca.objects.create(nombre='Sollu')
+                transaction.set_rollback(True)
+        self.assertEqual(callbacks, [])
+        self.assertEqual(CacheService.version('facetas'), version)
+
+
+class GestionarAtributosPermisosTest(TestCase):
+    """Cambiar el stock de un producto es tarea del staff, como crearlo o borrarlo."""
+
+    def test_cliente_no_puede_gestionar_atributos(self):
+        producto = Producto.objects.create(nombre='Remera', descripcion='Algodón', precio=1000, categoria=None)
+        atributo = Atributo.objects.create(nombre='Talle', valor='M')
+        ProductoAtributo.objects.create(producto=producto, atributo=atributo, stock=5)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('cliente', 'cliente@example.com', 'x'))
+
+        response = client.post(
+            f'/api/productos/{producto.id}/gestionar-atributos/',
+            {'atributos': [{'atributo_id': atributo.id, 'stock': 500}]}, format='json',
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(ProductoAtributo.objects.get(producto=producto).stock, 5)
+
+
+class ResaltadoBusquedaTest(SimpleTestCase):
+    """El resaltado de la búsqueda es HTML: el texto del producto va escapado y solo <mark> queda como etiqueta."""
+
+    def test_escapa_el_texto(self):
+        fragmento = f'<img src=x onerror=alert(1)> {INICIO_RESALTADO}remera{FIN_RESALTADO} & short'
+        self.assertEqual(
+            BusquedaService.resaltado_html(fragmento),
+            '&lt;img src=x onerror=alert(1)&gt; <mark>remera</mark> &amp; short',
+        )
+        self.assertIsNone(BusquedaService.resaltado_html(None))
+
+
+class RatingResenaMovidaTest(TestCase):
+    """Una reseña cargada con campos diferidos que pasa a otro producto recalcula ambos."""
+
+    def setUp(self):
+        self.origen = Producto.objects.create(nombre='Remera', descripcion='Algodón', precio=1000, categoria=None)
+        self.destino = Producto.objects.create(nombre='Buzo', descripcion='Frisa', precio=3000, categoria=None)
+        usuario = User.objects.create_user('cliente', 'cliente@example.com', 'x')
+        self.review = ReviewProduct.objects.create(product=self.origen, user=usuario, rating=4, comment='Bien', approved=True)
+
+    def assertRating(self, producto, cantidad, promedio):
+        producto.refresh_from_db()
+        self.assertEqual((producto.rating_count, producto.rating_avg), (cantidad, promedio))
+
+    def test_mover_con_rating_diferido(self):
+        review = ReviewProduct.objects.only('id', 'product_id', 'comment').get(id=self.review.id)
+        review.product = self.destino
+        review.save()
+        self.assertRating(self.origen, 0, 0.0)
+        self.assertRating(self.destino, 1, 4.0)
+
+    def test_mover_con_producto_diferido(self):
+        review = ReviewProduct.objects.only('id', 'comment').get(id=self.review.id)
+        review.product_id = self.destino.id
+        review.save(update_fields=['product'])
+        self.assertRating(self.origen, 0, 0.0)
+        self.assertRating(self.destino, 1, 4.0)
@@ -0,0 +1,32 @@
+import threading
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from productos.models.correo import CorreoSaliente
+from productos.services.correo_service import CorreoService
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', CORREO_MAX_POR_MINUTO=5, CORREO_MAX_POR_DIA=500,
+)
+class CupoCompartidoTest(TransactionTestCase):
+    """Varios workers a la vez no superan entre todos el cupo por minuto del proveedor."""
+
+    def test_workers_concurrentes_respetan_el_cupo(self):
+        for numero in range(20):
+            CorreoService.encolar('prueba', 'Asunto', 'Cuerpo', [f'cliente{numero}@example.com'])
+        barrera = threading.Barrier(4)
+
+        def worker():
+            try:
+                barrera.wait()
+                for _ in range(3):
+                    CorreoService.enviar_lote()
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=worker) for _ in range(4)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(CorreoSaliente.objects.filter(estado=CorreoSaliente.ENVIADO).count(), 5)
@@ -0,0 +1,31 @@
+from django.test import TestCase
+from productos.models.producto import Marca, Producto
+from productos.services.importacion_service import ImportacionService
+
+
+class ReimportacionTest(TestCase):
+    """Una fila sin marca/tipo/categoría actualiza el producto sin borrarle esas referencias."""
+
+    def fila(self, **campos):
+        return {'nombre': 'Remera', 'modelo_talle': 'Lisa', 'precio': '1000', **campos}
+
+    def test_marca_en_blanco_se_conserva(self):
+        ImportacionService.importar([(1, self.fila(marca='Sollu', tipo='Remera', categoria='Hombre'))])
+
+        resultado = ImportacionService.importar([
+            (1, self.fila(precio='1500')),
+            (2, {'nombre': 'Buzo', 'modelo_talle': 'Canguro', 'precio': '3000', 'marca': 'Otra'}),
+        ])
+
+        self.assertEqual(resultado.filas_con_error, 0)
+        producto = Producto.objects.select_related('marca', 'tipo', 'categoria').get(nombre='Remera')
+        self.assertEqual(producto.precio, 1500)
+        self.assertEqual(
+            (producto.marca.nombre, producto.tipo.nombre, producto.categoria.nombre), ('Sollu', 'Remera', 'Hombre')
+        )
+        self.assertEqual(Producto.objects.get(nombre='Buzo').marca.nombre, 'Otra')
+
+    def test_marca_informada_se_actualiza(self):
+        ImportacionService.importar([(1, self.fila(marca='Sollu'))])
+        ImportacionService.importar([(1, self.fila(marca='Nueva'))])
+        self.assertEqual(Producto.objects.get(nombre='Remera').marca, Marca.objects.get(nombre='Nueva'))
@@ -0,0 +1,35 @@
+import tempfile
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from productos.services.limite_service import LimiteService
+
+
+class LimiteTasaIpTest(TestCase):
+    """El límite por IP se aplica también detrás de un socket unix (REMOTE_ADDR vacío)."""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        LimiteService._almacen = None
+        self.addCleanup(setattr, LimiteService, '_almacen', None)
+        ajustes = override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            LIMITES_SQLITE=f'{directorio.name}/limites.sqlite3',
+            LIMITES_TASA={'cupon': '2/m'},
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.client = APIClient()
+
+    def validar_cupon(self, **meta):
+        return self.client.post('/api/validar-cupon/', {'codigo': 'X'}, format='json', **meta).status_code
+
+    def test_sin_ip_no_deja_pasar_todo(self):
+        codigos = [self.validar_cupon(REMOTE_ADDR='') for _ in range(4)]
+        self.assertEqual(codigos, [404, 404, 429, 429])
+
+    @override_settings(LIMITES_IP_META_KEY='HTTP_X_REAL_IP')
+    def test_ip_del_proxy(self):
+        codigos = [self.validar_cupon(REMOTE_ADDR='', HTTP_X_REAL_IP='203.0.113.1') for _ in range(3)]
+        self.assertEqual(codigos, [404, 404, 429])
+        self.assertEqual(self.validar_cupon(REMOTE_ADDR='', HTTP_X_REAL_IP='203.0.113.2'), 404)
@@ -0,0 +1,105 @@
+import threading
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from productos.models.producto import Atributo, Producto, ProductoAtributo
+from productos.models.venta import CarritoProducto, DetalleVenta, Venta
+from productos.services.carrito_service import CarritoService
+from productos.services.faceta_service import FacetaService
+from productos.services.pago_service import PagoService
+from productos.services.reserva_service import ReservaService
+from productos.services.stock_service import StockInsuficiente, StockService
+
+
+class DescontarConcurrenteTest(TransactionTestCase):
+    """Varias ventas simultáneas por las últimas unidades: nunca se vende de más."""
+    HILOS = 8
+    STOCK = 3
+
+    def setUp(self):
+        producto = Producto.objects.create(nombre='Remera', descripcion='Algodón', precio=1000, categoria=None)
+        self.producto_atributo = ProductoAtributo.objects.create(
+            producto=producto, atributo=Atributo.objects.create(nombre='Talle', valor='M'), stock=self.STOCK,
+        )
+
+    def test_solo_se_venden_las_unidades_en_stock(self):
+        barrera = threading.Barrier(self.HILOS)
+        resultados = []
+
+        def comprar():
+            try:
+                barrera.wait()
+                StockService.descontar({self.producto_atributo.id: 1})
+                resultados.append('ok')
+            except StockInsuficiente:
+                resultados.append('sin_stock')
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=comprar) for _ in range(self.HILOS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(resultados.count('ok'), self.STOCK)
+        self.assertEqual(resultados.count('sin_stock'), self.HILOS - self.STOCK)
+        self.producto_atributo.refresh_from_db()
+        self.assertEqual(self.producto_atributo.stock, 0)
+        self.assertEqual(self.producto_atributo.cantidad_vendida, self.STOCK)
+
+
+class DevolverStockTest(TestCase):
+    """Un pago reembolsado devuelve al stock las unidades de su venta, una sola vez."""
+
+    def test_reembolso_repone_stock(self):
+        producto = Producto.objects.create(nombre='Remera', descripcion='Algodón', precio=1000, categoria=None)
+        producto_atributo = ProductoAtributo.objects.create(
+            producto=producto, atributo=Atributo.objects.create(nombre='Talle', valor='M'), stock=5,
+        )
+        venta = Venta.objects.create(referencia_pago='ref-1', precio_total=2000)
+        DetalleVenta.objects.create(
+            venta=venta, producto=producto, producto_atributo=producto_atributo,
+            cantidad=2, precio_unitario=1000, subtotal=2000,
+        )
+        StockService.descontar({producto_atributo.id: 2})
+
+        for _ in range(2):  # Mercado Pago puede repetir la notificación
+            PagoService.registrar({'id': 1, 'status': 'refunded', 'external_reference': 'ref-1', 'transaction_amount': 2000})
+
+        producto_atributo.refresh_from_db()
+        venta.refresh_from_db()
+        self.assertEqual((producto_atributo.stock, producto_atributo.cantidad_vendida), (5, 0))
+        self.assertTrue(venta.stock_devuelto)
+        self.assertEqual(venta.estado.estado, 'Reembolsada')
+
+
+class ReservasEnCatalogoTest(TestCase):
+    """El catálogo y el carrito muestran el stock sin las reservas vigentes, como el checkout."""
+
+    def setUp(self):
+        producto = Producto.objects.create(nombre='Remera', descripcion='Algodón', precio=1000, categoria=None)
+        self.producto_atributo = ProductoAtributo.objects.create(
+            producto=producto, atributo=Atributo.objects.create(nombre='Talle', valor='M'), stock=2,
+        )
+        self.usuario = User.objects.create_user('cliente1', 'cliente@example.com', 'x')
+
+    def test_producto_reservado_no_figura_en_stock(self):
+        filtros = {'en_stock': True}
+        self.assertEqual(FacetaService.filtrar(Producto.objects.all(), filtros).count(), 1)
+
+        ReservaService.reservar({self.producto_atributo.id: 2})
+
+        self.assertEqual(FacetaService.filtrar(Producto.objects.all(), filtros).count(), 0)
+        self.assertEqual(FacetaService.calcular({})['en_stock'], 0)
+        self.assertEqual(FacetaService.calcular({'atributo': {'Talle': [self.producto_atributo.atributo_id]}, 'en_stock': True})['total'], 0)
+
+    def test_carrito_muestra_el_disponible(self):
+        carrito = CarritoService.obtener(self.usuario)
+        CarritoProducto.objects.create(carrito=carrito, producto_atributo=self.producto_atributo, cantidad=1)
+        ReservaService.reservar({self.producto_atributo.id: 1})
+
+        fila, = CarritoService.filas(carrito)
+        fila_invitado, = CarritoService.filas_invitado({self.producto_atributo.id: 1})
+        for fila in (fila, fila_invitado):
+            self.assertEqual(CarritoService._item(fila, {})['producto_atributo']['stock'], 1)
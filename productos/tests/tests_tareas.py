@@ -0,0 +1,88 @@
+import threading
+from datetime import timedelta
+from unittest import mock
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from productos.models.tarea import Tarea
+from productos.models.venta import Venta
+from productos.services.factura_service import FacturaService
+from productos.services.tareas_service import TareaService
+
+
+class NotificacionDuranteProcesoTest(TestCase):
+    """Una notificación que llega mientras la tarea corre no se pierde: la tarea vuelve a la cola."""
+
+    def test_reabrir_en_proceso_vuelve_a_pendiente(self):
+        TareaService.encolar('pago_mp', {'payment_id': '1', 'evento': 'a'}, clave='pago_mp:1', reabrir=True)
+        tarea, = TareaService.reclamar()
+
+        def handler(tarea):
+            # Mercado Pago avisa otro cambio de estado mientras el worker procesa el anterior
+            TareaService.encolar('pago_mp', {'payment_id': '1', 'evento': 'b'}, clave='pago_mp:1', reabrir=True)
+            return {}
+
+        with mock.patch('productos.services.tareas_service.import_string', return_value=handler):
+            TareaService.ejecutar(tarea)
+
+        tarea.refresh_from_db()
+        self.assertEqual(tarea.estado, Tarea.PENDIENTE)
+        self.assertFalse(tarea.reejecutar)
+        self.assertEqual(tarea.payload['evento'], 'b')
+        self.assertEqual([t.id for t in TareaService.reclamar()], [tarea.id])
+
+
+class WorkerCaidoTest(TestCase):
+    """Los intentos se cuentan al reclamar: una tarea que tumba al worker no se reintenta para siempre."""
+
+    def test_tarea_abandonada_agota_sus_intentos(self):
+        tarea = TareaService.encolar('qr_producto', {'producto_id': 1}, max_intentos=2)
+        for intento in (1, 2):
+            reclamada, = TareaService.reclamar()
+            self.assertEqual(reclamada.intentos, intento)
+            # El worker muere sin llegar a guardar el resultado
+            Tarea.objects.filter(id=tarea.id).update(actualizada=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(TareaService.reclamar(), [])
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.intentos), (Tarea.FALLIDA, 2))
+
+
+class FacturaReenvioTest(TestCase):
+    """Pedir de nuevo la factura de una venta ya enviada la vuelve a procesar."""
+
+    def test_pedido_posterior_reabre_la_tarea(self):
+        venta = Venta.objects.create(comprador_sin_cuenta='Invitado')
+        tarea = FacturaService.encolar(venta, None, correo='cliente@example.com')
+        Tarea.objects.filter(id=tarea.id).update(
+            estado=Tarea.COMPLETADA, resultado={'correo_id': 1, 'solicitada': tarea.payload['solicitada']}
+        )
+
+        otra = FacturaService.encolar(venta, None, correo='cliente@example.com')
+        self.assertEqual(otra.id, tarea.id)
+        self.assertEqual(otra.estado, Tarea.PENDIENTE)
+        # El mail se vuelve a encolar: el pedido nuevo no coincide con el que ya se mandó
+        self.assertNotEqual(otra.payload['solicitada'], otra.resultado['solicitada'])
+
+
+class CandadoConcurrenteTest(TransactionTestCase):
+    """Muchos procesos piden el mismo candado a la vez: lo toma uno solo."""
+
+    def test_un_solo_ganador(self):
+        barrera = threading.Barrier(8)
+        resultados = []
+
+        def tomar():
+            try:
+                barrera.wait()
+                resultados.append(TareaService.tomar_candado('pago:verificacion:1:consulta', 10))
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=tomar) for _ in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(len([vence for vence in resultados if vence]), 1)
+        self.assertIsNone(TareaService.tomar_candado('pago:verificacion:1:consulta', 10))
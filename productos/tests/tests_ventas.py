@@ -0,0 +1,119 @@
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from productos.models.configuracion import PuntosClub
+from productos.models.producto import Atributo, Producto, ProductoAtributo
+from productos.models.usuario import HistorialPuntos, PerfilUsuario
+from productos.models.venta import Venta
+from productos.services.pago_service import PagoService
+from productos.services.venta_service import ReferenciaPagoInvalida, VentaService
+
+
+class ReferenciaPagoTest(TestCase):
+    """La referencia de pago la manda el cliente: no se reutiliza ni respalda otro monto."""
+
+    def setUp(self):
+        producto = Producto.objects.create(nombre='Remera', descripcion='Algodón', precio=1000, categoria=None)
+        self.producto_atributo = ProductoAtributo.objects.create(
+            producto=producto, atributo=Atributo.objects.create(nombre='Talle', valor='M'), stock=5,
+        )
+
+    def registrar(self, referencia, total=Decimal('1000')):
+        detalles = [{
+            'producto_atributo': self.producto_atributo, 'cantidad': 1,
+            'precio_unitario': Decimal('1000'), 'subtotal': Decimal('1000'),
+        }]
+        return VentaService.registrar_venta(
+            {'comprador_sin_cuenta': 'Invitado', 'referencia_pago': referencia, 'precio_total': total}, detalles
+        )
+
+    def pagar(self, referencia, monto):
+        PagoService.registrar({'id': 1, 'status': 'approved', 'external_reference': referencia, 'transaction_amount': monto})
+
+    def test_referencia_no_se_reutiliza(self):
+        self.pagar('ref-1', 1000)
+        venta = self.registrar('ref-1')
+        self.assertEqual(venta.estado.estado, PagoService.estado_venta('approved').estado)
+        with self.assertRaises(ReferenciaPagoInvalida):
+            self.registrar('ref-1')
+        self.assertEqual(Venta.objects.filter(referencia_pago='ref-1').count(), 1)
+        self.producto_atributo.refresh_from_db()
+        self.assertEqual(self.producto_atributo.stock, 4)
+
+    def test_monto_distinto_se_rechaza(self):
+        self.pagar('ref-1', 10)
+        with self.assertRaises(ReferenciaPagoInvalida):
+            self.registrar('ref-1')
+        self.assertFalse(Venta.objects.exists())
+
+    def test_pago_posterior_por_otro_monto_no_aprueba(self):
+        venta = self.registrar('ref-1')
+        self.pagar('ref-1', 10)
+        venta.refresh_from_db()
+        self.assertIsNone(venta.estado)
+
+    def test_sin_referencia_no_choca(self):
+        self.registrar('')
+        self.registrar(None)
+        self.assertEqual(Venta.objects.filter(referencia_pago__isnull=True).count(), 2)
+
+
+class VentaConUsuarioNuevoTest(TestCase):
+    """La cuenta que se crea con la compra se revierte junto con la venta."""
+
+    def test_sin_stock_no_crea_el_usuario(self):
+        producto = Producto.objects.create(nombre='Remera', descripcion='Algodón', precio=1000, categoria=None)
+        producto_atributo = ProductoAtributo.objects.create(
+            producto=producto, atributo=Atributo.objects.create(nombre='Talle', valor='M'), stock=1,
+        )
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('vendedor1', 'vendedor@example.com', 'x', is_staff=True))
+
+        response = client.post('/api/crear-venta/', {
+            'usuario_nuevo': {'username': 'cliente1', 'email': 'cliente@example.com', 'password': 'Clave1234A'},
+            'perfil_usuario': {'nombre_apellido': 'Ana Pérez'},
+            'detalles': [{
+                'producto_atributo_id': producto_atributo.id, 'cantidad': 2,
+                'precio_unitario': '1000', 'subtotal': '2000',
+            }],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(User.objects.filter(username='cliente1').exists())
+        self.assertFalse(Venta.objects.exists())
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class AcreditarPuntosTest(TestCase):
+    """Con el club de puntos activo, un comprador sin perfil (o con varios) no rompe la compra."""
+
+    def setUp(self):
+        PuntosClub.objects.create(activo=True)
+        producto = Producto.objects.create(
+            nombre='Remera', descripcion='Algodón', precio=1000, categoria=None, puntos_club_acumulables=10,
+        )
+        self.producto_atributo = ProductoAtributo.objects.create(
+            producto=producto, atributo=Atributo.objects.create(nombre='Talle', valor='M'), stock=5,
+        )
+        self.comprador = User.objects.create_user('cliente1', 'cliente@example.com', 'x')
+
+    def registrar(self):
+        detalles = [{
+            'producto_atributo': self.producto_atributo, 'cantidad': 2,
+            'precio_unitario': Decimal('1000'), 'subtotal': Decimal('2000'),
+        }]
+        return VentaService.registrar_venta({'comprador': self.comprador, 'precio_total': Decimal('2000')}, detalles)
+
+    def test_sin_perfil_registra_la_venta(self):
+        venta = self.registrar()
+        self.assertTrue(Venta.objects.filter(id=venta.id).exists())
+        self.assertFalse(HistorialPuntos.objects.exists())
+
+    def test_con_dos_perfiles_acredita_en_el_primero(self):
+        primero = PerfilUsuario.objects.create(usuario=self.comprador)
+        PerfilUsuario.objects.create(usuario=self.comprador)
+        self.registrar()
+        primero.refresh_from_db()
+        self.assertEqual(primero.puntos_acumulados, 20)
+        self.assertEqual(HistorialPuntos.objects.get().perfil_id, primero.id)
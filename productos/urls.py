@@ -36,6 +36,7 @@ router.register(r'roles', usuarios.RolesViewSet,basename="roles")
 router.register(r'ventas', ventas.VentaViewSet,basename="ventas")
 router.register(r'estados', ventas.EstadosVentaViewSet,basename="estados_venta")
 router.register(r'carrito', ventas.CarritoViewSet, basename='carrito')
+router.register(r'carrito-invitado', ventas.CarritoInvitadoViewSet, basename='carrito_invitado')
 
 urlpatterns = [
     # Configuración
@@ -53,6 +54,7 @@ urlpatterns = [
     path('usuarios/', usuarios.listar_usuarios, name='listar_usuarios'),
     path('usuarios/<int:user_id>/', usuarios.eliminar_usuario, name='eliminar_usuario'),
     path('enviar-mail/', usuarios.EnviarEmailFormContact, name='enviar_email_contacto'),
+    path('correos/metricas/', usuarios.metricas_correos, name='metricas_correos'),
 
     # Ventas
     path('crear-venta/', ventas.crear_venta, name='crear_venta'),
@@ -60,6 +62,7 @@ urlpatterns = [
     path('webhook/', ventas.webhook_mp, name='webhook_mp'),
     path('verificar-pago/', ventas.verificar_pago, name='verificar_pago'),
     path('enviar-pdf/', ventas.enviar_pdf, name='enviar_pdf'),
+    path('tareas/<int:tarea_id>/', ventas.estado_tarea, name='estado_tarea'),
 ]
 
 urlpatterns += router.urls
\ No newline at end of file
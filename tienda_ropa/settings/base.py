@@ -20,6 +20,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_simplejwt.token_blacklist',
     'rest_framework_simplejwt',
@@ -45,6 +46,7 @@ MIDDLEWARE = [
 # Configuración de URLs y WSGI/ASGI
 ROOT_URLCONF = 'tienda_ropa.urls'
 WSGI_APPLICATION = 'tienda_ropa.wsgi.application'
+ASGI_APPLICATION = 'tienda_ropa.asgi.application'
 
 # Configuración de plantillas
 TEMPLATES = [
@@ -75,6 +77,28 @@ DATABASES = {
     }
 }
 
+# Cache compartida entre workers: Redis si hay REDIS_URL, si no un cache en disco
+# (también compartido entre procesos de la misma máquina; útil para tests y desarrollo)
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'sollu',
+            'TIMEOUT': 300,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', os.path.join(BASE_DIR, '.cache')),
+            'KEY_PREFIX': 'sollu',
+            'TIMEOUT': 300,
+        }
+    }
+
 # Configuración de autenticación y JWT
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
@@ -88,6 +112,9 @@ REST_FRAMEWORK = {
         'rest_framework.parsers.MultiPartParser',
         'rest_framework.parsers.FormParser',
     ],
+    # Paginación por cursor; cada vista define su orden estable con `cursor_ordering`
+    'DEFAULT_PAGINATION_CLASS': 'productos.api.pagination.CursorPaginacion',
+    'PAGE_SIZE': 24,
 }
 
 SIMPLE_JWT = {
@@ -133,6 +160,23 @@ AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator'},
 ]
 
+# Limitador de tasa (productos/services/limite_service.py): token bucket por grupo de rutas,
+# en el Redis de la caché o, sin REDIS_URL, en un sqlite compartido por los procesos de la máquina
+LIMITES_TASA = {
+    'login': '10/m',
+    'login_usuario': '5/m',
+    'registro': '2/m',
+    'password_reset': '5/m',
+    'verificar_codigo': '5/m',
+    'confirmar_password': '5/m',
+    'cupon': '20/m',
+    'contacto': '3/h',
+}
+LIMITES_SQLITE = os.path.join(os.getenv('CACHE_DIR', os.path.join(BASE_DIR, '.cache')), 'limites.sqlite3')
+LIMITES_MAX_CLAVES = 100000
+# De dónde sale la IP del cliente; detrás de un proxy, el header que éste pone (ver prod.py)
+LIMITES_IP_META_KEY = os.getenv('LIMITES_IP_META_KEY', 'REMOTE_ADDR')
+
 # Configuración de correo
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
@@ -141,7 +185,22 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+EMAIL_TIMEOUT = 15
+# Bandeja de salida (manage.py enviar_correos): límites de envío del proveedor
+CORREO_MAX_POR_MINUTO = int(os.getenv('CORREO_MAX_POR_MINUTO', '20'))
+CORREO_MAX_POR_DIA = int(os.getenv('CORREO_MAX_POR_DIA', '500'))
 
 # Mercado Pago
 MERCADOPAGO_PUBLIC_KEY = os.getenv('MERCADOPAGO_PUBLIC_KEY')
+PAYPAL_MODE = os.getenv('PAYPAL_MODE', 'live')
+
+# Pasarelas de pago (productos/services/pasarela_service.py)
+PASARELA_TIMEOUT_CONEXION = float(os.getenv('PASARELA_TIMEOUT_CONEXION', '3'))
+PASARELA_TIMEOUT_LECTURA = float(os.getenv('PASARELA_TIMEOUT_LECTURA', '10'))
+PASARELA_CONEXIONES = int(os.getenv('PASARELA_CONEXIONES', '10'))
+PASARELA_CIRCUITO_FALLAS = 5
+PASARELA_CIRCUITO_ENFRIAMIENTO = 30
+# Proveedor en memoria en lugar de Mercado Pago/PayPal (pruebas y benchmarks)
+PASARELA_FALSA = os.getenv('PASARELA_FALSA') == '1'
+PASARELA_FALSA_LATENCIA = float(os.getenv('PASARELA_FALSA_LATENCIA', '0'))
 
@@ -7,7 +7,8 @@ DEBUG = False
 ALLOWED_HOSTS = ['api-tiendasol.communnay.online', '147.93.36.122']
 
 # Configuración de proxy y seguridad
-RATELIMIT_IP_META_KEY = 'HTTP_X_REAL_IP'
+# gunicorn escucha en un socket unix detrás de nginx: la IP del cliente llega en X-Real-IP (limitador de tasa)
+LIMITES_IP_META_KEY = 'HTTP_X_REAL_IP'
 USE_X_FORWARDED_HOST = True
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
@@ -37,7 +38,11 @@ CORS_ALLOW_HEADERS = [
     'content-type',
     'authorization',
     'x-csrf-token',
+    'if-none-match',
+    'x-carrito-token',
 ]
+# El ETag del carrito tiene que ser legible desde el frontend para mandarlo en If-None-Match
+CORS_EXPOSE_HEADERS = ['etag']
 CORS_ALLOW_METHODS = [
     'GET',
     'POST',